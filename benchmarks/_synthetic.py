@@ -0,0 +1,230 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Helpers shared by the benchmark scripts: synthetic vesicle images and
+# settings that can be used without a running Tk application
+
+import os
+import sys
+import time
+import types
+
+import numpy as np
+
+# The DisGUVery modules import each other by name, add their folder to the path
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'disguvery')
+sys.path.insert(0, os.path.normpath(SRC_DIR))
+TESTDATA_DIR = os.path.normpath(os.path.join(SRC_DIR, '..', 'test-data'))
+
+class Setting():
+
+    # Minimal replacement of the tkinter variables used for the settings
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+def settings(**kwargs):
+
+    # Build a settings dictionary where every value can be read with .get()
+    return {k: Setting(v) for k, v in kwargs.items()}
+
+# Default settings, taken from the workflows described in test-data
+HOUGH_SETTINGS = {'hough_eth': '60', 'hough_hth': '50', 'hough_mindist': '200',
+                'hough_minrad': '10', 'hough_maxrad': '400', 'hough_downsample': '1'}
+
+def vesicle_image(size = 2048, n_vesicles = 20, rmin = 30, rmax = 200,
+                membrane_width = 2, seed = 0, dtype = 'uint16'):
+
+    """
+    Create an image with ring-shaped vesicles on a noisy background
+
+    INPUT:
+        size: int, or tuple (height, width), size of the image in pixels
+        n_vesicles: int, number of vesicles to place without overlap
+        rmin, rmax: float, range of the vesicle radii in pixels
+        membrane_width: float, standard deviation of the membrane profile
+        seed: int, seed of the random generator
+        dtype: string, type of the output image
+    OUTPUT:
+        image: numpy array, synthetic image
+        truth: numpy array, [xc, yc, r] of the placed vesicles
+    """
+
+    rng = np.random.default_rng(seed)
+    if np.isscalar(size): size = (size, size)
+    h, w = size
+
+    # Place the vesicles at random, rejecting the ones that overlap
+    truth = []
+    n_tries = 0
+    while len(truth) < n_vesicles and n_tries < 100*n_vesicles:
+        n_tries += 1
+        r = rng.uniform(rmin, min(rmax, min(h, w)/2 - 5))
+        xc = rng.uniform(r + 5, w - r - 5)
+        yc = rng.uniform(r + 5, h - r - 5)
+        if all(np.hypot(xc - x, yc - y) > r + rv + 10 for x, y, rv in truth):
+            truth.append((xc, yc, r))
+    truth = np.array(truth, dtype = float).reshape(-1, 3)
+
+    # Draw the rings on their bounding box only
+    image = np.zeros((h, w), dtype = np.float32)
+    for xc, yc, r in truth:
+        x1, x2 = int(max(0, xc - r - 6*membrane_width)), int(min(w, xc + r + 6*membrane_width + 1))
+        y1, y2 = int(max(0, yc - r - 6*membrane_width)), int(min(h, yc + r + 6*membrane_width + 1))
+        Y, X = np.ogrid[y1:y2, x1:x2]
+        dist = np.sqrt((X - xc)**2 + (Y - yc)**2)
+        ring = np.exp(-(dist - r)**2/(2*membrane_width**2))
+        image[y1:y2, x1:x2] = np.maximum(image[y1:y2, x1:x2], ring)
+
+    # Add background, signal and noise
+    image = 200 + 2000*image + rng.normal(0, 60, size = (h, w)).astype(np.float32)
+    image = np.clip(image, 0, np.iinfo(dtype).max if 'int' in dtype else None)
+
+    return image.astype(dtype), truth
+
+def multichannel_image(size = 2048, n_vesicles = 20, rmin = 30, rmax = 200,
+                membrane_width = 2, seed = 0, dtype = 'uint16'):
+
+    """
+    Create a two channel image: encapsulated content (channel 1) and membrane (channel 2)
+
+    INPUT:
+        same as vesicle_image
+    OUTPUT:
+        image: numpy array, synthetic image (height, width, 2)
+        truth: numpy array, [xc, yc, r, content] of the placed vesicles
+    """
+
+    membrane_image, truth = vesicle_image(size, n_vesicles, rmin, rmax, membrane_width, seed, dtype)
+    rng = np.random.default_rng(seed + 1)
+    h, w = membrane_image.shape
+
+    # Fill the lumen of each vesicle with a different amount of content
+    content = rng.uniform(0.1, 1, size = len(truth))
+    image = np.zeros((h, w), dtype = np.float32)
+    for (xc, yc, r), c in zip(truth, content):
+        x1, x2 = int(max(0, xc - r)), int(min(w, xc + r + 1))
+        y1, y2 = int(max(0, yc - r)), int(min(h, yc + r + 1))
+        Y, X = np.ogrid[y1:y2, x1:x2]
+        image[y1:y2, x1:x2][(X - xc)**2 + (Y - yc)**2 < r**2] = c
+
+    image = 300 + 1500*image + rng.normal(0, 60, size = (h, w)).astype(np.float32)
+    image = np.clip(image, 0, np.iinfo(dtype).max if 'int' in dtype else None).astype(dtype)
+
+    return np.dstack([image, membrane_image]), np.column_stack([truth, content])
+
+def template_image(mat_image, roi, margin = 10):
+
+    # Crop a vesicle from an image, to be used as template for the template matching
+    xc, yc, r = roi[:3]
+    x1, x2 = int(max(0, xc - r - margin)), int(xc + r + margin)
+    y1, y2 = int(max(0, yc - r - margin)), int(yc + r + margin)
+
+    return mat_image[y1:y2, x1:x2].copy()
+
+def controller():
+
+    """
+    Settings of the application without a running Tk application, with the default values
+    of DisGUVery (see disguvery.py). The stage cache is disabled, such that every stage is
+    computed when benchmarked
+
+    OUTPUT:
+        controller: object with the appdata_* attributes used by the analysis
+    """
+
+    from core.stage_cache import StageCache
+
+    controller = types.SimpleNamespace()
+    controller.appdata_channels = {'current': Setting(0), 1: Setting(''), 2: Setting(''), 3: Setting(''), 4: Setting('')}
+    controller.appdata_settingsenhance = {'method': ['Hough Detection', 'Template Matching', 'Floodfill'],
+                                        'hough': [15, 45, 'gaussian'],
+                                        'template': [15, 45, 'gaussian'],
+                                        'flood': [5, 105, 'gaussian'],
+                                        'current': ['hough', Setting('15'), Setting('45'), Setting('gaussian')],
+                                        'ch_status': [[], []]}
+    controller.appdata_settingsvesdet = {'enhancement': [Setting(False), Setting(False)], 'method': 'hough'}
+    controller.appdata_settingsvesdet.update(settings(**HOUGH_SETTINGS))
+    controller.appdata_settingsvesdet.update(settings(template_minre = '0.8', template_maxre = '1.2',
+                                                    template_nscales = '10', template_thmatch = '0.5',
+                                                    flood_th = '10', flood_minarea = '100'))
+    controller.appdata_templateimage = None
+    controller.appdata_resultsvesdet = {}
+    controller.appdata_settingsbma = {'width': Setting('15'), 'contour_position': Setting(2),
+                                    'offset': [Setting(0), Setting('10')]}
+    controller.appdata_settingsrmd = {'img_filter': Setting('6'), 'img_th': [0.05, Setting('0.1')],
+                                    'vesicle_th': Setting('0.15'), 'search_l': Setting('11'),
+                                    'search_w': Setting('4'), 'bbox_margin': Setting('20')}
+    controller.appdata_resultsmembrane = {}
+    controller.appdata_stagecache = StageCache(max_size = 0)
+    controller.appdata_settingsencap = {'flood_th': Setting('1.5'), 'flood_minarea': 25, 'bg_correction': Setting(0)}
+    controller.appdata_settingsiprofile = {'angular_profile': [Setting(1), Setting('2')],
+                                        'angular_channels': [Setting(1), Setting(0), Setting(0)],
+                                        'radial_profile': [Setting(1), Setting('2')],
+                                        'radial_channels': [Setting(1), Setting(0), Setting(0)],
+                                        'bg_corr_options': ['None', 'Image mean', 'ROI mean', 'ROI corner', 'ROI center'],
+                                        'bg_corr': [Setting('None'), Setting('None'), Setting('None')],
+                                        'int_norm': Setting(0),
+                                        'rad_norm': Setting(0)}
+    controller.appdata_settingsbatch = {'preprocess': [Setting(1), Setting(1)],
+                                    'vesdet_method': [Setting('Hough Detection'), ['Hough Detection', 'Template Matching', 'Floodfill']],
+                                    'vesdet': [Setting(1), Setting(1)],
+                                    'subpixel': Setting(0),
+                                    'membrane': [Setting(1), Setting(0)],
+                                    'intprofiles_an': [Setting(1), Setting(0), Setting(0)],
+                                    'intprofiles_rad': [Setting(1), Setting(0), Setting(0)],
+                                    'metrics_size': Setting(1),
+                                    'metrics_encap': [Setting(1), Setting(0), [Setting(1), Setting(0), Setting(0)]],
+                                    'savedir': Setting(''),
+                                    'export_format': [Setting('CSV'), ['CSV', 'npz', 'HDF5', 'Parquet']],
+                                    'results_store': Setting(0),
+                                    'checkpoint': Setting(0),
+                                    'instrumentation': Setting(0)}
+
+    return controller
+
+def match_circles(found, truth, max_dist = 10):
+
+    # Match detected circles to the ground truth, return the errors of the matched ones
+    if found is None or len(found) == 0:
+        return np.zeros((0,)), np.zeros((0,)), 0
+    dist = np.hypot(found[:,0][:,None] - truth[:,0][None,:], found[:,1][:,None] - truth[:,1][None,:])
+    best = np.argmin(dist, axis = 1)
+    matched = dist[np.arange(len(found)), best] < max_dist
+    centre_err = dist[np.arange(len(found)), best][matched]
+    radius_err = np.abs(found[matched, 2] - truth[best[matched], 2])
+
+    return centre_err, radius_err, len(np.unique(best[matched]))
+
+def timeit(func, *args, repeat = 3, **kwargs):
+
+    # Return the best time over several repetitions and the output of the last run
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        output = func(*args, **kwargs)
+        times.append(time.perf_counter() - t0)
+
+    return min(times), output
@@ -0,0 +1,83 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Compare the background estimators used for membrane enhancement with the
+# gaussian subtraction, for the filter sizes of the test-data workflows
+# (45 px for Hough and template matching, 105 px for floodfill).
+#
+# Usage: python benchmarks/bench_background.py [image size] [image.tif ...]
+#
+# For each estimator, the time of the enhancement, the relative error and the
+# correlation with the gaussian enhancement are reported. For synthetic images,
+# the number of vesicles found by the Hough detection is reported as well.
+
+import sys
+
+import numpy as np
+
+import _synthetic as syn
+
+from core.image_processing import ImageFilters
+from core.vesicle_detection import VesicleDetection
+from core.file_handling import FileImage
+
+FILTER_SIZES = [45, 105]
+
+def run(mat_image, truth = None):
+
+    smoothed_image = ImageFilters.smooth(mat_image, 15)
+
+    print(f'  {"size":>5} {"method":>11} {"time (s)":>9} {"speedup":>8} {"rel. err":>9} {"corr":>7} {"matched":>8}')
+    for filter_size in FILTER_SIZES:
+        reference = None
+        for method in ImageFilters.background_methods:
+            t, enhanced_image = syn.timeit(ImageFilters.enhance, smoothed_image, filter_size, method)
+            if reference is None:
+                reference, t_ref = enhanced_image, t
+
+            # Agreement with the gaussian enhancement
+            rel_err = np.mean(np.abs(enhanced_image - reference))/max(np.mean(reference), 1e-6)
+            corr = np.corrcoef(enhanced_image.ravel(), reference.ravel())[0, 1]
+
+            # Vesicles found on the enhanced image
+            matched = ''
+            if truth is not None:
+                circles = VesicleDetection.hough(enhanced_image, syn.settings(**syn.HOUGH_SETTINGS))
+                matched = f'{syn.match_circles(circles, truth)[2]}/{len(truth)}'
+
+            print(f'  {filter_size:>5} {method:>11} {t:>9.3f} {t_ref/t:>8.1f} {rel_err:>9.3f} {corr:>7.3f} {matched:>8}')
+
+if __name__ == '__main__':
+
+    files = [x for x in sys.argv[1:] if not x.isdigit()]
+    sizes = [int(x) for x in sys.argv[1:] if x.isdigit()] or [1024, 2048, 4096]
+
+    if files:
+        for filename in files:
+            _, _, source_image = FileImage.open(filename, verbose = False)
+            if source_image.ndim > 2:
+                source_image = source_image[:,:,0]
+            print(f'Image {filename} {source_image.shape}')
+            run(source_image)
+    else:
+        for size in sizes:
+            mat_image, truth = syn.vesicle_image(size, n_vesicles = 12, rmin = 40, rmax = size/8)
+            print(f'Synthetic image {mat_image.shape}, {len(truth)} vesicles')
+            run(mat_image, truth)
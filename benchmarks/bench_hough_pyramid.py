@@ -0,0 +1,85 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Compare full resolution Hough detection with the coarse-to-fine detection.
+# Images are enhanced with the settings of the test-data workflow (detection-cht.txt)
+#
+# Usage: python benchmarks/bench_hough_pyramid.py [image size] [image.tif ...]
+#
+# With image files, the full resolution detection is used as the reference.
+# Otherwise, synthetic images with known vesicle positions are used.
+
+import sys
+
+import numpy as np
+
+import _synthetic as syn
+
+from core.image_processing import ImageFilters
+from core.vesicle_detection import VesicleDetection
+from core.file_handling import FileImage
+
+def enhance(mat_image):
+
+    # Smoothing and enhancement as in the CHT workflow
+    smoothed_image = ImageFilters.smooth(mat_image, 15)
+    return ImageFilters.enhance(smoothed_image, 45)
+
+def run(mat_image, truth = None):
+
+    enhanced_image = enhance(mat_image)
+    results = {}
+    for downsample in [1, 2, 4]:
+        det_settings = syn.settings(**dict(syn.HOUGH_SETTINGS, hough_downsample = str(downsample)))
+        t, circles = syn.timeit(VesicleDetection.hough, enhanced_image, det_settings)
+        results[downsample] = [t, circles]
+
+    # Use the full resolution detection as reference if there is no ground truth
+    if truth is None:
+        truth = results[1][1]
+    if truth is None:
+        print('  No vesicles detected at full resolution.')
+        return
+
+    print(f'  {"level":>6} {"time (s)":>9} {"speedup":>8} {"found":>6} {"matched":>8} {"centre err":>11} {"radius err":>11}')
+    for downsample, (t, circles) in results.items():
+        centre_err, radius_err, n_matched = syn.match_circles(circles, truth)
+        n_found = 0 if circles is None else len(circles)
+        print(f'  {downsample:>5}x {t:>9.3f} {results[1][0]/t:>8.1f} {n_found:>6} {n_matched:>4}/{len(truth):<3}'
+            f' {np.mean(centre_err) if len(centre_err) else np.nan:>11.2f}'
+            f' {np.mean(radius_err) if len(radius_err) else np.nan:>11.2f}')
+
+if __name__ == '__main__':
+
+    files = [x for x in sys.argv[1:] if not x.isdigit()]
+    sizes = [int(x) for x in sys.argv[1:] if x.isdigit()] or [1024, 2048, 4096]
+
+    if files:
+        for filename in files:
+            _, _, source_image = FileImage.open(filename, verbose = False)
+            if source_image.ndim > 2:
+                source_image = source_image[:,:,0]
+            print(f'Image {filename} {source_image.shape}')
+            run(source_image)
+    else:
+        for size in sizes:
+            mat_image, truth = syn.vesicle_image(size, n_vesicles = 12, rmin = 40, rmax = size/8)
+            print(f'Synthetic image {mat_image.shape}, {len(truth)} vesicles')
+            run(mat_image, truth)
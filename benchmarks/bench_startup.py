@@ -0,0 +1,89 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Measure the import time of the application at start up (python -X importtime), before
+# the window appears. The scientific modules (OpenCV, scipy, scikit-image and the export
+# backends) are imported on first use of the panels, and must not be imported at start up.
+#
+# Usage: python benchmarks/bench_startup.py [--repeat 5] [--max-time 1.0] [--top 15]
+#
+# The import runs in a new interpreter each time and the best time is kept. The modules
+# taking most of the time are reported. The exit code is 1 if the start up takes longer
+# than --max-time seconds, or if any of the lazy modules is imported at start up.
+
+import sys
+import argparse
+import subprocess
+
+import _synthetic as syn
+
+# Modules that are only imported on first use (see disguvery/core/lazy_import.py)
+LAZY_MODULES = ['cv2', 'scipy', 'skimage', 'h5py', 'pyarrow']
+
+def import_times(module = 'disguvery'):
+
+    # Import the module in a new interpreter, return {module: [self time, cumulative time]} in
+    # seconds, in import order
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd = syn.SRC_DIR, capture_output = True, text = True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr)
+
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = [int(self_us)/1e6, int(cumulative_us)/1e6]
+
+    return times
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Start up time of DisGUVery')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'number of runs, the best one is kept')
+    parser.add_argument('--max-time', type = float, default = 1.0, help = 'maximum start up time (s)')
+    parser.add_argument('--top', type = int, default = 15, help = 'number of modules reported')
+    args = parser.parse_args()
+
+    # Keep the fastest run
+    runs = [import_times() for _ in range(max(1, args.repeat))]
+    times = min(runs, key = lambda run: run['disguvery'][1])
+    total = times['disguvery'][1]
+
+    # Modules of the application and packages (not their submodules), by cumulative time.
+    # The time of a module includes the modules it imports first
+    print(f'Start up import time: {total:.3f} s (best of {len(runs)})')
+    print(f'{"module":>32} {"cumulative (s)":>15} {"self (s)":>9}')
+    packages = [name for name in times if '.' not in name and name != 'disguvery']
+    for name in sorted(packages, key = lambda x: -times[x][1])[:args.top]:
+        print(f'{name:>32} {times[name][1]:>15.3f} {times[name][0]:>9.3f}')
+
+    # Check the lazy modules and the time
+    failed = False
+    imported = sorted(set(name.split('.')[0] for name in times) & set(LAZY_MODULES))
+    if imported:
+        print(f'Imported at start up (should be imported on first use): {", ".join(imported)}')
+        failed = True
+    if total > args.max_time:
+        print(f'Start up is slower than {args.max_time:.2f} s')
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,348 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+
+# Run the workflows scripted in test-data (detection-cht.txt, detection-ff.txt, ...)
+# headlessly, with the same settings, and track the runtime and the peak memory of
+# each core function such that performance regressions are caught.
+#
+# Usage: python benchmarks/bench_workflows.py [--workflows name ...] [--sizes 1024 2048 ...]
+#                   [--full] [--repeat 3] [--output results.json] [--compare baseline.json]
+#
+# Each workflow runs on its test image when it is found in test-data, and on synthetic
+# images of increasing size and number of vesicles (1k px/10 vesicles up to 8k px/1000
+# vesicles with --full). The first repetition traces the memory, the others are timed
+# without tracing and the best one is kept (with --repeat 1, the time includes the
+# overhead of tracing the memory). Results are written as json, and compared
+# with a previous run: the functions (and workflows) slower or using more memory than
+# the baseline by more than the threshold are reported, and the exit code is 1.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+import cv2
+
+import _synthetic as syn
+
+from core.file_handling import FileImage, FileTemplate
+from core.instrumentation import Instrumentation
+from core.pipeline import PipelineMonitor
+from ui_batchprocessing import BatchRun
+from core.membrane import RMDsegmentation
+
+# Synthetic images: size in pixels, number of vesicles
+SCALES = [(1024, 10), (2048, 100), (4096, 300), (8192, 1000)]
+# Differences below these are not reported as regressions (noise)
+MIN_TIME, MIN_MEMORY = 0.05, 5
+
+def enhancement_settings(controller, method_key):
+
+    # Enhancement settings of the detection method, as saved in the Membrane Enhancement window
+    settings_enhance = controller.appdata_settingsenhance
+    settings_enhance['current'][0] = method_key
+    settings_enhance['current'][1].set(str(settings_enhance[method_key][0]))
+    settings_enhance['current'][2].set(str(settings_enhance[method_key][1]))
+    settings_enhance['current'][3].set(settings_enhance[method_key][2])
+
+def detection_settings(controller, method, channel = 1):
+
+    # Detection settings of the workflows. Only the detection runs, the workflows add the other steps
+    method_key = {'Hough Detection': 'hough', 'Template Matching': 'template', 'Floodfill': 'flood'}[method]
+    enhancement_settings(controller, method_key)
+
+    settings_det = controller.appdata_settingsvesdet
+    settings_det['method'] = method_key
+    for k, v in syn.HOUGH_SETTINGS.items():
+        settings_det[k].set(v)
+    for k, v in {'template_minre': '0.4', 'template_maxre': '3', 'template_nscales': '25',
+                'template_thmatch': '0.4', 'flood_th': '10', 'flood_minarea': '100'}.items():
+        settings_det[k].set(v)
+
+    settings_batch = controller.appdata_settingsbatch
+    settings_batch['vesdet_method'][0].set(method)
+    settings_batch['vesdet'][0].set(channel)
+    settings_batch['membrane'][0].set(0)
+    for ch in settings_batch['intprofiles_an'] + settings_batch['intprofiles_rad']:
+        ch.set(0)
+    settings_batch['metrics_encap'][0].set(0)
+
+def bma_settings(controller, method):
+
+    # Basic membrane segmentation: width 30, contour in the middle, offset of -10 for the boxes
+    controller.appdata_settingsbma['width'].set('30')
+    controller.appdata_settingsbma['contour_position'].set(1)
+    if method == 'Floodfill':
+        controller.appdata_settingsbma['offset'][0].set(1)
+        controller.appdata_settingsbma['offset'][1].set('-10')
+    controller.appdata_settingsbatch['membrane'][0].set(1)
+
+def multichannel_settings(controller):
+
+    # Channel manager: membrane in channel 2, encapsulated content in channel 1
+    controller.appdata_channels[1].set('content')
+    controller.appdata_channels[2].set('membrane')
+
+def batch(controller, mat_image, monitor):
+
+    # Run the steps set in the batch settings, without display
+    return BatchRun.run(controller, mat_image, controller.appdata_settingsbatch, display_results = False,
+                        monitor = monitor)
+
+def membrane_enhancement(controller, mat_image, monitor):
+
+    enhancement_settings(controller, 'hough')
+    with monitor.stage('enhancement'):
+        return BatchRun.enhancement(mat_image, controller.appdata_settingsenhance, [True, True])
+
+def detection_cht(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Hough Detection')
+    return batch(controller, mat_image, monitor)
+
+def detection_ff(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Floodfill')
+    return batch(controller, mat_image, monitor)
+
+def detection_mtm(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Template Matching')
+    return batch(controller, mat_image, monitor)
+
+def bma_cht(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Hough Detection')
+    bma_settings(controller, 'Hough Detection')
+    return batch(controller, mat_image, monitor)
+
+def bma_ff(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Floodfill')
+    bma_settings(controller, 'Floodfill')
+    return batch(controller, mat_image, monitor)
+
+def rmd_cht(controller, mat_image, monitor):
+
+    # The refined membrane detection runs on the membrane enhanced image, for all the vesicles
+    detection_settings(controller, 'Hough Detection')
+    det_results = batch(controller, mat_image, monitor)[0]
+    if det_results is None:
+        return None
+    with monitor.stage('enhancement'):
+        enhanced_image = BatchRun.enhancement(mat_image, controller.appdata_settingsenhance, [True, True])
+    with monitor.stage('refined membrane'):
+        return RMDsegmentation.run(enhanced_image, det_results, controller.appdata_settingsrmd, monitor)
+
+def intprof_singlechannel(controller, mat_image, monitor):
+
+    detection_settings(controller, 'Hough Detection')
+    bma_settings(controller, 'Hough Detection')
+    settings_int = controller.appdata_settingsiprofile
+    settings_int['angular_profile'][1].set('2')
+    settings_int['radial_profile'][1].set('2')
+    controller.appdata_settingsbatch['intprofiles_an'][0].set(1)
+    controller.appdata_settingsbatch['intprofiles_rad'][0].set(1)
+    return batch(controller, mat_image, monitor)
+
+def intprof_multichannel(controller, mat_image, monitor):
+
+    multichannel_settings(controller)
+    detection_settings(controller, 'Hough Detection', channel = 2)
+    bma_settings(controller, 'Hough Detection')
+    settings_int = controller.appdata_settingsiprofile
+    settings_int['angular_profile'][1].set('5')
+    settings_int['radial_profile'][1].set('5')
+    settings_int['bg_corr'][0].set('ROI center')
+    settings_int['bg_corr'][1].set('ROI corner')
+    settings_int['int_norm'].set(1)
+    for ich in [0, 1]:
+        controller.appdata_settingsbatch['intprofiles_an'][ich].set(1)
+        controller.appdata_settingsbatch['intprofiles_rad'][ich].set(1)
+    return batch(controller, mat_image, monitor)
+
+def encapsulation_basic(controller, mat_image, monitor):
+
+    multichannel_settings(controller)
+    detection_settings(controller, 'Hough Detection', channel = 2)
+    controller.appdata_settingsencap['bg_correction'].set(2)
+    controller.appdata_settingsbatch['metrics_encap'][0].set(1)
+    controller.appdata_settingsbatch['metrics_encap'][1].set(0)
+    return batch(controller, mat_image, monitor)
+
+def encapsulation_refined(controller, mat_image, monitor):
+
+    multichannel_settings(controller)
+    detection_settings(controller, 'Floodfill', channel = 2)
+    controller.appdata_settingsencap['flood_th'].set('1')
+    controller.appdata_settingsencap['bg_correction'].set(2)
+    controller.appdata_settingsbatch['metrics_encap'][0].set(1)
+    controller.appdata_settingsbatch['metrics_encap'][1].set(1)
+    return batch(controller, mat_image, monitor)
+
+# Workflows of test-data: function, image of test-data, multichannel image
+WORKFLOWS = {'membrane-enhancement': (membrane_enhancement, 'guvs-singlechannel.tif', False),
+            'detection-cht': (detection_cht, 'guvs-singlechannel.tif', False),
+            'detection-ff': (detection_ff, 'guvs-singlechannel.tif', False),
+            'detection-mtm': (detection_mtm, 'guvs-singlechannel.tif', False),
+            'bma-cht': (bma_cht, 'guvs-singlechannel.tif', False),
+            'bma-ff': (bma_ff, 'guvs-singlechannel.tif', False),
+            'rmd-cht': (rmd_cht, 'guvs-singlechannel-2.tif', False),
+            'intprof-singlechannel': (intprof_singlechannel, 'guvs-singlechannel.tif', False),
+            'intprof-multichannel': (intprof_multichannel, 'guvs-multichannel.tif', True),
+            'encapsulation-basic': (encapsulation_basic, 'guvs-multichannel.tif', True),
+            'encapsulation-refined': (encapsulation_refined, 'guvs-multichannel.tif', True)}
+
+def images(workflow, scales):
+
+    # Images of a workflow: the test image if found, and the synthetic images
+    # Yields label, image, template image
+    _, test_image, multichannel = WORKFLOWS[workflow]
+    filename = os.path.join(syn.TESTDATA_DIR, test_image)
+    if os.path.isfile(filename):
+        _, _, mat_image = FileImage.open(filename, verbose = False)
+        template = FileTemplate.read(os.path.join(syn.TESTDATA_DIR, 'template.png'))
+        yield test_image, mat_image, template
+
+    for size, n_vesicles in scales:
+        if multichannel is True:
+            mat_image, truth = syn.multichannel_image(size, n_vesicles, rmin = 20, rmax = 80)
+            membrane_image = mat_image[:,:,1]
+        else:
+            mat_image, truth = syn.vesicle_image(size, n_vesicles, rmin = 20, rmax = 80)
+            membrane_image = mat_image
+        template = syn.template_image(membrane_image, truth[0])
+        yield f'synthetic-{size}px-{len(truth)}ves', mat_image, template
+
+def run_once(workflow, mat_image, template, trace_memory):
+
+    # Run a workflow on a new set of default settings, return the total time and the records
+    controller = syn.controller()
+    controller.appdata_templateimage = template
+    monitor = PipelineMonitor()
+    instrumentation = Instrumentation(trace_memory = trace_memory)
+    with instrumentation.recording():
+        t_start = time.perf_counter()
+        WORKFLOWS[workflow][0](controller, mat_image.copy(), monitor)
+        elapsed = time.perf_counter() - t_start
+
+    return elapsed, instrumentation.summary()
+
+def benchmark(workflow, mat_image, template, repeat = 3):
+
+    """
+    Benchmark a workflow on an image
+
+    INPUT:
+        workflow: string, name of the workflow (see WORKFLOWS)
+        mat_image: numpy array, input image
+        template: numpy array, template image for the template matching
+        repeat: int, number of runs. The first one traces the memory
+    OUTPUT:
+        result: dictionary, total time and {function: calls, time and peak memory}
+    """
+
+    elapsed, records = run_once(workflow, mat_image, template, trace_memory = True)
+    memory = {name: record[2:] for name, record in records.items()}
+    # Without tracing, the time is not affected by tracemalloc. Keep the fastest run
+    timed = [run_once(workflow, mat_image, template, trace_memory = False) for _ in range(repeat - 1)]
+    if timed:
+        elapsed, records = min(timed, key = lambda x: x[0])
+
+    functions = {}
+    for name, (calls, t, _, _) in records.items():
+        py_peak, rss_peak = memory.get(name, (0, 0))
+        functions[name] = {'calls': calls, 'time_s': round(t, 4),
+                        'peak_python_mb': round(py_peak/1024**2, 2), 'peak_rss_mb': round(rss_peak/1024**2, 2)}
+
+    return {'time_s': round(elapsed, 4), 'shape': list(mat_image.shape), 'functions': functions}
+
+def compare(results, baseline, threshold):
+
+    # Report the workflows and functions slower, or using more memory, than the baseline
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        entries = [('total', result, baseline[case])]
+        entries += [(name, f, baseline[case]['functions'][name]) for name, f in result['functions'].items()
+                    if name in baseline[case]['functions']]
+        for name, new, old in entries:
+            for key, noise in [('time_s', MIN_TIME), ('peak_python_mb', MIN_MEMORY), ('peak_rss_mb', MIN_MEMORY)]:
+                if key not in new or key not in old:
+                    continue
+                if new[key] > old[key]*(1 + threshold) and new[key] - old[key] > noise:
+                    regressions.append((case, name, key, old[key], new[key]))
+
+    if regressions:
+        print(f'{len(regressions)} regression(s) above {100*threshold:.0f}%:')
+        for case, name, key, old, new in regressions:
+            print(f'  {case:>48} {name:>24} {key:>15}: {old:>9.2f} -> {new:>9.2f}')
+    else:
+        print(f'No regressions above {100*threshold:.0f}%')
+
+    return regressions
+
+def report(case, result):
+
+    print(f'{case} {tuple(result["shape"])}: {result["time_s"]:.2f} s')
+    print(f'  {"function":>24} {"calls":>7} {"time (s)":>9} {"python (MB)":>12} {"rss (MB)":>9}')
+    for name, f in sorted(result['functions'].items(), key = lambda x: -x[1]['time_s']):
+        print(f'  {name:>24} {f["calls"]:>7} {f["time_s"]:>9.3f} {f["peak_python_mb"]:>12.1f} {f["peak_rss_mb"]:>9.1f}')
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the workflows of test-data')
+    parser.add_argument('--workflows', nargs = '+', choices = list(WORKFLOWS.keys()), default = list(WORKFLOWS.keys()))
+    parser.add_argument('--sizes', nargs = '+', type = int, default = [1024, 2048],
+                        help = 'sizes of the synthetic images, among ' + ', '.join(str(s) for s, _ in SCALES))
+    parser.add_argument('--full', action = 'store_true', help = 'run all the synthetic sizes, up to 8k px')
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--output', help = 'json file to save the results')
+    parser.add_argument('--compare', help = 'json file of a previous run, to report the regressions')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'relative increase reported as regression')
+    args = parser.parse_args()
+
+    scales = SCALES if args.full else [s for s in SCALES if s[0] in args.sizes]
+
+    results = {}
+    for workflow in args.workflows:
+        for label, mat_image, template in images(workflow, scales):
+            case = f'{workflow}@{label}'
+            results[case] = benchmark(workflow, mat_image, template, args.repeat)
+            report(case, results[case])
+
+    if args.output is not None:
+        info = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'machine': platform.platform(),
+                'processor': platform.processor(), 'python': platform.python_version(),
+                'numpy': np.__version__, 'opencv': cv2.__version__, 'repeat': args.repeat}
+        with open(args.output, 'w') as file:
+            json.dump({'info': info, 'results': results}, file, indent = 1)
+        print(f'Results saved in {args.output}')
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,41 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+"""
+Analysis functions of DisGUVery on numpy arrays, without the interface (no tkinter).
+The modules only import each other within the package, and the scientific modules are
+imported on first use (see lazy_import), such that the package can be imported in the
+workers of a multiprocessing pool or a Dask cluster.
+
+Usage:
+    from disguvery.core import io, detection, membrane, profiles, encapsulation
+    image = io.open_image('vesicles.tif')
+    det_results = detection.hough(image[:,:,0], min_radius = 20)
+    rois_membrane = membrane.basic_membrane(det_results, width = 10)
+    angular = profiles.angular_profiles(image, rois_membrane, channels = [1, 2], membrane_channels = [1])
+    mask_labels = encapsulation.encapsulation_mask(image[:,:,0], det_results)
+    encap_results = encapsulation.encapsulation(image, mask_labels, channels = [2])
+
+From the disguvery folder (as the interface does), the package is imported as core.
+"""
+
+from . import io, detection, membrane, profiles, encapsulation
+
+__all__ = ['io', 'detection', 'membrane', 'profiles', 'encapsulation']
@@ -19,7 +19,13 @@
 ###############################################################################
 
 import numpy as np
-from scipy.optimize import curve_fit
+
+from .pipeline import PipelineMonitor
+from .lazy_import import LazyModule
+from .instrumentation import instrumented
+
+# scipy is imported on first use (see lazy_import)
+optimize = LazyModule('scipy.optimize')
 
 class FitData():
 
@@ -32,7 +38,7 @@ class FitData():
         p0 = [max_data, mean_data, std_data]
 
         # Find parameters fit
-        popt, pcov = curve_fit(FitFunctions.gauss_1d, x, y, p0)
+        popt, pcov = optimize.curve_fit(FitFunctions.gauss_1d, x, y, p0)
         # Reconstruct fit with parameters
         f = FitFunctions.gauss_1d(x, popt[0], popt[1], popt[2])
         # Reconstruct curve with 10x more points
@@ -99,9 +105,141 @@ class GeoMat():
 
         return mask_labels.transpose()
 
+class RoiIndex():
+
+    """
+    Uniform grid index over the ROIs of the detected objects, to find the objects at a point,
+    the neighbours of a point and the objects in a region without testing all of them. Each
+    ROI is listed in the cells of the grid covered by its extent, and the cells of a row are
+    contiguous, such that a query only gathers a few slices of the index.
+
+    Usage:
+        index = RoiIndex(det_results['rois'], 'circle')
+        index.at(x, y)                      # objects containing the point, closest first
+        index.within(x, y, d)               # objects with center closer than d, closest first
+        index.in_box(x0, x1, y0, y1)        # objects overlapping the box
+    """
+
+    def __init__(self, rois, object_type = 'circle', cell_size = None):
+
+        """
+        INPUT:
+            rois: numpy array, [xc, yc, s, ...] of each object. s is the radius of circles,
+                the size of boxes, and it's not used for other objects (points)
+            object_type: string, 'circle', 'box', or any other type for points
+            cell_size: float, size of the cells of the grid. Default, from the size and the
+                density of the objects
+        """
+
+        rois = np.asarray(rois, dtype = float)
+        self.rois = rois.reshape(len(rois), -1) if rois.size > 0 else np.zeros((0, 3))
+        self.object_type = object_type
+
+        # Extent of each object [xmin, xmax, ymin, ymax]
+        if object_type == 'circle': half_size = self.rois[:,2]
+        elif object_type == 'box': half_size = self.rois[:,2]/2
+        else: half_size = np.zeros(len(self.rois))
+        x, y = self.rois[:,0], self.rois[:,1]
+        self.extents = np.column_stack([x - half_size, x + half_size, y - half_size, y + half_size])
+
+        n_rois = len(self.rois)
+        if n_rois == 0:
+            self.origin, self.cell_size, self.grid_shape = np.zeros(2), 1, (1, 1)
+            self.cell_rois, self.cell_start = np.zeros(0, dtype = int), np.zeros(2, dtype = int)
+            self.single_cell = True
+            return
+
+        # Grid over the extent of all the objects. Cells are about the size of the objects,
+        # with at most a few cells per object
+        self.origin = np.array([self.extents[:,0].min(), self.extents[:,2].min()])
+        span = np.array([self.extents[:,1].max(), self.extents[:,3].max()]) - self.origin
+        if cell_size is None:
+            cell_size = max(2*np.median(half_size), np.sqrt(max(span[0]*span[1], 1)/n_rois), 1)
+        cell_size = max(cell_size, np.sqrt(max(span[0]*span[1], 1)/(4*n_rois)))
+        self.cell_size = float(cell_size)
+        nx, ny = (span//self.cell_size).astype(int) + 1
+        self.grid_shape = (ny, nx)
+
+        # Cells covered by each object, listed object by object
+        cx0, cx1 = self.cell_coords(self.extents[:,0], 0), self.cell_coords(self.extents[:,1], 0)
+        cy0, cy1 = self.cell_coords(self.extents[:,2], 1), self.cell_coords(self.extents[:,3], 1)
+        n_cols, n_cells = cx1 - cx0 + 1, (cx1 - cx0 + 1)*(cy1 - cy0 + 1)
+        roi_ids = np.repeat(np.arange(n_rois), n_cells)
+        k = np.arange(len(roi_ids)) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        cells = (np.repeat(cy0, n_cells) + k//np.repeat(n_cols, n_cells))*nx + np.repeat(cx0, n_cells) + k % np.repeat(n_cols, n_cells)
+
+        # Objects sorted by cell, and start of each cell in the list. Objects listed in a
+        # single cell are found only once by the queries
+        self.single_cell = bool(np.all(n_cells == 1))
+        order = np.argsort(cells, kind = 'stable')
+        self.cell_rois = roi_ids[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(nx*ny + 1))
+
+    def __len__(self):
+        return len(self.rois)
+
+    def cell_coords(self, values, axis):
+
+        # Cell of each coordinate along an axis (0: x, 1: y), clipped to the grid
+        cells = np.floor((np.asarray(values, dtype = float) - self.origin[axis])/self.cell_size).astype(int)
+
+        return np.clip(cells, 0, self.grid_shape[1 - axis] - 1)
+
+    def candidates(self, x0, x1, y0, y1):
+
+        # Objects listed in the cells covered by the box (a superset of the objects overlapping it)
+        if len(self.rois) == 0 or x1 < self.origin[0] or y1 < self.origin[1]:
+            return np.zeros(0, dtype = int)
+        cx0, cx1 = self.cell_coords([x0, x1], 0)
+        cy0, cy1 = self.cell_coords([y0, y1], 1)
+        nx = self.grid_shape[1]
+        slices = [self.cell_rois[self.cell_start[cy*nx + cx0]:self.cell_start[cy*nx + cx1 + 1]] for cy in range(cy0, cy1 + 1)]
+
+        candidates = np.concatenate(slices)
+
+        return np.sort(candidates) if self.single_cell else np.unique(candidates)
+
+    def in_box(self, x0, x1, y0, y1):
+
+        # Objects whose extent overlaps the box [x0, x1] x [y0, y1]
+        ind = self.candidates(x0, x1, y0, y1)
+        extents = self.extents[ind]
+        overlap = (extents[:,1] >= x0) & (extents[:,0] <= x1) & (extents[:,3] >= y0) & (extents[:,2] <= y1)
+
+        return ind[overlap]
+
+    def within(self, x, y, d):
+
+        # Objects with center closer than d to the point, closest first
+        ind = self.candidates(x - d, x + d, y - d, y + d)
+        dist = np.hypot(self.rois[ind,0] - x, self.rois[ind,1] - y)
+        order = np.argsort(dist[dist <= d], kind = 'stable')
+
+        return ind[dist <= d][order]
+
+    def at(self, x, y):
+
+        # Objects containing the point, closest first. Points don't contain anything
+        ind = self.candidates(x, x, y, y)
+        dx, dy = self.rois[ind,0] - x, self.rois[ind,1] - y
+        dist = np.hypot(dx, dy)
+        if self.object_type == 'circle':
+            inside = dist <= self.rois[ind,2]
+        elif self.object_type == 'box':
+            inside = (np.abs(dx) <= self.rois[ind,2]/2) & (np.abs(dy) <= self.rois[ind,2]/2)
+        else:
+            inside = np.zeros(len(ind), dtype = bool)
+        order = np.argsort(dist[inside], kind = 'stable')
+
+        return ind[inside][order]
+
 class ProfileIntegration():
 
-    def radial(signal_matrix, center, dr = 1, norm = False):
+    @instrumented('radial integration')
+    def radial(signal_matrix, center, dr = 1, norm = False, monitor = None):
+
+        if monitor is None:
+            monitor = PipelineMonitor()
 
         coord_matrix = GeoMat.coordinates(signal_matrix.shape[0], signal_matrix.shape[1])
         rad_mat = GeoMat.dist_radial(coord_matrix, center)
@@ -120,6 +258,7 @@ class ProfileIntegration():
 
         # Loop over the radius and integrate the signal
         for i_radius in range(1, len(d_radius)):
+            monitor.check()
             slice_radius = 0*signal_matrix
             slice_radius[(rad_mat >= d_radius[i_radius -1]) & (rad_mat < d_radius[i_radius])] = 1
             # Get signal over slice
@@ -143,7 +282,11 @@ class ProfileIntegration():
         
         return all_signals, found_error
 
-    def angular(signal_matrix, center, dt = 1, rlim = None, norm = None):
+    @instrumented('angular integration')
+    def angular(signal_matrix, center, dt = 1, rlim = None, norm = None, monitor = None):
+
+        if monitor is None:
+            monitor = PipelineMonitor()
 
         # Build angular matrix
         coord_matrix = GeoMat.coordinates(signal_matrix.shape[0], signal_matrix.shape[1])
@@ -179,6 +322,7 @@ class ProfileIntegration():
         found_error = False
         # Iterate over theta and integrate the signal
         for i_theta in range(1, len(d_theta)):
+            monitor.check()
             slice_theta = 0*signal_matrix
             roi_slice = []
             try:
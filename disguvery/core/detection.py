@@ -0,0 +1,136 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Vesicle detection on numpy arrays, without the interface. The settings are the same as the ones
+# of the vesicle detection panel, given as plain values.
+
+import numpy as np
+
+from .image_processing import ImageFilters
+from .vesicle_detection import VesicleDetection
+from .pipeline import plain_settings
+
+def enhance(mat_image, smooth_size = None, enhance_size = None, enhance_method = 'gaussian', buffers = None):
+
+    """
+    Smooth and enhance an image before the detection
+
+    INPUT:
+        mat_image: numpy array, image (single or multi-channel)
+        smooth_size: int, size of the smoothing filter, None to skip the smoothing
+        enhance_size: int, size of the background filter, None to skip the enhancement
+        enhance_method: string, background estimator ('gaussian', 'box', 'downsample' or 'tophat',
+                        see ImageFilters.background)
+        buffers: dictionary, arrays reused between images, None to allocate new ones
+    OUTPUT:
+        enhanced_image: numpy array, float32 image
+    """
+
+    # Filter sizes must be odd
+    if smooth_size is not None:
+        smooth_size = ImageFilters.check_filtersize(int(smooth_size))
+    if enhance_size is not None:
+        enhance_size = ImageFilters.check_filtersize(int(enhance_size))
+
+    return ImageFilters.preprocess(mat_image, smooth_size, enhance_size, buffers, enhance_method = enhance_method)
+
+def detect(mat_image, det_method, det_settings, template_image = None, monitor = None):
+
+    """
+    Detect the vesicles with the given method and settings
+
+    INPUT:
+        mat_image: numpy array, single channel image
+        det_method: string, 'hough', 'template' or 'floodfill' (only the first word is used)
+        det_settings: dictionary, vesicle detection settings (anything with a .get() method)
+        template_image: numpy array, template image, only for template matching
+        monitor: PipelineMonitor, progress and cancellation (optional)
+    OUTPUT:
+        det_results: dictionary, vesicle detection results, None if no vesicles are found
+    """
+
+    det_method = det_method.lower()
+    # Initialise mask_regions variable, used only in floodfill
+    mask_regions = None
+    if 'hough' in det_method:
+        # Run hough detection
+        det_vesicles = VesicleDetection.hough(mat_image, det_settings, monitor)
+    elif 'template' in det_method:
+        # Run Template Matching. There needs to be a template image!
+        if template_image is None:
+            print('ERROR: no template image found, set or load a template first!')
+            det_vesicles = None
+        else:
+            det_vesicles = VesicleDetection.template(mat_image, template_image, det_settings, monitor)
+    else:
+        # Run Floodfill detection
+        det_vesicles, mask_regions = VesicleDetection.floodfill(mat_image, det_settings, monitor)
+
+    if det_vesicles is not None:
+        # Format results accordingly
+        det_results = VesicleDetection.save_results(det_vesicles, det_method.split()[0], mask_regions)
+    else:
+        print('No vesicles were detected with current method and settings')
+        det_results = None
+
+    return det_results
+
+def hough(mat_image, edge_threshold = 60, hough_threshold = 50, min_distance = 200, min_radius = 10,
+        max_radius = 400, downsample = 1, monitor = None):
+
+    # Hough circle detection. The sizes are in pixels, downsample > 1 runs the detection on a pyramid level
+    det_settings = plain_settings(hough_eth = edge_threshold, hough_hth = hough_threshold,
+                                hough_mindist = min_distance, hough_minrad = min_radius,
+                                hough_maxrad = max_radius, hough_downsample = downsample)
+    return detect(mat_image, 'hough', det_settings, monitor = monitor)
+
+def template(mat_image, template_image, min_resize = 0.8, max_resize = 1.2, number_scales = 10,
+            threshold = 0.5, monitor = None):
+
+    # Template matching, with the template resized between min_resize and max_resize
+    det_settings = plain_settings(template_minre = min_resize, template_maxre = max_resize,
+                                template_nscales = number_scales, template_thmatch = threshold)
+    return detect(mat_image, 'template', det_settings, template_image, monitor)
+
+def floodfill(mat_image, threshold = 10, min_area = 100, monitor = None):
+
+    # Floodfill detection of the regions above threshold, and larger than min_area
+    det_settings = plain_settings(flood_th = threshold, flood_minarea = min_area)
+    return detect(mat_image, 'floodfill', det_settings, monitor = monitor)
+
+def refine(mat_image, det_results):
+
+    # Fit the membrane around each detected vesicle. The results are returned in a new
+    # dictionary, the detection results given are not changed
+    det_method = det_results['method']
+    refined = VesicleDetection.refine_subpixel(mat_image, det_results['rois'], det_method)
+
+    # Keep the size definition of each method: radius for hough, size for the others
+    rois = np.array(det_results['rois'], dtype = float)
+    rois[:,:2] = refined[:,:2]
+    if det_method == 'hough':
+        rois[:,2] = refined[:,2]
+    else:
+        rois[:,2] = 2*refined[:,2]
+    refined_results = dict(det_results)
+    refined_results['rois'] = rois
+    refined_results['ellipticity'] = refined[:,3]
+
+    return refined_results
@@ -0,0 +1,165 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+# 
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with 
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+
+from .data_processing import GeoMat
+from .image_processing import ImageCheck, ImageCorrection, ImageMask
+from .pipeline import PipelineMonitor
+from .instrumentation import instrumented
+
+class EncapEfficiency():
+
+    @instrumented('encapsulation mask')
+    def mask_refined(input_image, rois, flood_th, flood_minarea):
+
+        # Build mask of refined floodfill results
+        mask_all = 0*input_image
+
+        for i, vesicle in enumerate(rois):
+            [xc, yc, r] = vesicle[:3]
+            x1, x2 = int(xc - r), int(xc + r)
+            y1, y2 = int(yc - r), int(yc + r)
+
+            # Correct the limits of the bounding box if necessary
+            if x1 < 0: x1 = 0
+            if y1 < 0: y1 = 0
+            if x2 > input_image.shape[1]: x2 = input_image.shape[1]
+            if y2 > input_image.shape[0]: y2 = input_image.shape[0]
+
+            image_th = ImageMask.threshold(input_image[y1:y2, x1:x2], flood_th)
+            min_area = 0.01*flood_minarea*(image_th.shape[0])
+            mask_flood = ImageMask.floodfill(image_th, min_area, method = 'inside')
+            mask_all[y1:y2, x1:x2]= (mask_flood != 0).astype(int)*(i+1)
+          
+
+        return mask_all
+
+    @instrumented('encapsulation efficiency')
+    def run(mat_image, mask_labels, bg_corr, return_fordisplay = False):
+
+        roi_labels = np.unique(mask_labels)
+        results_encap = np.zeros_like(roi_labels)
+        roi_area = np.zeros_like(roi_labels)
+
+        # Correct background if required
+        
+        if  bg_corr == 1:
+            bg_corr_type = 'mean'
+            bg_int = ImageCorrection.substract_background(mat_image.astype('float16'), bg_corr_type, inplace = False)
+        elif bg_corr == 2:
+            bg_corr_type = 'ROI corner'
+        else:
+            bg_corr_type = None
+            bg_int = 0
+
+        xall = np.zeros(len(results_encap))
+        yall = np.zeros(len(results_encap))
+
+        for id_roi in roi_labels:
+            mask_roi = 0*mask_labels
+            mask_roi[mask_labels == id_roi] = 1
+            roi_int = mat_image*mask_roi
+            mean_roi_int = np.mean(roi_int[roi_int>0].flatten())
+
+            # If required, correct the ROI corner background
+            if bg_corr_type == 'ROI corner':
+                xmin, ymin = np.min(np.where(mask_roi)[1]), np.min(np.where(mask_roi)[0])
+                xmax, ymax = np.max(np.where(mask_roi)[1]), np.max(np.where(mask_roi)[0])
+                roi_img = mat_image[ymin:ymax, xmin:xmax]
+                bg_int = ImageCorrection.substract_background(roi_img.astype('float16'), bg_corr_type, inplace = False)
+
+            try:
+                xall[id_roi] =  np.mean(np.where(mask_roi)[1])
+            except IndexError:
+                pass
+            else:
+                yall[id_roi] = np.mean(np.where(mask_roi)[0])
+
+                results_encap[id_roi] = mean_roi_int - bg_int
+                roi_area[id_roi] = np.sum(mask_roi)
+
+        results_encap_all = np.stack((roi_labels, xall,yall, results_encap , roi_area), axis = 1)
+    
+        if return_fordisplay is True:
+            results_display = np.stack((xall[1:], yall[1:], results_encap[1:]), axis = 1)
+        else:
+            results_display = None
+
+        return results_encap_all, results_display
+
+def encapsulation_mask(mat_image, det_results, mask_source = 'detection', flood_th = 1.5, flood_minarea = 25):
+
+    """
+    Labels mask of the vesicles for the encapsulation efficiency
+
+    INPUT:
+        mat_image: numpy array, single channel image (membrane channel for the refined mask)
+        det_results: dictionary, vesicle detection results
+        mask_source: string, 'detection' (regions of the detected vesicles) or 'refined' (floodfill of each vesicle)
+        flood_th: float, threshold of the refined floodfill
+        flood_minarea: float, minimum area of the refined regions (% of the vesicle size)
+    OUTPUT:
+        mask_labels: numpy array, label of the vesicle of each pixel (0 for the background)
+    """
+
+    if mask_source == 'detection':
+        if det_results['method'] == 'hough': half_r = False
+        else: half_r = True
+        try:
+            mask_all = det_results['mask_rois']
+        except KeyError:
+            mask_all = GeoMat.mask_contours(det_results['rois'], mat_image.shape[0:2], half_r)
+    else:
+        mask_all = EncapEfficiency.mask_refined(mat_image, det_results['rois'], float(flood_th), flood_minarea)
+
+    mask_labels = mask_all.astype(int)
+
+    return mask_labels
+
+def encapsulation(input_image, mask_labels, channels = [1], bg_corr = 0, monitor = None):
+
+    """
+    Encapsulation efficiency of each vesicle, for each channel
+
+    INPUT:
+        input_image: numpy array, image (single or multi-channel)
+        mask_labels: numpy array, labels mask of the vesicles (see encapsulation_mask)
+        channels: list, channels to measure (starting at 1)
+        bg_corr: int, background correction (0: none, 1: image mean, 2: ROI corner)
+        monitor: PipelineMonitor, progress and cancellation (optional)
+    OUTPUT:
+        encap_results: dictionary, {'ch n': [results, masked image]}, results as [label, x, y, intensity, area]
+    """
+
+    # Compute the encapsulation efficiency for each selected channel
+    if monitor is None:
+        monitor = PipelineMonitor()
+    # Initialise variable to store results
+    encap_results = {}
+    with monitor.stage('encapsulation channels', total = len(channels)):
+        for ich in channels:
+            mat_image = ImageCheck.single_channel(input_image, ich)
+            encap_results_ch, _ = EncapEfficiency.run(mat_image, mask_labels, bg_corr)
+            masked_image = mat_image*(mask_labels >0).astype(int)
+            encap_results[f'ch {ich}'] = [encap_results_ch, masked_image]
+            monitor.advance()
+
+    return encap_results
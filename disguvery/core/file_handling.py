@@ -0,0 +1,689 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+# 
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with 
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+from PIL import Image, ImageSequence
+import numpy as np
+
+from .lazy_import import optional_module
+
+# Optional backends for the columnar export of the results, imported on first use (None if not installed)
+h5py = optional_module('h5py')
+pyarrow = optional_module('pyarrow', submodules = ['pyarrow.parquet'])
+
+class FileImage():
+
+    def open(filename, verbose = True):
+
+        # We don't care if the image has already been opened or not
+        # We read the image and overwrite the info associated to it
+
+        # check if the image is supported and read it
+        source_image = FileImage.read_supported(filename)
+        image_info = None
+        image_name = None
+
+        if source_image is not None:
+            if verbose is True:
+                # Print a message for successfull loading
+                print(f'Image sucessfully loaded as {source_image.dtype.name}')
+
+            # get image and file information
+            image_info, image_name= FileImage.get_info(filename, source_image, verbose)
+
+        return image_info, image_name, source_image
+
+    def read_supported(filename):
+
+        # Supported image formats
+        supported_format = ['L', 'P', 'RGB', 'I', 'F', 'I;16B', 'I;16L', 'I;16N', 'I;16']
+        source_image = None
+        # Read the image object
+        try:
+            img = Image.open(filename)
+        except:
+            print('Image type cannot be identified. Please choose another type.')
+        else:
+            # Get the image type and if nor supported, raise an error message.
+            if img.mode not in supported_format:
+                print(f'ERROR: Image type {img.mode} not supported.')
+            else:
+                # Load all the frames in an image
+                # ATTENTION: for now this is handled only as multiple channels
+                # THIS NEEDS TO BE CHANGED WHEN DEALING WHEN SEQUENCES
+
+                # Frames will be loaded into an empty list first
+                all_frames = []
+                # Load all frames in the image
+                ic = 0
+                for frame in ImageSequence.Iterator(img):
+                    ic += 1
+                    all_frames.append(np.array(frame))
+                # Close the image file
+                img.close()
+                # Convert list to numpy array
+                all_frames = np.array(all_frames)
+
+                # Assign value as source_image, if image has been loaded
+                # with the multiple frames of the iterator, transpose.
+                if ic == 1:
+                    source_image = np.array(all_frames)[0]
+                else:
+                    # Get axis from frame, and build tuple for transpose
+                    axis_frame = [x for x in range(1, len(all_frames.shape))]
+                    axis_frame.insert(2,0)
+                    source_image = 1*np.transpose(all_frames, tuple(axis_frame))
+                
+                    # If image is [NxMxCxS], take only [NxMxC]
+                    source_image = source_image[:,:,:]
+
+        return source_image
+
+    def get_info(filename, source_image, verbose = True):
+
+        # Initialise dictionary
+        image_info = {}
+        
+        # Get file information from the filename
+        file_only = filename.split('/')[-1]
+        image_name = file_only.split('.')[0]
+
+        image_info['directory'] = '/'.join(filename.split('/')[:-1])
+        image_info['extension'] = file_only.split('.')[1]
+
+        # get the image information
+        image_info['size_x'] = source_image.shape[0]
+        image_info['size y'] = source_image.shape[1]
+        
+        # if there's more than one channel, get the info
+        try:
+            nchannels = source_image.shape[2]
+        except IndexError:
+            nchannels = 1
+        finally:
+            image_info['channels'] = nchannels
+            if verbose is True:
+                print(f'There are {nchannels} channels identified')
+
+        return image_info, image_name
+
+class FileTemplate():
+
+    def read(filename):
+        
+        # Supported image formats
+        supported_format = ['L', 'P', 'RGB', 'I', 'F', 'I;16B','I;16L','I;16N','I;16']
+        # Read the image object
+        img = Image.open(filename)
+
+        # Get the image type, and if not supported, raise an error message
+        if img.mode not in supported_format:
+            print(f'ERROR: Image type {img.mode} not supported')
+        else:
+            # Flag the single-channel read
+            print('Template is loaded as a single-channel image.', end= ' ')
+            try:
+                template_image = np.array(img)[:,:,0]      
+            except IndexError:
+                template_image = np.array(img)[:,:]
+            finally:
+                # print a message for successfull loading
+                print(f'Template successfuly loaded as {template_image.dtype.name}')
+
+            return template_image
+
+    def save(filename, template_image):
+
+        # Add the extension depending on whether the filename already includes it
+        if len(filename.split('.')) == 1:
+            filesave = '.'.join([filename, 'tiff'])
+        else:
+            filesave = filename
+
+        # Get the image from the array containing the template
+        save_image = Image.fromarray(template_image)
+        # Save the image as the filesave, with TIFF format
+        save_image.save(filesave, format = 'TIFF')
+        print(f'Template image saved in {filesave}')
+        
+class FileExport():
+
+    def vesicle_detection(filename, detection_results):
+
+        # Get detection method and detected vesicles
+        det_method = detection_results['method']
+        det_vesicles = detection_results['rois']
+        id_vesicles = detection_results['id_vesicle']
+        
+        # Header for hough detection and template matching
+        header_file = {'hough': 'id_vesicle, xc (pix), yc (pix), radius (pix)',
+                'template': 'id_vesicle, xc (pix), yc (pix), size (pix), matching score',
+                'floodfill': 'id_vesicle, xc (pix), yc (pix), axis major length (pix)'}
+        # 
+        if det_method in ['hough', 'floodfill'] : n_columns = 4
+        elif det_method == 'template': n_columns = 5
+        header_det = header_file[det_method]
+        fmt_det = '%i,' + '%.1f,'*(n_columns-1)
+
+        # Add the ellipticity if the vesicles have been refined
+        ellipticity = detection_results.get('ellipticity', None)
+        if ellipticity is not None:
+            n_columns += 1
+            header_det = header_det + ', ellipticity'
+            fmt_det = fmt_det + '%.3f,'
+
+        write_results = np.zeros((det_vesicles.shape[0], n_columns))
+        write_results[:,1:det_vesicles.shape[1]+1] = det_vesicles
+        if ellipticity is not None:
+            write_results[:,-1] = ellipticity
+
+        write_results[:,0] = id_vesicles
+        np.savetxt(filename, write_results, header = header_det, delimiter = ',', 
+                    fmt = fmt_det)
+
+        # For floodfill results we also need to export the individual regions
+        FileExport.regions_mask(filename, detection_results)
+
+    def regions_mask(filename, detection_results, mask_format = 'tiff'):
+
+        # We export here only a mask with the labels of each region -> 0 is for background
+        try: 
+            mask_rois = detection_results['mask_rois']
+        except KeyError:
+            pass
+        else:
+            if mask_format == 'rle':
+                # Save the labels run-length encoded, each region can be read on its own (see LabelMask)
+                filemask = filename.replace('.csv', '_mask.npz')
+                LabelMask.save(filemask, mask_rois)
+            else:
+                # Save the mask as a compressed tiff image, with a type that can hold all the labels
+                filemask = filename.replace('.csv', '_mask.tiff')
+                FileExport.save_tiff(filemask, mask_rois)
+            print(f'Regions mask saved in {filemask}')
+
+    def compact_type(mat_image):
+
+        # Smallest type supported by the tiff images that keeps all the values of the image
+        if (mat_image.dtype == bool) or np.issubdtype(mat_image.dtype, np.integer):
+            min_value = int(mat_image.min()) if mat_image.size > 0 else 0
+            max_value = int(mat_image.max()) if mat_image.size > 0 else 0
+            if min_value >= 0 and max_value <= np.iinfo(np.uint8).max: return np.uint8
+            if min_value >= 0 and max_value <= np.iinfo(np.uint16).max: return np.uint16
+            return np.int32
+
+        return np.float32
+
+    def save_tiff(filename, mat_image):
+
+        # Save the image with deflate compression. Masks are mostly background, and compress very well
+        image_tosave = Image.fromarray(mat_image.astype(FileExport.compact_type(mat_image), copy = False))
+        image_tosave.save(filename, compression = 'tiff_adobe_deflate')
+
+    def intensity_profiles(filename, profiles_results):
+
+        # The profiles are streamed to the files, vesicle by vesicle and channel by channel
+        with ProfileWriter(filename) as writer:
+            writer.append(profiles_results)
+
+    def encapsulation_results(filename, encap_results, mask_matrix):
+
+        # Header for the encapsulation results
+        header_file = 'ROI, xc (pix), yc (pix), <I> roi (a.u.), A roi (pix^2)'
+        
+        np.savetxt(filename + '.csv', encap_results, header = header_file, delimiter = ',', 
+                            fmt = '%i, '*3 + '%.2f, '*2)
+        
+        # Export also the masked image
+        FileExport.encapsulation_mask(filename, mask_matrix)
+        
+        print(f'Encapsulation results saved in {filename}')
+
+    def encapsulation_mask(filename, mask_matrix):
+
+        # Export the masked image as a compressed tiff image. This is for keeping a small size
+        FileExport.save_tiff(filename + '.tiff', mask_matrix)
+
+class ProfileWriter():
+
+    """
+    Streaming writer for the intensity profiles. Each block of rows (one vesicle, one channel)
+    is written to the file as soon as it is appended, so that the cost of the export is linear
+    in the number of rows and the results do not need to be kept in memory. The files are
+    created when the first block is written, and the header is only written once.
+
+    Usage:
+        with ProfileWriter(filename) as writer:
+            writer.append(profiles_results)
+    """
+
+    # For radial profiles, per vesicle, per channel, we have a matrix: [mean r, mean int, min, max, sum]
+    header_main_rad = '# Ves ID, Channel, Mean radius (pix), Mean Intensity (a.u.), Min. Intensity, Max. Intensity, Sum Intensity \n'
+    # For angular profiles, per vesicle, per channel, we have two matrices. The first one is like the radial profiles
+    # except for mean radius, is mean theta
+    header_main_theta = header_main_rad.replace('radius (pix)', 'theta (deg)')
+    header_sec_theta = 'Ves ID, Theta (deg), ri (pix), ro (pix)'
+    fmt_main = '%i, %i, ' + '%.2f, '*5
+    fmt_sec = '%i, ' +  '%.2f, '*3
+
+    def __init__(self, filename):
+
+        # Write the results for the main matrix, in two different files
+        filename_rad = filename.replace('.csv', '_radial_profiles.csv')
+        filename_angular = filename.replace('.csv', '_angular_profiles.csv')
+        filename_angularsec = filename_angular.replace('profiles', 'radius')
+
+        # Filename, header, format and message of each output
+        self.outputs = {'radial': [filename_rad, self.header_main_rad, self.fmt_main, 'Radial intensity profiles'],
+                        'angular': [filename_angular, self.header_main_theta, self.fmt_main, 'Angular intensity profiles'],
+                        'contours': [filename_angularsec, self.header_sec_theta, self.fmt_sec, 'Angular contours']}
+        # Open files, in the order they have been created
+        self.files = {}
+
+    def write_block(self, output, block):
+
+        # Open the file and write the header with the first block
+        if output not in self.files:
+            filename, header, _, _ = self.outputs[output]
+            self.files[output] = open(filename, 'w')
+        else:
+            header = ''
+        np.savetxt(self.files[output], block, header = header, delimiter = ',', fmt = self.outputs[output][2])
+
+    def blocks(profiles_results):
+
+        # Generator of the blocks of rows of the profiles, as (output, block) for each vesicle and channel
+        # Check which vesicles have radial profiles in them, and which have angular profiles
+        ves_rad = [x for x,y in profiles_results.items() if y['radial'] is not None]
+        ves_angular = [x for x,y in profiles_results.items() if y['angular'] is not None]
+
+        # Radial profiles, if found
+        for ives in ves_rad:
+            nves = int(ives.split(' ')[-1])
+            results_ves = profiles_results[ives]['radial']
+            for ich, results_ch in results_ves.items():
+                nch = int(ich.split(' ')[-1])
+                block = np.empty((results_ch.shape[0], 2 + results_ch.shape[1]))
+                block[:,0], block[:,1], block[:,2:] = nves, nch, results_ch
+                yield 'radial', block
+
+        # Angular profiles, if found
+        for ives in ves_angular:
+            nves = int(ives.split(' ')[-1])
+            results_ves = profiles_results[ives]['angular']
+            for ich, results_ch in results_ves.items():
+                if results_ch is None:
+                    continue
+                if 'ch' in ich:
+                    nch = int(ich.split(' ')[-1])
+                    block = np.empty((results_ch.shape[0], 2 + results_ch.shape[1]))
+                    block[:,0], block[:,1], block[:,2:] = nves, nch, results_ch
+                    yield 'angular', block
+                    # Keep the angles of the channel for the contours (as integers, as in the exported files)
+                    theta_vec = results_ch[:,0].astype(int)
+                else:
+                    block = np.empty((results_ch.shape[0], 2 + results_ch.shape[1]))
+                    block[:,0], block[:,1], block[:,2:] = nves, theta_vec, results_ch
+                    yield 'contours', block
+
+    def append(self, profiles_results):
+
+        # Write the profiles, block by block
+        for output, block in ProfileWriter.blocks(profiles_results):
+            self.write_block(output, block)
+
+    def close(self):
+
+        # Close the files and notify the user
+        for output, file in self.files.items():
+            file.close()
+            print(f'{self.outputs[output][3]} saved in {self.outputs[output][0]}')
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ColumnarExport():
+
+    """
+    Columnar export of the results of a batch run. There is one table per result type
+    (images, vesicles, radial and angular profiles, contours and encapsulation), and
+    each table is a set of columns keyed by image, vesicle and channel identifiers.
+    The results of each image are appended to the tables as they are computed.
+
+    Formats:
+        'npz': one compressed numpy archive, with one array per 'table/column'.
+                The tables are kept in memory and written when the export is closed.
+        'hdf5': one HDF5 file, with one group per table and one chunked, compressed
+                dataset per column (requires h5py)
+        'parquet': one Parquet file per table, written by row groups with zstd
+                compression (requires pyarrow)
+
+    Usage:
+        with ColumnarExport(filename, 'hdf5') as export:
+            export.add_detection(img_name, det_results)
+    """
+
+    formats = ['npz', 'hdf5', 'parquet']
+    # Number of rows per chunk of the HDF5 datasets
+    chunk_rows = 16384
+
+    # Names of the columns of the detected vesicles, for each detection method
+    vesicle_columns = {'hough': ['xc', 'yc', 'radius'],
+                    'template': ['xc', 'yc', 'size', 'score'],
+                    'floodfill': ['xc', 'yc', 'major_axis']}
+    # Names of the columns of the profiles, as written by ProfileWriter.blocks
+    profile_columns = {'radial': ['id_vesicle', 'channel', 'radius', 'mean_intensity', 'min_intensity',
+                                    'max_intensity', 'sum_intensity'],
+                        'angular': ['id_vesicle', 'channel', 'theta', 'mean_intensity', 'min_intensity',
+                                    'max_intensity', 'sum_intensity'],
+                        'contours': ['id_vesicle', 'theta', 'r_inner', 'r_outer']}
+    encapsulation_columns = ['roi', 'xc', 'yc', 'mean_intensity', 'area']
+
+    def __init__(self, filename, file_format = 'npz'):
+
+        # Check that the backend of the format is available, otherwise use npz
+        file_format = file_format.lower()
+        if (file_format == 'hdf5' and h5py is None) or (file_format == 'parquet' and pyarrow is None):
+            print(f'{file_format} export is not available (missing package): using npz')
+            file_format = 'npz'
+        self.file_format = file_format
+        self.filename = filename
+
+        # Identifiers of the images, in the order they have been added
+        self.images = {}
+        # Columns of each table (npz), open file (hdf5) or writers of each table (parquet)
+        self.tables = {}
+        if file_format == 'hdf5':
+            self.file = h5py.File(filename + '.h5', 'w')
+
+    def image_id(self, img_name):
+
+        # Get the identifier of the image, adding the image if needed
+        return self.images.setdefault(img_name, len(self.images))
+
+    def append(self, table, columns):
+
+        # Append the columns (dictionary of 1D arrays with the same length) to the table
+        if self.file_format == 'npz':
+            table_columns = self.tables.setdefault(table, {})
+            for name, values in columns.items():
+                table_columns.setdefault(name, []).append(values)
+
+        elif self.file_format == 'hdf5':
+            for name, values in columns.items():
+                key = f'{table}/{name}'
+                if key not in self.file:
+                    self.file.create_dataset(key, data = values, maxshape = (None,), chunks = (self.chunk_rows,),
+                                            compression = 'gzip', compression_opts = 4, shuffle = True)
+                else:
+                    dataset = self.file[key]
+                    n_rows = dataset.shape[0]
+                    dataset.resize((n_rows + len(values),))
+                    dataset[n_rows:] = values
+
+        elif self.file_format == 'parquet':
+            arrow_table = pyarrow.table(columns)
+            if table not in self.tables:
+                self.tables[table] = pyarrow.parquet.ParquetWriter(f'{self.filename}_{table}.parquet',
+                                                    arrow_table.schema, compression = 'zstd')
+            self.tables[table].write_table(arrow_table)
+
+    def add_detection(self, img_name, detection_results):
+
+        # Get detection method and detected vesicles
+        det_method = detection_results['method']
+        det_vesicles = detection_results['rois']
+        n_vesicles = det_vesicles.shape[0]
+
+        columns = {'id_image': np.full(n_vesicles, self.image_id(img_name), dtype = np.int32),
+                'id_vesicle': np.asarray(detection_results['id_vesicle'], dtype = np.int32)}
+        for n, name in enumerate(self.vesicle_columns[det_method][:det_vesicles.shape[1]]):
+            columns[name] = np.asarray(det_vesicles[:,n], dtype = np.float64)
+        # Add the ellipticity if the vesicles have been refined
+        if detection_results.get('ellipticity', None) is not None:
+            columns['ellipticity'] = np.asarray(detection_results['ellipticity'], dtype = np.float64)
+
+        self.append('vesicles', columns)
+
+    def add_profiles(self, img_name, profiles_results):
+
+        # Concatenate the blocks of each type of profile, and append them to their table at once
+        blocks = {}
+        for output, block in ProfileWriter.blocks(profiles_results):
+            blocks.setdefault(output, []).append(block)
+
+        id_image = self.image_id(img_name)
+        for output, output_blocks in blocks.items():
+            block = np.concatenate(output_blocks)
+            columns = {'id_image': np.full(block.shape[0], id_image, dtype = np.int32)}
+            for n, name in enumerate(self.profile_columns[output]):
+                # Identifiers are stored as integers, profile values in single precision
+                col_type = np.int32 if name in ['id_vesicle', 'channel'] else np.float32
+                columns[name] = block[:,n].astype(col_type)
+            self.append(f'profiles_{output}', columns)
+
+    def add_encapsulation(self, img_name, channel, encap_results):
+
+        # Append the encapsulation results of one channel
+        n_rois = encap_results.shape[0]
+        columns = {'id_image': np.full(n_rois, self.image_id(img_name), dtype = np.int32),
+                'channel': np.full(n_rois, int(str(channel).split(' ')[-1]), dtype = np.int32)}
+        for n, name in enumerate(self.encapsulation_columns):
+            col_type = np.int32 if name == 'roi' else np.float64
+            columns[name] = encap_results[:,n].astype(col_type)
+
+        self.append('encapsulation', columns)
+
+    def close(self):
+
+        # Add the table of images, and write or close the files
+        images = {'id_image': np.arange(len(self.images), dtype = np.int32),
+                'name': np.array(list(self.images), dtype = str)}
+        if self.file_format == 'npz':
+            self.append('images', images)
+            arrays = {f'{table}/{name}': np.concatenate(values)
+                        for table, columns in self.tables.items() for name, values in columns.items()}
+            np.savez_compressed(self.filename + '.npz', **arrays)
+            filesave = self.filename + '.npz'
+        elif self.file_format == 'hdf5':
+            images['name'] = np.array(list(self.images), dtype = object)
+            self.file.create_dataset('images/id_image', data = images['id_image'])
+            self.file.create_dataset('images/name', data = images['name'], dtype = h5py.string_dtype())
+            self.file.close()
+            filesave = self.filename + '.h5'
+        elif self.file_format == 'parquet':
+            self.append('images', {'id_image': images['id_image'], 'name': list(self.images)})
+            for writer in self.tables.values():
+                writer.close()
+            filesave = f'{self.filename}_<table>.parquet'
+
+        print(f'Batch results saved in {filesave}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(filename):
+
+        """
+        Load the tables of a columnar export
+
+        INPUT:
+            filename: string, name of the .npz or .h5 file, or of any of the .parquet files
+        OUTPUT:
+            tables: dictionary of tables, each one a dictionary of columns (numpy arrays)
+        """
+
+        tables = {}
+        if filename.endswith('.npz'):
+            with np.load(filename) as archive:
+                for key in archive.files:
+                    table, name = key.split('/')
+                    tables.setdefault(table, {})[name] = archive[key]
+        elif filename.endswith('.h5'):
+            with h5py.File(filename, 'r') as file:
+                for table in file.keys():
+                    # Strings are read as str instead of bytes
+                    tables[table] = {name: (dataset.asstr()[()] if dataset.dtype.kind == 'O' else dataset[()])
+                                        for name, dataset in file[table].items()}
+        elif filename.endswith('.parquet'):
+            # All the tables of the export share the same prefix
+            table_names = ['images', 'vesicles', 'profiles_radial', 'profiles_angular', 'profiles_contours', 'encapsulation']
+            prefix = [filename[:-len(f'_{x}.parquet')] for x in table_names if filename.endswith(f'_{x}.parquet')][0]
+            for table in table_names:
+                try:
+                    arrow_table = pyarrow.parquet.read_table(f'{prefix}_{table}.parquet')
+                except FileNotFoundError:
+                    continue
+                tables[table] = {name: arrow_table[name].to_numpy() for name in arrow_table.column_names}
+
+        return tables
+
+class LabelMask():
+
+    """
+    Run-length encoded storage of a label mask (0 is background). The runs of each label
+    are stored together with the bounding box of the label, such that each region can be
+    reconstructed on its own, without building the full label image.
+
+    Usage:
+        LabelMask.save(filename, mask_labels)
+        label_mask = LabelMask(filename)
+        bbox, mask_roi = label_mask.roi(label)
+        mask_labels = label_mask.image()
+    """
+
+    def encode(mask_labels):
+
+        """
+        Run-length encoding of a label mask, per label
+
+        INPUT:
+            mask_labels: numpy array, integer label image
+        OUTPUT:
+            encoded: dictionary with
+                shape: shape of the mask
+                labels: sorted labels found in the mask
+                bboxes: bounding box of each label, [row min, col min, row max, col max] (max excluded)
+                offsets: the runs of labels[i] are runs[offsets[i]:offsets[i+1]]
+                runs: [row, col start, length] of each run
+        """
+
+        height, width = mask_labels.shape
+        flat_mask = np.ascontiguousarray(mask_labels).ravel()
+
+        # Runs start where the label changes, and at the beginning of each row
+        run_start = np.empty(flat_mask.size, dtype = bool)
+        run_start[0] = True
+        np.not_equal(flat_mask[1:], flat_mask[:-1], out = run_start[1:])
+        run_start[::width] = True
+        starts = np.flatnonzero(run_start)
+        lengths = np.diff(np.append(starts, flat_mask.size))
+        values = flat_mask[starts]
+
+        # Keep the runs of the regions, grouped by label
+        in_region = values != 0
+        order = np.argsort(values[in_region], kind = 'stable')
+        starts, lengths, values = starts[in_region][order], lengths[in_region][order], values[in_region][order]
+        rows, cols = starts // width, starts % width
+        labels, first_run = np.unique(values, return_index = True)
+        offsets = np.append(first_run, len(values))
+
+        # Bounding box of each label, from its runs
+        if len(labels) > 0:
+            bboxes = np.column_stack([np.minimum.reduceat(rows, first_run), np.minimum.reduceat(cols, first_run),
+                                    np.maximum.reduceat(rows, first_run) + 1,
+                                    np.maximum.reduceat(cols + lengths, first_run)])
+        else:
+            bboxes = np.zeros((0, 4))
+
+        return {'shape': np.array([height, width]), 'labels': labels, 'bboxes': bboxes.astype(np.int32),
+                'offsets': offsets.astype(np.int64), 'runs': np.column_stack([rows, cols, lengths]).astype(np.int32)}
+
+    def save(filename, mask_labels):
+
+        # Save the encoded mask as a compressed numpy archive
+        np.savez_compressed(filename, **LabelMask.encode(mask_labels))
+
+    def __init__(self, source):
+
+        # Open the archive (filename or file object). The runs are only read when a region is requested
+        self.archive = np.load(source)
+        self.shape = tuple(self.archive['shape'])
+        self.labels = self.archive['labels']
+        self.bboxes = self.archive['bboxes']
+        self.offsets = self.archive['offsets']
+        self.runs = None
+
+    def label_runs(self, label):
+
+        # Get the runs and bounding box of a label
+        if self.runs is None:
+            self.runs = self.archive['runs']
+        i_label = np.searchsorted(self.labels, label)
+        if i_label >= len(self.labels) or self.labels[i_label] != label:
+            raise KeyError(f'Label {label} not found in the mask')
+
+        return self.runs[self.offsets[i_label]:self.offsets[i_label + 1]], self.bboxes[i_label]
+
+    def fill_runs(runs, shape, values = 1, origin = (0, 0)):
+
+        # Fill the runs in an image of the given shape: +value at the start of each run, -value
+        # after its end, and a cumulative sum along the rows
+        filled = np.zeros((shape[0], shape[1] + 1), dtype = np.int64)
+        rows, cols = runs[:,0] - origin[0], runs[:,1] - origin[1]
+        np.add.at(filled, (rows, cols), values)
+        np.add.at(filled, (rows, cols + runs[:,2]), -values)
+
+        return np.cumsum(filled, axis = 1)[:, :-1]
+
+    def roi(self, label):
+
+        """
+        Reconstruct the mask of a single region
+
+        INPUT:
+            label: int, label of the region
+        OUTPUT:
+            bbox: numpy array, [row min, col min, row max, col max] of the region (max excluded)
+            mask_roi: numpy array, boolean mask of the region inside its bounding box
+        """
+
+        runs, bbox = self.label_runs(label)
+        shape_roi = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+        mask_roi = LabelMask.fill_runs(runs, shape_roi, origin = bbox[:2]) > 0
+
+        return bbox, mask_roi
+
+    def image(self):
+
+        # Reconstruct the full label image
+        if self.runs is None:
+            self.runs = self.archive['runs']
+        run_labels = np.repeat(self.labels, np.diff(self.offsets)).astype(np.int64)
+        mask_labels = LabelMask.fill_runs(self.runs, self.shape, run_labels)
+        max_label = self.labels[-1] if len(self.labels) > 0 else 0
+
+        return mask_labels.astype(FileExport.compact_type(np.array([max_label])))
@@ -18,57 +18,272 @@
 # this program. If not, see <https://www.gnu.org/licenses/>.
 ###############################################################################
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import cv2
-from skimage import measure, morphology
+# The scientific modules are imported on first use (see lazy_import)
+from .lazy_import import LazyModule
+cv2 = LazyModule('cv2')
+sp_fft = LazyModule('scipy.fft')
+measure = LazyModule('skimage.measure')
+morphology = LazyModule('skimage.morphology')
+# The search regions of the membrane chaining are matplotlib patches
+patches = LazyModule('matplotlib.patches')
 
-from matplotlib.patches import Rectangle
+from .instrumentation import instrumented
 
-class ImageFilters():
+class ImageType():
 
-    def smooth(mat_image, filter_size):
+    # All the filtering stages work in single precision. Images are never promoted to float64,
+    # which halves the memory traffic with respect to double precision for 16-bit data
+    working_type = np.float32
 
-        # Get image type and check is an accepted type by the gaussian blur function
-        img_type = mat_image.dtype
-        types_allowed = ['int8', 'int16', 'float32']
+    def as_float32(mat_image, copy = False):
 
-        if img_type not in types_allowed:
-            if img_type in ['int8', 'int16']: 
-                mat_image = np.int16(mat_image)
-            # Force 32bit and 64 bit types to be float 32
-            else:
-                mat_image = np.float32(mat_image)
+        # Return the image as float32, only copying it if needed (or if required)
+        if (mat_image.dtype == ImageType.working_type) and (copy is False):
+            return mat_image
+        
+        return mat_image.astype(ImageType.working_type)
 
-        # Check if current image has all channels, and smooth all of them
-        if mat_image.ndim > 2: n_cycles = mat_image.shape[2]
-        else: n_cycles = 1
+    def limits(mat_image, percentiles = None):
+
+        """
+        Function to compute the intensity limits used to rescale an image
+
+        INPUT:
+            mat_image: numpy array, image
+            percentiles: list, [low, high] percentiles of the intensity used as
+                        limits. If None, the limits are [0, max]
+        OUTPUT:
+            [low, high]: limits of the intensity, in the units of the image
+        """
+
+        if percentiles is None:
+            return [0, float(np.max(mat_image))]
+
+        # For 8 and 16 bit images, compute the percentiles from the histogram (single pass)
+        if mat_image.dtype in [np.uint8, np.uint16]:
+            counts = np.bincount(mat_image.ravel())
+            cumulative = np.cumsum(counts) / mat_image.size
+            low = np.searchsorted(cumulative, percentiles[0]/100)
+            high = np.searchsorted(cumulative, percentiles[1]/100)
+            return [float(low), float(min(high, len(counts) - 1))]
+
+        # For other types, estimate the percentiles on a subsample of the pixels
+        step = max(1, mat_image.size // 1000000)
+        low, high = np.percentile(mat_image.ravel()[::step], percentiles)
+
+        return [float(low), float(high)]
+
+    def rescale(mat_image, out_type = 'uint8', percentiles = None):
+
+        """
+        Function to convert an image to uint8 or uint16, mapping the intensity
+        limits to the full range of the output type. Values outside the limits
+        are clipped, such that no value overflows.
+
+        INPUT:
+            mat_image: numpy array, image
+            out_type: string, 'uint8' or 'uint16'
+            percentiles: list, [low, high] percentiles used as limits. If None,
+                        the range [0, max] of the image is used
+        OUTPUT:
+            out_image: numpy array, rescaled image of type out_type
+        """
+
+        out_max = np.iinfo(out_type).max
+        low, high = ImageType.limits(mat_image, percentiles)
+        scale = out_max / max(high - low, np.finfo(np.float32).eps)
+
+        # For 8 and 16 bit images use a lookup table with one entry per possible value
+        if mat_image.dtype in [np.uint8, np.uint16]:
+            lut = (np.arange(np.iinfo(mat_image.dtype).max + 1, dtype = np.float32) - low)*scale
+            np.clip(lut, 0, out_max, out = lut)
+            lut = np.rint(lut).astype(out_type)
+            return np.take(lut, mat_image)
+
+        # Other types are rescaled in single precision, working in place on a single copy
+        out_image = ImageType.as_float32(mat_image, copy = True)
+        out_image -= low
+        out_image *= scale
+        np.clip(out_image, 0, out_max, out = out_image)
+
+        return out_image.astype(out_type)
+
+class ImageFilters():
+
+    def smooth(mat_image, filter_size):
+
+        # Gaussian blur is computed in single precision.
+        # Integer images are converted to float32 to keep the precision of the blurred image
+        mat_image = ImageType.as_float32(mat_image)
 
         # Initialise img_blur with the same shape as mat_image
-        img_blur = np.zeros(mat_image.shape)
+        img_blur = np.empty(mat_image.shape, dtype = ImageType.working_type)
 
-        # Loop over all the image channels
-        for i_channel in range(n_cycles):
-            try: 
-                ch_image = mat_image[:,:,i_channel]
+        # Check if current image has all channels, and smooth all of them
+        if mat_image.ndim > 2:
+            for i_channel in range(mat_image.shape[2]):
                 # Use sigma blurring to smooth the image
-                img_blur[:,:,i_channel] = cv2.GaussianBlur(ch_image, (filter_size, filter_size), 0)
-            except IndexError:
-                img_blur = cv2.GaussianBlur(mat_image, (filter_size, filter_size), 0)
+                img_blur[:,:,i_channel] = cv2.GaussianBlur(mat_image[:,:,i_channel], (filter_size, filter_size), 0)
+        else:
+            cv2.GaussianBlur(mat_image, (filter_size, filter_size), 0, dst = img_blur)
 
         return img_blur
 
-    def enhance(mat_image, filter_size):
+    @instrumented('enhancement')
+    def enhance(mat_image, filter_size, method = 'gaussian'):
 
-        # Use large sigma blurring to smooth the image to substract
-        img_substract = ImageFilters.smooth(mat_image, filter_size)
+        # Estimate the background to substract (by default, large sigma blurring of the image)
+        img_enhanced = ImageFilters.background(mat_image, filter_size, method)
 
-        # Create denoised image by substraction
-        img_enhanced = mat_image - img_substract
+        # Create denoised image by substraction, reusing the buffer of the background
+        np.subtract(mat_image, img_enhanced, out = img_enhanced, dtype = ImageType.working_type)
         # Set negative values to zero
-        img_enhanced[img_enhanced < 0 ] = 0
+        np.maximum(img_enhanced, 0, out = img_enhanced)
 
         return img_enhanced
-        
+
+    # Background estimators available for the enhancement
+    background_methods = ['gaussian', 'box', 'downsample', 'tophat']
+
+    def background(mat_image, filter_size, method = 'gaussian', dst = None):
+
+        """
+        Function to estimate the background of an image, which is substracted to enhance the membrane.
+        The cost of the gaussian blur grows with the filter size, the other methods are approximations
+        whose cost is (almost) independent of the filter size.
+
+        INPUT:
+            mat_image: numpy array, single or multichannel image
+            filter_size: int, size of the gaussian filter that the background approximates
+            method: string, background estimator
+                'gaussian': gaussian blur of the image
+                'box': three iterated box filters, approximating the gaussian blur
+                'downsample': gaussian blur of a downsampled image, upsampled back to the image size
+                'tophat': morphological opening with a disk of the filter size (rolling ball),
+                            computed on a downsampled image
+            dst: numpy array, float32, optional output array
+        OUTPUT:
+            img_background: numpy array, float32, same shape as mat_image
+        """
+
+        mat_image = ImageType.as_float32(mat_image)
+        if dst is None:
+            dst = np.empty(mat_image.shape, dtype = ImageType.working_type)
+
+        # Estimate the background of each channel separately
+        if mat_image.ndim > 2:
+            for i_channel in range(mat_image.shape[2]):
+                dst[:,:,i_channel] = ImageFilters.background(mat_image[:,:,i_channel], filter_size, method)
+            return dst
+
+        # Standard deviation of the gaussian kernel for the given size, as computed by OpenCV
+        sigma = 0.3*((filter_size - 1)*0.5 - 1) + 0.8
+
+        if method == 'gaussian':
+            cv2.GaussianBlur(mat_image, (filter_size, filter_size), 0, dst = dst)
+
+        elif method == 'box':
+            # Widths of the box filters whose iteration has the variance of the gaussian
+            n_boxes = 3
+            w_low = int(np.sqrt(12*sigma**2/n_boxes + 1))
+            if w_low % 2 == 0: w_low -= 1
+            w_up = w_low + 2
+            n_low = round((12*sigma**2 - n_boxes*w_low**2 - 4*n_boxes*w_low - 3*n_boxes)/(-4*w_low - 4))
+            box_sizes = [w_low if n < n_low else w_up for n in range(n_boxes)]
+            # Iterate the box filters, which have a constant cost per pixel
+            dst[...] = mat_image
+            for w in box_sizes:
+                cv2.blur(dst, (w, w), dst = dst, borderType = cv2.BORDER_REFLECT_101)
+
+        elif method in ['downsample', 'tophat']:
+            # Downsample such that the filter keeps at least a few pixels
+            factor = max(1, int(sigma // 3))
+            h, w = mat_image.shape
+            small_size = (max(1, w // factor), max(1, h // factor))
+            img_small = cv2.resize(mat_image, small_size, interpolation = cv2.INTER_AREA)
+            if method == 'downsample':
+                img_small = cv2.GaussianBlur(img_small, (0, 0), sigma/factor)
+            else:
+                # Opening with a disk of the filter size, the background stays below the signal
+                disk_size = max(3, int(filter_size // factor)) | 1
+                disk = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (disk_size, disk_size))
+                img_small = cv2.morphologyEx(img_small, cv2.MORPH_OPEN, disk)
+            # Upsample to the size of the image
+            cv2.resize(img_small, (w, h), dst = dst, interpolation = cv2.INTER_LINEAR)
+
+        else:
+            raise ValueError(f'Unknown background method: {method}')
+
+        return dst
+
+    @instrumented('preprocess')
+    def preprocess(mat_image, smooth_size = None, enhance_size = None, buffers = None, enhance_method = 'gaussian'):
+
+        """
+        Fused smoothing and enhancement. For each channel, the image is smoothed and
+        the background (by default, blur of the smoothed image) is subtracted and clipped in place.
+        The channels are processed in parallel, and all the computations are in float32.
+
+        INPUT:
+            mat_image: numpy array, single or multichannel image
+            smooth_size: int, filter size for smoothing. None to skip the smoothing
+            enhance_size: int, filter size for enhancing. None to skip the enhancement
+            buffers: dictionary, output and intermediate arrays reused between calls.
+                        The output is overwritten at the next call with the same buffers
+            enhance_method: string, background estimator (see ImageFilters.background)
+        OUTPUT:
+            img_out: numpy array, float32, same shape as mat_image
+        """
+
+        # Get (or allocate) the buffers with the right shape
+        if buffers is None:
+            buffers = {}
+        n_channels = mat_image.shape[2] if mat_image.ndim > 2 else 1
+        shape_ch = mat_image.shape[:2]
+        if buffers.get('shape', None) != mat_image.shape:
+            buffers['shape'] = mat_image.shape
+            buffers['out'] = np.empty(mat_image.shape, dtype = ImageType.working_type)
+            buffers['smooth'] = [np.empty(shape_ch, dtype = ImageType.working_type) for _ in range(n_channels)]
+            buffers['background'] = [np.empty(shape_ch, dtype = ImageType.working_type) for _ in range(n_channels)]
+        img_out = buffers['out']
+
+        def process_channel(i_channel):
+
+            # Get the channel, and the output and intermediate buffers of the channel
+            if n_channels > 1:
+                ch_image = mat_image[:,:,i_channel]
+                ch_out = img_out[:,:,i_channel]
+            else:
+                ch_image = mat_image
+                ch_out = img_out
+            ch_smooth = buffers['smooth'][i_channel]
+            ch_background = buffers['background'][i_channel]
+
+            # Smooth the channel, if required
+            if smooth_size:
+                cv2.GaussianBlur(ImageType.as_float32(ch_image), (smooth_size, smooth_size), 0, dst = ch_smooth)
+            else:
+                ch_smooth[...] = ch_image
+
+            # Subtract the background and clip the negative values, in place
+            if enhance_size:
+                ImageFilters.background(ch_smooth, enhance_size, enhance_method, dst = ch_background)
+                np.subtract(ch_smooth, ch_background, out = ch_smooth)
+                np.maximum(ch_smooth, 0, out = ch_smooth)
+            ch_out[...] = ch_smooth
+
+        # OpenCV releases the GIL, so the channels can be processed in parallel threads
+        if n_channels > 1:
+            with ThreadPoolExecutor(max_workers = n_channels) as executor:
+                list(executor.map(process_channel, range(n_channels)))
+        else:
+            process_channel(0)
+
+        return img_out
+
     def check_filtersize(filter_size):
 
         # If filter size is not odd, update to first higher odd number
@@ -78,6 +293,7 @@ class ImageFilters():
 
         return filter_size
 
+    @instrumented('wavelet transform')
     def wavelet2d_firstdet(mat_image, a_scale):
 
         """
@@ -93,18 +309,21 @@ class ImageFilters():
             WT_arg: numpy array, argument of the WT in degrees
 
         """
+        # Work in single precision: the FFTs of scipy keep the precision of the input
+        mat_image = ImageType.as_float32(mat_image)
         # Construct x and y vectors, with zero at the middle
-        x = np.arange(-mat_image.shape[1]/2, mat_image.shape[1]/2)
-        y = np.arange(-mat_image.shape[0]/2, mat_image.shape[0]/2)
+        x = np.arange(-mat_image.shape[1]/2, mat_image.shape[1]/2, dtype = np.float32)
+        y = np.arange(-mat_image.shape[0]/2, mat_image.shape[0]/2, dtype = np.float32)
         # Construct the matrix as a stack of vectors
         xg = np.tile(x, (len(y), 1))
         yg = np.tile(y, (len(x), 1)).transpose()
 
         # Compute the 2D FFT of the image, shifted
-        fft_img = np.fft.fftshift(np.fft.fft2(mat_image))
+        fft_img = sp_fft.fftshift(sp_fft.fft2(mat_image))
 
         # Define the gaussian function in real space. 
         # Note that x*x is better than x**2
+        a_scale = np.float32(a_scale)
         phi = np.exp(-((xg/a_scale)*(xg/a_scale)+(yg/a_scale)*(yg/a_scale))/2)
         # Define the first derivative in x and in y
         phi_x = -(xg/a_scale)*phi
@@ -113,14 +332,14 @@ class ImageFilters():
         phi_xg = 1/(a_scale**2)*phi_x
         phi_yg = 1/(a_scale**2)*phi_y
         # Compute the 2D FFT, shifted
-        fft_phi_x = np.fft.fftshift(np.fft.fft2(phi_xg))
-        fft_phi_y = np.fft.fftshift(np.fft.fft2(phi_yg))
+        fft_phi_x = sp_fft.fftshift(sp_fft.fft2(phi_xg))
+        fft_phi_y = sp_fft.fftshift(sp_fft.fft2(phi_yg))
         # Compute the gradient in x and in y, and inverse the FFT
-        WT_x = np.fft.ifftshift(np.fft.ifft2(fft_phi_x*fft_img))
-        WT_y = np.fft.ifftshift(np.fft.ifft2(fft_phi_y*fft_img))
+        WT_x = sp_fft.ifftshift(sp_fft.ifft2(fft_phi_x*fft_img))
+        WT_y = sp_fft.ifftshift(sp_fft.ifft2(fft_phi_y*fft_img))
         # Compute the modulus (not normalised) and the argument in degrees
         WT_mod = np.sqrt(np.abs(WT_x)**2 + np.abs(WT_y)**2)
-        WT_arg = np.angle(WT_x + 1j*WT_y, deg = True)
+        WT_arg = np.angle(WT_x + 1j*WT_y, deg = True).astype(np.float32)
 
         return WT_mod, WT_arg      
 
@@ -133,7 +352,7 @@ class ImageMask():
 
         # Calculate threshold intensity.
         # threshold is based on the median of all positive pixel values
-        intensity_th = np.float(threshold)*median_positive
+        intensity_th = float(threshold)*median_positive
 
         # Threshold the image as uint8
         img_th = (mat_image > intensity_th).astype('uint8')
@@ -241,14 +460,14 @@ class ImageMask():
         # maxima with matrix operations instead of loops
         dir_sa=[0.,45.,90.,135.,-180.,-135.,-90.,-45.]
         # Initialise direction matrix
-        WT_mod_0=np.zeros(WT_mod.shape)
-        WT_mod_45=np.zeros(WT_mod.shape)
-        WT_mod_90=np.zeros(WT_mod.shape)
-        WT_mod_135=np.zeros(WT_mod.shape)
-        WT_mod_m180=np.zeros(WT_mod.shape)
-        WT_mod_m135=np.zeros(WT_mod.shape)
-        WT_mod_m90=np.zeros(WT_mod.shape)
-        WT_mod_m45=np.zeros(WT_mod.shape)
+        WT_mod_0=np.zeros_like(WT_mod)
+        WT_mod_45=np.zeros_like(WT_mod)
+        WT_mod_90=np.zeros_like(WT_mod)
+        WT_mod_135=np.zeros_like(WT_mod)
+        WT_mod_m180=np.zeros_like(WT_mod)
+        WT_mod_m135=np.zeros_like(WT_mod)
+        WT_mod_m90=np.zeros_like(WT_mod)
+        WT_mod_m45=np.zeros_like(WT_mod)
         # Get the values from the WT modulus
         WT_mod_0[:,:-1]=WT_mod[:,1:]
         WT_mod_m180[:,1:]=WT_mod[:,: -1]
@@ -271,7 +490,7 @@ class ImageMask():
                     WT_mod_90,WT_mod_135]
  
         # Initialize matrix for the edge mask
-        mask_edge=np.zeros(WT_mod.shape)
+        mask_edge=np.zeros_like(WT_mod)
         # Loop through each direction and compare the corresponding matrices
         # keeping the maxima
         for idir in range(len(dir_sa)):
@@ -281,6 +500,7 @@ class ImageMask():
         
         return mask_edge
 
+    @instrumented('chain search')
     def chain_search(mask_WTarg, search_mat):
 
         # Get search parameters
@@ -313,10 +533,10 @@ class ImageMask():
                 else:
                     search_angle = mask_WTarg[yc, xc] - 90
 
-                r1 = Rectangle((xc, yc), search_limit, search_width, angle=search_angle)
-                r2 = Rectangle((xc, yc), search_limit, -search_width, angle=search_angle)
-                r3 = Rectangle((xc, yc), -search_limit, search_width, angle=search_angle)
-                r4 = Rectangle((xc, yc), -search_limit, -search_width, angle=search_angle)
+                r1 = patches.Rectangle((xc, yc), search_limit, search_width, angle=search_angle)
+                r2 = patches.Rectangle((xc, yc), search_limit, -search_width, angle=search_angle)
+                r3 = patches.Rectangle((xc, yc), -search_limit, search_width, angle=search_angle)
+                r4 = patches.Rectangle((xc, yc), -search_limit, -search_width, angle=search_angle)
                 
                 xs1 = xc - search_limit
                 xs2 = xc + search_limit
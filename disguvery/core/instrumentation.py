@@ -0,0 +1,251 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import os
+import csv
+import time
+import threading
+import functools
+import contextlib
+import tracemalloc
+
+# psutil gives the resident memory on all platforms, /proc is used otherwise (linux)
+try: import psutil
+except ModuleNotFoundError: psutil = None
+
+# Instrumentation recording in the current thread, if any
+_active = threading.local()
+
+def rss():
+
+    # Resident memory of the process in bytes, 0 if it can't be read
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def measure(name):
+
+    # Measure a block of code with the instrumentation recording in the current thread.
+    # Does nothing if there is none
+    instrumentation = getattr(_active, 'instrumentation', None)
+    if instrumentation is None:
+        return contextlib.nullcontext()
+
+    return instrumentation.measure(name)
+
+def instrumented(name):
+
+    """
+    Decorator measuring each call of a core function with the instrumentation recording in
+    the current thread. The cost is a single lookup when nothing is being recorded
+
+    Usage:
+        @instrumented('hough')
+        def hough(mat_image, det_settings):
+            ...
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            instrumentation = getattr(_active, 'instrumentation', None)
+            if instrumentation is None:
+                return func(*args, **kwargs)
+            with instrumentation.measure(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+class RssSampler(threading.Thread):
+
+    # Background thread sampling the resident memory, to get its peak within each measured block
+    def __init__(self, interval = 0.01):
+
+        threading.Thread.__init__(self, daemon = True)
+        self.interval = interval
+        self.peak = rss()
+        self.stop_event = threading.Event()
+
+    def run(self):
+
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, rss())
+
+    def reset(self):
+
+        # Restart the peak from the current memory, return the peak until now
+        peak, self.peak = self.peak, rss()
+        return max(peak, self.peak)
+
+    def stop(self):
+        self.stop_event.set()
+
+class Instrumentation():
+
+    """
+    Time and memory of the stages of a campaign and of the core functions they call. Each
+    measured block records its number of calls, the total time (including the blocks called
+    within it), the peak of the python allocations (tracemalloc, which also traces numpy
+    arrays) and the peak of the resident memory of the process (sampled in the background,
+    which includes the memory allocated by OpenCV), for the current image.
+
+    Usage:
+        instrumentation = Instrumentation()
+        with instrumentation.recording():
+            instrumentation.image = img_name
+            with measure('detection'):
+                ...
+            instrumentation.write_image(filename, img_name)
+        instrumentation.report()
+    """
+
+    columns = ['stage', 'calls', 'time_s', 'peak_python_mb', 'peak_rss_mb']
+
+    def __init__(self, trace_memory = True):
+
+        self.trace_memory = trace_memory
+        self.image = ''
+        # {image: {stage: [calls, time, peak python memory, peak resident memory]}}
+        self.records = {}
+        # Peaks of the blocks being measured, from the outermost one
+        self.stack = []
+        self.sampler = None
+
+    @contextlib.contextmanager
+    def recording(self):
+
+        # Record the measured blocks run in the current thread
+        started_tracing = False
+        if self.trace_memory is True:
+            # Python allocations are only traced from python 3.9, where their peak can be restarted
+            if hasattr(tracemalloc, 'reset_peak') and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            self.sampler = RssSampler()
+            self.sampler.start()
+        _active.instrumentation = self
+        try:
+            yield self
+        finally:
+            _active.instrumentation = None
+            if self.sampler is not None:
+                self.sampler.stop()
+                self.sampler = None
+            if started_tracing is True:
+                tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+
+        # Each block being measured keeps its peaks [python, resident]. The peaks of tracemalloc and
+        # of the sampler are restarted at the start and at the end of each block, and the peaks
+        # until then are kept by the block that was running (the outer block)
+        tracing = self.sampler is not None
+        if tracing is True:
+            self.update_peaks()
+            py_start, _ = tracemalloc.get_traced_memory()
+            self.stack.append([py_start, self.sampler.peak])
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t_start
+            py_peak, rss_peak = 0, 0
+            if tracing is True:
+                self.update_peaks()
+                py_peak, rss_peak = self.stack.pop()
+                # The peaks of the outer block include the ones of this block
+                if self.stack:
+                    self.stack[-1][0] = max(self.stack[-1][0], py_peak)
+                    self.stack[-1][1] = max(self.stack[-1][1], rss_peak)
+                py_peak -= py_start
+            self.add(name, elapsed, py_peak, rss_peak)
+
+    def update_peaks(self):
+
+        # Add the peaks since the last restart to the block that is running, and restart them
+        _, py_peak = tracemalloc.get_traced_memory()
+        rss_peak = self.sampler.reset()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if self.stack:
+            self.stack[-1][0] = max(self.stack[-1][0], py_peak)
+            self.stack[-1][1] = max(self.stack[-1][1], rss_peak)
+
+    def add(self, name, elapsed, py_peak = 0, rss_peak = 0):
+
+        # Add a call to the records of the current image
+        record = self.records.setdefault(self.image, {}).setdefault(name, [0, 0, 0, 0])
+        record[0] += 1
+        record[1] += elapsed
+        record[2] = max(record[2], py_peak)
+        record[3] = max(record[3], rss_peak)
+
+    def rows(self, records):
+
+        # Rows of a table of records, sorted by decreasing time
+        rows = []
+        for name, (calls, elapsed, py_peak, rss_peak) in sorted(records.items(), key = lambda r: -r[1][1]):
+            rows.append([name, calls, round(elapsed, 4), round(py_peak/1024**2, 2), round(rss_peak/1024**2, 2)])
+        return rows
+
+    def write_image(self, filename, img_name):
+
+        # Write the timing table of an image
+        with open(filename, 'w', newline = '') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+            writer.writerows(self.rows(self.records.get(img_name, {})))
+
+    def summary(self):
+
+        # Records of all the images: calls and time are added, peaks are the maximum over the images
+        total = {}
+        for records in self.records.values():
+            for name, (calls, elapsed, py_peak, rss_peak) in records.items():
+                record = total.setdefault(name, [0, 0, 0, 0])
+                record[0] += calls
+                record[1] += elapsed
+                record[2] = max(record[2], py_peak)
+                record[3] = max(record[3], rss_peak)
+
+        return total
+
+    def report(self, filename = None):
+
+        # Print the summary of the campaign, and write it if a file name is given
+        rows = self.rows(self.summary())
+        n_images = max(1, len([k for k in self.records.keys() if k]))
+        print(f'Time and memory per stage, {n_images} image(s):')
+        print(f'{"stage":>24} {"calls":>7} {"time (s)":>9} {"s/image":>8} {"python (MB)":>12} {"rss (MB)":>9}')
+        for name, calls, elapsed, py_peak, rss_peak in rows:
+            print(f'{name:>24} {calls:>7} {elapsed:>9.2f} {elapsed/n_images:>8.2f} {py_peak:>12.1f} {rss_peak:>9.1f}')
+
+        if filename is not None:
+            with open(filename, 'w', newline = '') as file:
+                writer = csv.writer(file)
+                writer.writerow(self.columns)
+                writer.writerows(rows)
+            print(f'Timing summary saved in {filename}')
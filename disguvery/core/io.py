@@ -0,0 +1,59 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Reading of the images and export of the results, without the interface
+
+from .file_handling import FileImage, FileTemplate, FileExport, ColumnarExport, LabelMask
+from .results_store import ResultsStore
+
+# The exports of whole campaigns are used as they are (io.ColumnarExport, io.ResultsStore)
+__all__ = ['open_image', 'open_template', 'save_detection', 'save_profiles', 'save_encapsulation', 'save_mask',
+        'ColumnarExport', 'ResultsStore']
+
+def open_image(filename, verbose = False):
+
+    # Read an image as a numpy array (height x width, or height x width x channels). None if not supported
+    _, _, source_image = FileImage.open(filename, verbose)
+    return source_image
+
+def open_template(filename):
+
+    # Read a template image for the template matching, as a single channel numpy array
+    return FileTemplate.read(filename)
+
+def save_detection(filename, det_results):
+
+    # Export the vesicle detection results (.csv) and the regions mask (floodfill)
+    FileExport.vesicle_detection(filename, det_results)
+
+def save_profiles(filename, profiles_results):
+
+    # Export the intensity profiles, one file per vesicle
+    FileExport.intensity_profiles(filename, profiles_results)
+
+def save_encapsulation(filename, encap_results, mask_labels):
+
+    # Export the encapsulation results of a channel (.csv) and its masked image (.tiff)
+    FileExport.encapsulation_results(filename, encap_results, mask_labels)
+
+def save_mask(filename, mask_labels):
+
+    # Export a labels mask with run-length encoding (see LabelMask)
+    LabelMask.save(filename, mask_labels)
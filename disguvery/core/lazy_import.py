@@ -0,0 +1,78 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import importlib
+import importlib.util
+import threading
+
+class LazyModule():
+
+    """
+    Module imported on first use of one of its attributes. The scientific modules (OpenCV,
+    scipy, scikit-image...) take most of the start up time of the application, and they are
+    only needed once an analysis is run. The modules are imported once, the first time
+    a function of a panel uses them.
+
+    Usage:
+        cv2 = LazyModule('cv2')
+        measure = LazyModule('skimage.measure')
+        pyarrow = LazyModule('pyarrow', submodules = ['pyarrow.parquet'])
+        cv2.resize(...)     # cv2 is imported here
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name, submodules = []):
+
+        self._name = name
+        self._submodules = list(submodules)
+        self._module = None
+
+    def _load(self):
+
+        # Import the module (and the submodules used through it) on the first call
+        if self._module is None:
+            with LazyModule._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    for submodule in self._submodules:
+                        importlib.import_module(submodule)
+                    self._module = module
+
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return f'<lazy module {self._name} ({state})>'
+
+def optional_module(name, submodules = []):
+
+    # Optional dependency, imported on first use. None if it's not installed
+    if importlib.util.find_spec(name) is None:
+        return None
+
+    return LazyModule(name, submodules)
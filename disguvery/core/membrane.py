@@ -0,0 +1,269 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+# 
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with 
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+
+# scikit-image is imported on first use (see lazy_import)
+from .lazy_import import LazyModule
+filters = LazyModule('skimage.filters')
+# Import image processing functions
+from .image_processing import ImageFilters, ImageMask
+from .pipeline import PipelineMonitor, FrozenVar, plain_settings
+from .instrumentation import instrumented
+
+class BMAsegmentation():
+
+    @instrumented('membrane segmentation')
+    def run(det_results, settings_var, offset_box):
+
+        # Get the rois from the detection results
+        rois = det_results['rois']
+
+        # Options for the inside offset, and outside offset
+        pix_width = int(settings_var['width'].get())
+        offset_in_opt = [0, int(pix_width/2), pix_width]
+        offset_out_opt = [pix_width, int(pix_width/2), 0]
+        
+        # Determine offset to make the inner and outer membrane boundary
+        contour_pos = settings_var['contour_position'].get()
+        offset_in = offset_in_opt[contour_pos]
+        offset_out = offset_out_opt[contour_pos]
+
+        # Build list with rois equivalent to the inner and outer contour
+        rois_in = rois[:,:3].copy()
+        rois_out = rois[:,:3].copy()
+
+        if det_results['method'] == 'hough':
+            for ic, roi in enumerate(rois):
+                rois_in[ic][2] = roi[2] - offset_in 
+                rois_out[ic][2] = roi[2] + offset_out 
+        else:
+            for ic, roi in enumerate(rois):
+                rois_in[ic][2] = roi[2]/2 - offset_in - offset_box
+                rois_out[ic][2] = roi[2]/2 + offset_out - offset_box
+        
+        return rois_in, rois_out         
+
+    def combine_rois(rois_in, rois_out):
+
+        # Create a new array like rois_in
+        rois_combined = rois_in.copy()
+        # Resize to allow for buffer
+        rois_combined.resize(rois_out.shape[0], 6)
+        # Assign values from rois in and out
+        rois_combined[:,:3] = rois_in
+        rois_combined[:,3:] = rois_out
+        # Reduce the array to only have [x,y,rin,rout]
+        rois_combined = rois_combined[:,[0,1,2,5]]
+        
+        return rois_combined
+
+class RMDsegmentation():
+
+    def run(input_image, det_results, settings_var, monitor = None):
+
+        """
+        Refined membrane detection of all the detected vesicles, without display
+
+        INPUT:
+            input_image: numpy array, single channel image
+            det_results: dictionary, vesicle detection results
+            settings_var: dictionary, refined membrane detection settings
+            monitor: PipelineMonitor, progress and cancellation (optional)
+        OUTPUT:
+            results_mask: list, [WT modulus, WT argument, edge mask]
+            results: tuple, (contours matrix, centers of the vesicles)
+        """
+
+        if monitor is None:
+            monitor = PipelineMonitor()
+
+        # Get values from the settings
+        a_scale = float(settings_var['img_filter'].get())
+        img_th_low = settings_var['img_th'][0]
+        img_th_high = float(settings_var['img_th'][1].get())
+        margin_bbox = int(settings_var['bbox_margin'].get())
+        search_length = int(settings_var['search_l'].get())
+        search_width = float(settings_var['search_w'].get())
+        ves_th = float(settings_var['vesicle_th'].get())
+
+        # Edge mask of the whole image
+        WT_mod, WT_arg, mask_edge = RMDsegmentation.edge_mask(input_image, a_scale, img_th_low, img_th_high)
+        WT_arg_pos = RMDsegmentation.positive_argument(WT_arg)
+
+        all_rois = det_results['rois']
+        all_contours = np.zeros(WT_mod.shape, dtype = int)
+        centers = np.zeros((len(all_rois),2))
+
+        with monitor.stage('vesicles', total = len(all_rois)):
+            for ves, roi in enumerate(all_rois):
+                x1, x2, y1, y2, _ = RMDsegmentation.vesicle_bbox(roi, det_results['method'], margin_bbox, mask_edge.shape)
+                _, mask_WTarg = RMDsegmentation.vesicle_edges(WT_mod, WT_arg_pos, mask_edge, [x1, x2, y1, y2], ves_th)
+                ri, ro = RMDsegmentation.chain_vesicle(mask_WTarg, [x1, y1], search_length, search_width)
+                RMDsegmentation.add_contours(all_contours, centers, ves, ri, ro)
+                monitor.advance()
+
+        return [WT_mod, WT_arg, mask_edge], (all_contours, centers)
+
+    @instrumented('edge mask')
+    def edge_mask(input_image, a_scale, img_th_low, img_th_high):
+
+        # Compute the 2D Wavelet using the first derivative
+        WT_mod, WT_arg = ImageFilters.wavelet2d_firstdet(input_image, a_scale)
+        # Get the thinned edges using a modified canny detector
+        mask_edge = ImageMask.wt_edges(WT_mod, WT_arg)
+        # Normalise the modulus
+        WT_norm = WT_mod / np.max(WT_mod.flatten())
+
+        # Clear the borders
+        mask_edge[:int(a_scale/2), :] = 0
+        mask_edge[-int(a_scale/2):, :] = 0
+        mask_edge[:, -int(a_scale/2):] = 0
+        mask_edge[:, :int(a_scale/2)] = 0
+
+        # Apply hysteresis threshold
+        WT_norm_edge = mask_edge*WT_norm
+        mask_edgehigh = (WT_norm_edge > img_th_high).astype(int)
+        mask_edge = mask_edgehigh + filters.apply_hysteresis_threshold(WT_norm_edge, img_th_low, img_th_high).astype(int)
+
+        return [WT_mod, WT_arg, mask_edge]
+
+    def positive_argument(WT_arg):
+
+        # Make the WT argument only positive
+        WT_arg_pos = WT_arg.copy()
+        WT_arg_pos[WT_arg_pos < 0] = WT_arg_pos[WT_arg_pos < 0] + 180
+
+        return WT_arg_pos
+
+    def vesicle_bbox(roi, det_method, margin_bbox, shape):
+
+        # Bounding box of a vesicle, with a margin
+        x_center, y_center = roi[0], roi[1]
+        if det_method == 'hough':
+            bbox = 2*roi[2] + 2*margin_bbox
+        else:
+            bbox =  roi[2] + 2*margin_bbox
+
+        # Define coordinates of the bounding box
+        y1 = int(y_center - bbox/2); y2 = int(y_center + bbox/2)
+        x1 = int(x_center - bbox/2); x2 = int(x_center + bbox/2)
+
+        # Check coordinates of bounding box are contained in the image
+        if y1 < 0: y1 = 0
+        if x1 < 0: x1 = 0
+        if y2 > shape[1]: y2 = shape[1]
+        if x2 > shape[0]: x2 = shape[0]
+
+        return x1, x2, y1, y2, bbox
+
+    def vesicle_edges(WT_mod, WT_arg_pos, mask_edge, bbox_coords, ves_th):
+
+        # Retrieve the WT and the edge mask for only the ROI
+        x1, x2, y1, y2 = bbox_coords
+        WT_ves = np.zeros((int(y2-y1), int(x2-x1)))
+        try:
+            WT_ves[:,:] = WT_mod[y1:y2, x1:x2]
+        except ValueError:
+            WT_ves = WT_mod[y1:y2, x1:x2]
+        finally:
+            edge_ves = np.zeros(WT_ves.shape, dtype = int)
+            edge_ves[:,:] = mask_edge[y1:y2, x1:x2]
+
+        # normalize the WT modulus within the ROI and eliminate noise in edge mask
+        WT_norm = WT_ves / np.max(WT_ves[WT_ves!=0].flatten())
+        edge_ves[WT_norm <= ves_th] = 0
+
+        # Construct mask for the positive arguement on the edges
+        mask_WTarg = WT_arg_pos[y1:y2, x1:x2]*edge_ves
+
+        return edge_ves, mask_WTarg
+
+    def chain_vesicle(mask_WTarg, offset, search_length, search_width):
+
+        # Run directional search to chain edges
+        ri, ro = ImageMask.chain_search(mask_WTarg, [search_length, search_width])
+
+        # Add offset to the ri/ro coordinates
+        ri[:,0] += offset[0]
+        ri[:,1] += offset[1]
+        ro[:,0] += offset[0]
+        ro[:,1] += offset[1]
+
+        return ri, ro
+
+    def add_contours(all_contours, centers, ves, ri, ro):
+
+        # Calculate center for the contours
+        xc1, yc1 = np.mean(ri[:,0]), np.mean(ri[:, 1])
+        xc2, yc2 = np.mean(ro[:,0]), np.mean(ro[:, 1])
+        centers[ves][0] = np.mean([xc1, xc2])
+        centers[ves][1] = np.mean([yc1, yc2])
+
+        # Add results to the contours matrix
+        all_contours[(ri[:,1], ri[:,0])] = -ves
+        all_contours[(ro[:,1], ro[:,0])] = ves
+
+def basic_membrane(det_results, width = 15, contour_position = 2, offset_box = 0):
+
+    """
+    Basic membrane segmentation: inner and outer contours at a fixed distance of the detected vesicles
+
+    INPUT:
+        det_results: dictionary, vesicle detection results
+        width: int, width of the membrane in pixels
+        contour_position: int, position of the detected contour on the membrane (0: inside, 1: middle, 2: outside)
+        offset_box: int, offset of the contours from the bounding box (template and floodfill)
+    OUTPUT:
+        rois_membrane: numpy array, [x, y, r_in, r_out] of each vesicle
+    """
+
+    settings_var = plain_settings(width = width, contour_position = contour_position)
+    rois_in, rois_out = BMAsegmentation.run(det_results, settings_var, offset_box)
+
+    return BMAsegmentation.combine_rois(rois_in, rois_out)
+
+def refined_membrane(mat_image, det_results, filter_scale = 6, threshold_low = 0.05, threshold_high = 0.1,
+                    vesicle_threshold = 0.15, search_length = 11, search_width = 4, bbox_margin = 20,
+                    monitor = None):
+
+    """
+    Refined membrane detection: membrane edges from the 2D wavelet transform, chained around each vesicle
+
+    INPUT:
+        mat_image: numpy array, single channel image
+        det_results: dictionary, vesicle detection results
+        filter_scale: float, scale of the wavelet filter
+        threshold_low, threshold_high: float, hysteresis thresholds of the edges (normalised modulus)
+        vesicle_threshold: float, threshold of the edges within each vesicle
+        search_length, search_width: size of the directional search
+        bbox_margin: int, margin of the bounding box of the vesicles
+        monitor: PipelineMonitor, progress and cancellation (optional)
+    OUTPUT:
+        contours: numpy array, inner (-id) and outer (+id) contour of each vesicle
+        centers: numpy array, [x, y] center of each vesicle
+    """
+
+    settings_var = plain_settings(img_filter = filter_scale, vesicle_th = vesicle_threshold,
+                                search_l = search_length, search_w = search_width, bbox_margin = bbox_margin)
+    settings_var['img_th'] = [threshold_low, FrozenVar(threshold_high)]
+    _, (contours, centers) = RMDsegmentation.run(mat_image, det_results, settings_var, monitor)
+
+    return contours, centers
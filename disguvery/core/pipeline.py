@@ -0,0 +1,316 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import os
+import json
+import hashlib
+import pickle
+import zlib
+import types
+import time
+import threading
+import contextlib
+
+import numpy as np
+
+from .instrumentation import measure
+
+def settings_snapshot(settings):
+
+    """
+    Plain copy of a settings structure, with the values of the tkinter variables
+
+    INPUT:
+        settings: dictionary, list or variable (anything with a .get() method)
+    OUTPUT:
+        snapshot: the same structure with plain python values. Dictionary keys are strings
+    """
+
+    if isinstance(settings, dict):
+        return {str(k): settings_snapshot(v) for k, v in settings.items()}
+    if isinstance(settings, (list, tuple)):
+        return [settings_snapshot(v) for v in settings]
+    if isinstance(settings, np.ndarray):
+        return settings.tolist()
+    if hasattr(settings, 'get') and callable(settings.get):
+        # Invalid values of the variables (e.g. empty IntVar) are kept as None
+        try: return settings.get()
+        except Exception: return None
+
+    return settings
+
+class PipelineCancelled(Exception):
+    pass
+
+class PipelineMonitor():
+
+    """
+    Progress, cancellation and timing of the stages of an analysis. The analysis functions take
+    an optional monitor: they open a stage for each step, advance it for each item (vesicle,
+    scale, image...) and check regularly if the analysis has been cancelled, in which case
+    PipelineCancelled is raised. Stages can be nested (e.g. the detection of an image of a batch).
+    The same monitor is used by the interface (see ui_jobs.Job) and by scripts.
+
+    Usage:
+        monitor = PipelineMonitor(callback = lambda stages: print(stages[-1]))
+        with monitor.stage('profiles', total = n_vesicles):
+            for ivesicle in range(n_vesicles):
+                ...
+                monitor.advance()
+        monitor.timings     # {stage: seconds}
+        monitor.cancel()    # from any thread
+    """
+
+    def __init__(self, callback = None, cancel_event = None):
+
+        # Function called with the list of open stages [(name, value, total), ...] on each progress
+        self.callback = callback
+        self.cancel_event = threading.Event() if cancel_event is None else cancel_event
+        self.stages = []
+        self.child_times = []
+        # Time spent in each stage, in seconds
+        self.timings = {}
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+
+        # Stop the analysis if it has been cancelled
+        if self.cancel_event.is_set():
+            raise PipelineCancelled()
+
+    @contextlib.contextmanager
+    def stage(self, name, total = None):
+
+        # Open a stage of total items (None if unknown), timed until it is closed.
+        # The time of the stages opened within it is not counted, such that the timings add up
+        self.check()
+        self.stages.append([name, 0, total])
+        self.child_times.append(0)
+        self.report()
+        t_start = time.perf_counter()
+        try:
+            # The stage is also measured by the instrumentation, if it's recording
+            with measure(name):
+                yield self
+        finally:
+            elapsed = time.perf_counter() - t_start
+            self.timings[name] = self.timings.get(name, 0) + elapsed - self.child_times.pop()
+            self.stages.pop()
+            if self.child_times:
+                self.child_times[-1] += elapsed
+
+    def advance(self, step = 1):
+
+        # One more item of the current stage is done
+        self.check()
+        if self.stages:
+            self.stages[-1][1] += step
+        self.report()
+
+    def report(self):
+
+        if self.callback is not None:
+            self.callback([tuple(s) for s in self.stages])
+
+    def report_timings(self):
+
+        # Print the time spent in each stage
+        for name, seconds in self.timings.items():
+            print(f'{name:>24}: {seconds:.2f} s')
+
+class FrozenVar():
+
+    # Stand-in for a tkinter variable holding a plain value. It can be read and set out of
+    # the main thread, without touching the variables of the interface
+    def __init__(self, value = None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+def plain_settings(**values):
+
+    # Settings dictionary built from plain values, to run the analysis functions without the interface
+    return {k: FrozenVar(v) for k, v in values.items()}
+
+def frozen_settings(settings):
+
+    """
+    Copy of a settings structure where the tkinter variables are replaced by FrozenVar objects
+    with their current value. Unlike settings_snapshot, the structure is kept as it is (keys,
+    lists and values) such that the analysis functions can use it in place of the settings
+
+    INPUT:
+        settings: dictionary, list or variable (anything with a .get() method)
+    OUTPUT:
+        frozen: the same structure, with FrozenVar objects instead of variables
+    """
+
+    if isinstance(settings, dict):
+        return {k: frozen_settings(v) for k, v in settings.items()}
+    if isinstance(settings, (list, tuple)):
+        return type(settings)(frozen_settings(v) for v in settings)
+    if isinstance(settings, np.ndarray):
+        return settings
+    if hasattr(settings, 'get') and callable(settings.get):
+        try: return FrozenVar(settings.get())
+        except Exception: return FrozenVar(None)
+
+    return settings
+
+def frozen_controller(controller):
+
+    """
+    Frozen copy of the data of the application, to run an analysis out of the main thread.
+    The settings and the channels are frozen (see frozen_settings), images and results are
+    shared with the application and should only be read
+
+    INPUT:
+        controller: main application
+    OUTPUT:
+        frozen: object with the same appdata_* attributes as the controller
+    """
+
+    frozen = types.SimpleNamespace()
+    for name, value in vars(controller).items():
+        if name.startswith('appdata_settings') or name in ['appdata_channels', 'appdata_colormap']:
+            setattr(frozen, name, frozen_settings(value))
+        elif name.startswith('appdata_'):
+            setattr(frozen, name, value)
+
+    return frozen
+
+def settings_hash(*items):
+
+    # Hash of settings snapshots (or any value that can be written as json)
+    encoded = json.dumps(items, sort_keys = True, default = str)
+
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+def array_hash(mat_array):
+
+    # Hash of the content of an array
+    mat_array = np.ascontiguousarray(mat_array)
+    content_hash = hashlib.blake2b(digest_size = 20)
+    content_hash.update(str((mat_array.shape, mat_array.dtype.str)).encode())
+    content_hash.update(mat_array.data)
+
+    return content_hash.hexdigest()
+
+def file_hash(filename):
+
+    # Identity of a file from its path, size and modification time. This avoids reading the file
+    file_stat = os.stat(filename)
+
+    return settings_hash(os.path.abspath(filename), file_stat.st_size, file_stat.st_mtime_ns)
+
+class BatchCheckpoint():
+
+    """
+    Checkpoint of a batch campaign, saved in the results folder. For each image, a manifest
+    records the stages that have been completed together with the key of the stage, a hash
+    of the input and of all the settings the stage depends on. The output of the stages is
+    kept next to the manifest, such that an interrupted campaign resumes where it stopped, and
+    a re-run with different settings only recomputes the stages whose key has changed.
+    Each image has its own manifest, such that saving a stage doesn't rewrite the
+    records of the whole campaign.
+
+    Usage:
+        checkpoint = BatchCheckpoint(savedir)
+        found, det_results = checkpoint.load(img_name, 'detection', key)
+        if found is False:
+            det_results = ...
+            checkpoint.save(img_name, 'detection', key, det_results)
+    """
+
+    folder_name = '.disguvery_checkpoint'
+
+    def __init__(self, savedir):
+
+        # Manifests of the images are read when they are first needed, {img_name: {stage: key}}
+        self.folder = os.path.join(savedir, self.folder_name)
+        os.makedirs(self.folder, exist_ok = True)
+        self.manifest = {}
+
+    def image_file(self, img_name, suffix):
+
+        # File of an image in the checkpoint. Image names are hashed to get valid file names
+        img_hash = hashlib.sha1(img_name.encode()).hexdigest()[:16]
+
+        return os.path.join(self.folder, f'{img_hash}_{suffix}')
+
+    def stage_file(self, img_name, stage):
+
+        # File with the output of a stage
+        return self.image_file(img_name, f'{stage}.pkl')
+
+    def image_manifest(self, img_name):
+
+        # Stages completed for the image, {stage: key}
+        if img_name not in self.manifest:
+            try:
+                with open(self.image_file(img_name, 'manifest.json')) as file:
+                    self.manifest[img_name] = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.manifest[img_name] = {}
+
+        return self.manifest[img_name]
+
+    def done(self, img_name, stage, key):
+
+        # Check if the stage of the image has been completed with the same key
+        return self.image_manifest(img_name).get(stage, None) == key
+
+    def load(self, img_name, stage, key):
+
+        # Get the output of a stage, if it has been completed with the same key
+        # Return found (bool), output
+        if self.done(img_name, stage, key) is False:
+            return False, None
+        try:
+            with open(self.stage_file(img_name, stage), 'rb') as file:
+                return True, pickle.loads(zlib.decompress(file.read()))
+        except (FileNotFoundError, zlib.error, pickle.UnpicklingError, EOFError):
+            return False, None
+
+    def save(self, img_name, stage, key, output = None):
+
+        # Save the output of the stage and mark the stage as completed. The output is saved
+        # even if it's None, such that the output of a previous run is never loaded for the new key.
+        # Files are written to a temporary file and renamed, such that a crash never leaves them half written
+        filename = self.stage_file(img_name, stage)
+        with open(filename + '.tmp', 'wb') as file:
+            file.write(zlib.compress(pickle.dumps(output, protocol = pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(filename + '.tmp', filename)
+
+        manifest = self.image_manifest(img_name)
+        manifest[stage] = key
+        filename = self.image_file(img_name, 'manifest.json')
+        with open(filename + '.tmp', 'w') as file:
+            json.dump(manifest, file, indent = 1)
+        os.replace(filename + '.tmp', filename)
@@ -0,0 +1,186 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Intensity profiles of the detected vesicles on numpy arrays, without the interface
+
+from .data_processing import ProfileIntegration
+from .image_processing import ImageCheck, ImageCorrection
+from .pipeline import PipelineMonitor
+
+def bbox_profile(mat_image, rois, ivesicle):
+
+    """
+    Bounding box of a vesicle for the intensity profiles
+
+    INPUT:
+        mat_image: numpy array, single channel image
+        rois: dictionary (vesicle detection results) or numpy array ([x, y, r_in, r_out], membrane segmentation)
+        ivesicle: int, index of the vesicle
+    OUTPUT:
+        image_bbox: numpy array, image within the bounding box
+        bbox_center: list, [x, y, r] center and radius of the vesicle in the bounding box
+        rlim_results: list, [r_in, r_out] radii of the segmented membrane, None for the detection results
+    """
+
+    # The detection results will be a dictionary for the output of vesicle detection
+    if isinstance(rois, dict):
+        [xc, yc, r] = rois['rois'][ivesicle][:3]
+        if 'hough' not in rois['method']:
+            r /= 2
+        rlim_results = None
+    else:
+        [xc, yc] = rois[ivesicle,[0,1]]
+        r = rois[ivesicle, 3]
+        rlim_results = [rois[ivesicle, 2], r]
+
+    # Set bounding box coordinates and center
+    x1, x2 = int(xc - r - 5), int(xc + r + 5)
+    y1, y2 = int(yc - r - 5), int(yc + r + 5)
+    bbox_center = [int(xc-x1), int(yc-y1), r]
+
+    # Get the image only to the bounding box of the detected vesicle
+    image_bbox = mat_image[y1:y2, x1:x2]
+
+    return image_bbox, bbox_center, rlim_results
+
+def channel_image(input_image, channel, bg_corr):
+
+    # Image of a channel, with the background of the whole image corrected if required
+    mat_image = ImageCheck.single_channel(input_image, channel)
+    if 'Image' in bg_corr:
+        mat_image = ImageCorrection.substract_background(mat_image.astype('float16'), corr_type = bg_corr)
+
+    return mat_image
+
+def angular_profiles(input_image, rois, channels = [1], dtheta = 2, norm = False, bg_corr = {},
+                    membrane_channels = [], monitor = None):
+
+    """
+    Angular intensity profiles of all the vesicles
+
+    INPUT:
+        input_image: numpy array, image (single or multi-channel)
+        rois: dictionary (vesicle detection results) or numpy array (membrane segmentation, see bbox_profile)
+        channels: list, channels to integrate (starting at 1)
+        dtheta: int, angular interval in degrees
+        norm: bool, normalise the intensity
+        bg_corr: dictionary, {channel: background correction}, 'None' for the missing channels
+        membrane_channels: list, channels labelling the membrane, integrated between the membrane radii
+        monitor: PipelineMonitor, progress and cancellation (optional)
+    OUTPUT:
+        all_profiles: dictionary, {'ves n': {'mean radius': r, 'ch n': profiles}}
+    """
+
+    if monitor is None:
+        monitor = PipelineMonitor()
+
+    nvesicles = len(rois['rois'] if isinstance(rois, dict) else rois)
+    # Run the computation for all the vesicles.
+    # Initialise variable to store the results
+    all_profiles = {}
+    # Compute for each desired channel
+    for ic in channels:
+        # Get the type of structure labeled with the channel. If membrane, apply rlim
+        if ic in membrane_channels:
+            rlim_channel = True
+        else:
+            rlim_channel = None
+        # Get the image from the corresponding channel
+        ch_bgcorr = bg_corr.get(ic, 'None')
+        mat_image = channel_image(input_image, ic, ch_bgcorr)
+
+        with monitor.stage(f'angular profiles ch {ic}', total = nvesicles):
+            for ivesicle in range(nvesicles):
+                # Get bounding box
+                image_bbox, bbox_center, rlim_results = bbox_profile(mat_image, rois, int(ivesicle))
+                # Set limits to compute segmented membrane radius
+                if rlim_channel is True:
+                    rlim_channel = rlim_results
+
+                # Correct background intensity for the ROI, if required
+                if 'ROI' in ch_bgcorr:
+                    image_bbox = ImageCorrection.substract_background(image_bbox.astype('float16'), corr_type = ch_bgcorr)
+                # Compute angular profiles
+                profiles, mean_radius, _ = ProfileIntegration.angular(image_bbox, bbox_center[0:2], dtheta,
+                                                                    rlim = rlim_channel,
+                                                                    norm = norm,
+                                                                    monitor = monitor)
+                s_vesicle = f'ves {ivesicle + 1}'
+                if s_vesicle not in all_profiles.keys():
+                    all_profiles[s_vesicle] = {'mean radius': mean_radius}
+                all_profiles[s_vesicle][f'ch {ic}'] = profiles
+                monitor.advance()
+
+    return all_profiles
+
+def radial_profiles(input_image, rois, channels = [1], dr = 2, norm = False, norm_radius = False, bg_corr = {},
+                    monitor = None):
+
+    """
+    Radial intensity profiles of all the vesicles
+
+    INPUT:
+        input_image: numpy array, image (single or multi-channel)
+        rois: dictionary (vesicle detection results) or numpy array (membrane segmentation, see bbox_profile)
+        channels: list, channels to integrate (starting at 1)
+        dr: int, radial interval in pixels
+        norm: bool, normalise the intensity
+        norm_radius: bool, normalise the radius by the radius of the vesicle
+        bg_corr: dictionary, {channel: background correction}, 'None' for the missing channels
+        monitor: PipelineMonitor, progress and cancellation (optional)
+    OUTPUT:
+        all_profiles: dictionary, {'ves n': {'ch n': profiles}}
+    """
+
+    if monitor is None:
+        monitor = PipelineMonitor()
+
+    nvesicles = len(rois['rois'] if isinstance(rois, dict) else rois)
+    # Run the computation for all the vesicles.
+    # Initialise variable to store the results
+    all_profiles = {}
+
+    # Compute for each desired channel
+    for ic in channels:
+        # Get the image from the corresponding channel
+        ch_bgcorr = bg_corr.get(ic, 'None')
+        mat_image = channel_image(input_image, ic, ch_bgcorr)
+        with monitor.stage(f'radial profiles ch {ic}', total = nvesicles):
+            for ivesicle in range(nvesicles):
+                # Get bounding box
+                image_bbox, bbox_center, rlim_results = bbox_profile(mat_image, rois, int(ivesicle))
+
+                # Correct background intensity for the ROI, if required
+                if 'ROI' in ch_bgcorr:
+                    image_bbox = ImageCorrection.substract_background(image_bbox.astype('float16'), corr_type = ch_bgcorr)
+                # Compute the radial profiles
+                profiles, found_error = ProfileIntegration.radial(image_bbox, bbox_center[0:2], dr,
+                                                                norm = norm, monitor = monitor)
+                # If required, normalise the radius
+                if norm_radius is True:
+                    profiles[:,0] /= bbox_center[-1]
+
+                s_vesicle = f'ves {ivesicle + 1}'
+                if s_vesicle not in all_profiles.keys():
+                    all_profiles[s_vesicle] = { }
+                all_profiles[s_vesicle][f'ch {ic}'] = profiles
+                monitor.advance()
+
+    return all_profiles
@@ -0,0 +1,237 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import io
+import sqlite3
+import zlib
+import time
+
+import numpy as np
+
+from .file_handling import ProfileWriter, LabelMask
+
+class ResultsStore():
+
+    """
+    Append-only results store of a campaign, in a single SQLite database. Each batch run
+    adds a run, and the results of every image are written in a single transaction, such
+    that an interrupted run never leaves an image half written.
+
+    Tables:
+        runs: id_run, started, det_method
+        images: id_image, id_run, name, directory
+        vesicles: id_image, id_vesicle, xc, yc, radius, size, score, ellipticity
+                    (radius is the radius for all methods, size is the size as detected)
+        profiles: id_image, id_vesicle, profile ('radial' or 'angular'), channel, position,
+                    mean_intensity, min_intensity, max_intensity, sum_intensity
+        contours: id_image, id_vesicle, theta, r_inner, r_outer
+        encapsulation: id_image, channel, roi, xc, yc, mean_intensity, area
+        masks: id_image, kind, channel, height, width, dtype, data (run-length encoded labels
+                    for the regions, zlib compressed for the other masks)
+
+    Usage:
+        store = ResultsStore(filename)
+        store.start_run('hough')
+        store.add_image(img_name, img_dir, det_results, profiles_results, encap_results)
+        rows = store.query('SELECT * FROM vesicles WHERE radius > ?', (20,))
+        store.close()
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS runs (id_run INTEGER PRIMARY KEY, started TEXT, det_method TEXT);
+        CREATE TABLE IF NOT EXISTS images (id_image INTEGER PRIMARY KEY, id_run INTEGER REFERENCES runs(id_run),
+                                        name TEXT, directory TEXT);
+        CREATE TABLE IF NOT EXISTS vesicles (id_image INTEGER REFERENCES images(id_image), id_vesicle INTEGER,
+                                        xc REAL, yc REAL, radius REAL, size REAL, score REAL, ellipticity REAL);
+        CREATE TABLE IF NOT EXISTS profiles (id_image INTEGER REFERENCES images(id_image), id_vesicle INTEGER,
+                                        profile TEXT, channel INTEGER, position REAL, mean_intensity REAL,
+                                        min_intensity REAL, max_intensity REAL, sum_intensity REAL);
+        CREATE TABLE IF NOT EXISTS contours (id_image INTEGER REFERENCES images(id_image), id_vesicle INTEGER,
+                                        theta REAL, r_inner REAL, r_outer REAL);
+        CREATE TABLE IF NOT EXISTS encapsulation (id_image INTEGER REFERENCES images(id_image), channel INTEGER,
+                                        roi INTEGER, xc REAL, yc REAL, mean_intensity REAL, area REAL);
+        CREATE TABLE IF NOT EXISTS masks (id_image INTEGER REFERENCES images(id_image), kind TEXT, channel INTEGER,
+                                        height INTEGER, width INTEGER, dtype TEXT, data BLOB);
+        CREATE INDEX IF NOT EXISTS idx_images_name ON images (name);
+        CREATE INDEX IF NOT EXISTS idx_vesicles_image ON vesicles (id_image, id_vesicle);
+        CREATE INDEX IF NOT EXISTS idx_vesicles_radius ON vesicles (radius);
+        CREATE INDEX IF NOT EXISTS idx_profiles_vesicle ON profiles (id_image, id_vesicle, profile, channel);
+        CREATE INDEX IF NOT EXISTS idx_contours_vesicle ON contours (id_image, id_vesicle);
+        CREATE INDEX IF NOT EXISTS idx_encapsulation_image ON encapsulation (id_image, channel);
+        CREATE INDEX IF NOT EXISTS idx_masks_image ON masks (id_image, kind);
+        """
+
+    def __init__(self, filename):
+
+        # Open (or create) the database
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        # Write-ahead log: readers are not blocked while a run is being written
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(self.schema)
+        self.id_run = None
+
+    def start_run(self, det_method = None):
+
+        # Add a new run, to which the images are added
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO runs (started, det_method) VALUES (?, ?)',
+                                        (time.strftime('%Y-%m-%d %H:%M:%S'), det_method))
+        self.id_run = cursor.lastrowid
+
+        return self.id_run
+
+    def add_image(self, img_name, img_dir = None, det_results = None, profiles_results = None, encap_results = None):
+
+        """
+        Add the results of one image, in a single transaction
+
+        INPUT:
+            img_name: string, name of the image
+            img_dir: string, directory of the image
+            det_results: dictionary, results of the vesicle detection
+            profiles_results: dictionary, intensity profiles as returned by BatchRun.run
+            encap_results: dictionary, {channel: [encapsulation results, masked image]}
+        OUTPUT:
+            id_image: int, identifier of the image in the store
+        """
+
+        if self.id_run is None:
+            self.start_run(None if det_results is None else det_results['method'])
+
+        # The transaction is committed at the end of the block, or rolled back on error
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO images (id_run, name, directory) VALUES (?, ?, ?)',
+                                        (self.id_run, img_name, img_dir))
+            id_image = cursor.lastrowid
+
+            if det_results is not None:
+                self.insert_vesicles(id_image, det_results)
+                mask_rois = det_results.get('mask_rois', None)
+                if mask_rois is not None:
+                    self.insert_mask(id_image, 'regions', None, mask_rois)
+            if profiles_results is not None:
+                self.insert_profiles(id_image, profiles_results)
+            if encap_results is not None:
+                for k, v in encap_results.items():
+                    self.insert_encapsulation(id_image, k, v[0])
+                    self.insert_mask(id_image, 'encapsulation', ResultsStore.channel_number(k), v[1])
+
+        return id_image
+
+    def channel_number(channel):
+
+        # Get the number of the channel from its key ('ch N')
+        return int(str(channel).split(' ')[-1])
+
+    def insert_vesicles(self, id_image, det_results):
+
+        # Get detection method and detected vesicles
+        det_method = det_results['method']
+        rois = np.asarray(det_results['rois'], dtype = float)
+        n_vesicles = rois.shape[0]
+        none_column = [None]*n_vesicles
+
+        # The size is the radius for Hough detection, and the diameter (or major axis) otherwise
+        size = rois[:,2]
+        radius = size if det_method == 'hough' else size/2
+        score = rois[:,3].tolist() if (det_method == 'template' and rois.shape[1] > 3) else none_column
+        ellipticity = det_results.get('ellipticity', None)
+        ellipticity = none_column if ellipticity is None else np.asarray(ellipticity, dtype = float).tolist()
+
+        rows = zip([id_image]*n_vesicles, np.asarray(det_results['id_vesicle']).astype(int).tolist(),
+                    rois[:,0].tolist(), rois[:,1].tolist(), radius.tolist(), size.tolist(), score, ellipticity)
+        self.connection.executemany('INSERT INTO vesicles VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def insert_profiles(self, id_image, profiles_results):
+
+        # Insert the profiles block by block, as they are exported to the CSV files
+        for output, block in ProfileWriter.blocks(profiles_results):
+            if output == 'contours':
+                rows = ((id_image, int(b[0]), *b[1:]) for b in block.tolist())
+                self.connection.executemany('INSERT INTO contours VALUES (?, ?, ?, ?, ?)', rows)
+            else:
+                rows = ((id_image, int(b[0]), output, int(b[1]), *b[2:]) for b in block.tolist())
+                self.connection.executemany('INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def insert_encapsulation(self, id_image, channel, encap_results):
+
+        # Insert the encapsulation results of one channel: [roi, xc, yc, <I>, A]
+        nch = ResultsStore.channel_number(channel)
+        rows = ((id_image, nch, int(r[0]), *r[1:5]) for r in np.asarray(encap_results, dtype = float).tolist())
+        self.connection.executemany('INSERT INTO encapsulation VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def insert_mask(self, id_image, kind, channel, mask):
+
+        # Label masks (regions) are stored run-length encoded (see LabelMask), other masks
+        # as compressed blobs, with their shape and type to read them back
+        if kind == 'regions':
+            buffer = io.BytesIO()
+            LabelMask.save(buffer, mask)
+            dtype, data = 'rle', buffer.getvalue()
+        else:
+            mask = np.ascontiguousarray(mask)
+            dtype, data = mask.dtype.str, zlib.compress(mask.tobytes(), 6)
+        self.connection.execute('INSERT INTO masks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (id_image, kind, channel, mask.shape[0], mask.shape[1], dtype, data))
+
+    def mask(self, id_image, kind = 'regions', channel = None, as_labelmask = False):
+
+        """
+        Read a mask of an image
+
+        INPUT:
+            id_image: int, identifier of the image
+            kind: string, 'regions' or 'encapsulation'
+            channel: int, channel of the encapsulation mask
+            as_labelmask: bool, return the LabelMask of the regions, to read them one by one
+        OUTPUT:
+            mask: numpy array (or LabelMask), None if not found
+        """
+
+        row = self.connection.execute('SELECT height, width, dtype, data FROM masks WHERE id_image = ? AND kind = ? AND channel IS ?',
+                                (id_image, kind, channel)).fetchone()
+        if row is None:
+            return None
+        height, width, dtype, data = row
+
+        if dtype == 'rle':
+            label_mask = LabelMask(io.BytesIO(data))
+            return label_mask if as_labelmask is True else label_mask.image()
+
+        return np.frombuffer(zlib.decompress(data), dtype = dtype).reshape(height, width)
+
+    def query(self, sql, parameters = ()):
+
+        # Run a query on the store and return all the rows
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+
+        # Close the database
+        self.connection.close()
+        print(f'Results stored in {self.filename}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,192 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .pipeline import settings_hash
+
+class StageCache():
+
+    """
+    Disk-backed cache of the intermediate results of the analysis stages (enhanced images,
+    detection results, membrane masks...). Entries are keyed by the hash of the content of
+    the input image, the name of the stage and its parameters, such that the same stage run
+    on the same image with the same parameters is only computed once, whichever panel or
+    batch run asks for it. The total size of the cache is bounded, and the least recently
+    used entries are evicted first.
+
+    The cache is disabled unless it's enabled in the settings: the outputs are then computed
+    every time. Outputs with arrays larger than max_entry_size (e.g. the wavelet transform of a
+    large image) are never cached, as writing them to disk costs more than computing them.
+    The cache can be used from the interface and from the batch thread at the same time.
+
+    Usage:
+        cache = StageCache(folder, max_size = 1024**3, enabled = True)
+        output = cache.cached(array_hash(mat_image), 'stage', params, compute)
+    """
+
+    default_folder = os.path.join(os.path.expanduser('~'), '.cache', 'disguvery')
+
+    def __init__(self, folder = None, max_size = 1024**3, max_entry_size = 64*1024**2, enabled = False):
+
+        # Folder and maximum size of the cache and of each entry, in bytes. A maximum size of 0 disables the cache
+        self.folder = self.default_folder if folder is None else folder
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.enabled = enabled
+        self.hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+
+        # Index of the entries {key: size}, from the least to the most recently used.
+        # The folder is only read once the cache is used
+        self.entries = OrderedDict()
+        self.total_size = 0
+        self.indexed = False
+
+    def active(self):
+
+        # Check if the cache is used
+        return self.enabled and self.max_size > 0
+
+    def read_index(self):
+
+        # Read the entries found in the folder, from the least to the most recently used
+        if self.indexed is True:
+            return
+        self.indexed = True
+        os.makedirs(self.folder, exist_ok = True)
+        found = []
+        for filename in os.listdir(self.folder):
+            if filename.endswith('.pkl'):
+                file_stat = os.stat(os.path.join(self.folder, filename))
+                found.append((file_stat.st_mtime, filename[:-4], file_stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_size += size
+
+    def key(content_hash, stage, params):
+
+        # Key of an entry
+        return settings_hash(content_hash, stage, params)
+
+    def entry_file(self, key):
+
+        return os.path.join(self.folder, f'{key}.pkl')
+
+    def array_size(output):
+
+        # Size in bytes of the arrays of an output (arrays, or dictionaries, lists and tuples of them)
+        if isinstance(output, np.ndarray):
+            return output.nbytes
+        if isinstance(output, dict):
+            return sum(StageCache.array_size(v) for v in output.values())
+        if isinstance(output, (list, tuple)):
+            return sum(StageCache.array_size(v) for v in output)
+        return 0
+
+    def get(self, content_hash, stage, params):
+
+        # Get an entry, return found (bool), output. Inputs without hash (None) are never cached
+        if not self.active() or content_hash is None:
+            return False, None
+        key = StageCache.key(content_hash, stage, params)
+        with self.lock:
+            self.read_index()
+            if key not in self.entries:
+                self.misses += 1
+                return False, None
+            try:
+                with open(self.entry_file(key), 'rb') as file:
+                    output = pickle.load(file)
+            except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+                # The entry has been removed (or is corrupted), drop it from the index
+                self.total_size -= self.entries.pop(key)
+                self.misses += 1
+                return False, None
+
+            # Mark the entry as the most recently used one
+            os.utime(self.entry_file(key))
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return True, output
+
+    def put(self, content_hash, stage, params, output):
+
+        # Add an entry, if it fits in the cache, and evict the least recently used ones
+        if not self.active() or content_hash is None or StageCache.array_size(output) > self.max_entry_size:
+            return
+        key = StageCache.key(content_hash, stage, params)
+        data = pickle.dumps(output, protocol = pickle.HIGHEST_PROTOCOL)
+        if len(data) > min(self.max_size, self.max_entry_size):
+            return
+
+        with self.lock:
+            self.read_index()
+            # Write to a temporary file and rename, such that entries are never half written
+            filename = self.entry_file(key)
+            with open(filename + '.tmp', 'wb') as file:
+                file.write(data)
+            os.replace(filename + '.tmp', filename)
+            self.total_size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.evict(self.max_size)
+
+    def evict(self, max_size):
+
+        # Remove the least recently used entries until the cache fits in max_size. Called with the lock held
+        while self.total_size > max_size and self.entries:
+            key, size = self.entries.popitem(last = False)
+            self.total_size -= size
+            try: os.remove(self.entry_file(key))
+            except FileNotFoundError: pass
+
+    def cached(self, content_hash, stage, params, compute):
+
+        """
+        Get the output of a stage from the cache, or compute it and add it to the cache
+
+        INPUT:
+            content_hash: string, hash of the input of the stage (see pipeline.array_hash), None to skip the cache
+            stage: string, name of the stage
+            params: parameters of the stage (settings snapshot, or any value that can be written as json)
+            compute: function without arguments that computes the output of the stage
+        OUTPUT:
+            output: output of the stage
+        """
+
+        found, output = self.get(content_hash, stage, params)
+        if found is False:
+            output = compute()
+            self.put(content_hash, stage, params, output)
+
+        return output
+
+    def clear(self):
+
+        # Remove all the entries
+        with self.lock:
+            self.read_index()
+            self.evict(0)
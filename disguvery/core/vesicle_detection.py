@@ -0,0 +1,516 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+# 
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with 
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+# The scientific modules are imported on first use (see lazy_import)
+from .lazy_import import LazyModule
+cv2 = LazyModule('cv2')
+ndimage = LazyModule('scipy.ndimage')
+measure = LazyModule('skimage.measure')
+morphology = LazyModule('skimage.morphology')
+
+from .image_processing import ImageMask, ImageType
+from .data_processing import RoiIndex
+from .pipeline import PipelineMonitor
+from .instrumentation import instrumented
+
+class VesicleDetection():
+
+    @instrumented('hough')
+    def hough(mat_image, det_settings, monitor = None):
+
+        # Run the coarse-to-fine detection if a downsampling factor has been set
+        try:
+            downsample = int(det_settings['hough_downsample'].get())
+        except KeyError:
+            downsample = 1
+        if downsample > 1:
+            return VesicleDetection.hough_pyramid(mat_image, det_settings, downsample, monitor)
+        if monitor is None:
+            monitor = PipelineMonitor()
+        monitor.check()
+
+        # Convert image to uint8 -> NECESSARY for Hough Circle to work!
+        mat_image = VesicleDetection.image_uint8(mat_image)
+
+        # Get parameters
+        p1 = int(det_settings['hough_eth'].get())
+        p2 = int(det_settings['hough_hth'].get())
+        mindist = int(det_settings['hough_mindist'].get())
+        rmin = int(det_settings['hough_minrad'].get())
+        rmax = int(det_settings['hough_maxrad'].get())
+
+        # Detect circles in image
+        circles = cv2.HoughCircles(mat_image, cv2.HOUGH_GRADIENT, 1, 
+                                mindist, param1 = p1, param2 = p2, 
+                                minRadius = rmin, maxRadius = rmax)
+
+        try:
+            det_circles = circles[0,:]
+        except TypeError:
+            det_circles = None
+
+        # Return detected circles in the right format
+        return det_circles
+
+    @instrumented('hough pyramid')
+    def hough_pyramid(mat_image, det_settings, downsample = 2, monitor = None):
+
+        """
+        Coarse-to-fine Hough detection. Circles are detected on a downsampled
+        version of the image, and each circle is refined at full resolution
+        within a local window around the coarse estimate.
+
+        INPUT:
+            mat_image: numpy array, single channel image
+            det_settings: dictionary, vesicle detection settings
+            downsample: int, downsampling factor of the coarse level (2 or 4)
+            monitor: PipelineMonitor, progress (per circle) and cancellation
+        OUTPUT:
+            det_circles: numpy array, [xc, yc, r] of the detected circles,
+                        None if no circles have been found
+        """
+
+        if monitor is None:
+            monitor = PipelineMonitor()
+        monitor.check()
+
+        # Convert image to uint8 -> NECESSARY for Hough Circle to work!
+        mat_image = VesicleDetection.image_uint8(mat_image)
+
+        # Get parameters
+        p1 = int(det_settings['hough_eth'].get())
+        p2 = int(det_settings['hough_hth'].get())
+        mindist = int(det_settings['hough_mindist'].get())
+        rmin = int(det_settings['hough_minrad'].get())
+        rmax = int(det_settings['hough_maxrad'].get())
+
+        # Downsample the image. Area interpolation averages the pixels, keeping thin membranes visible
+        coarse_image = cv2.resize(mat_image, None, fx = 1/downsample, fy = 1/downsample,
+                                interpolation = cv2.INTER_AREA)
+
+        # Scale the parameters to the coarse level. The accumulator votes scale with the
+        # circumference of the circles, so the hough threshold is scaled as well
+        circles = cv2.HoughCircles(coarse_image, cv2.HOUGH_GRADIENT, 1,
+                                max(1, mindist/downsample), param1 = p1,
+                                param2 = max(1, int(p2/downsample)),
+                                minRadius = max(1, int(rmin/downsample)),
+                                maxRadius = max(1, int(np.ceil(rmax/downsample))))
+
+        try:
+            coarse_circles = circles[0,:]*downsample
+        except TypeError:
+            return None
+
+        # Refine each circle at full resolution
+        det_circles = np.zeros_like(coarse_circles)
+        with monitor.stage('refining circles', total = len(coarse_circles)):
+            for ic, circle in enumerate(coarse_circles):
+                det_circles[ic] = VesicleDetection.hough_refine(mat_image, circle, downsample, p1, p2)
+                monitor.advance()
+
+        return det_circles
+
+    def hough_refine(mat_image, circle, search_range, p1, p2):
+
+        # Refine a single circle within a local window of the uint8 image
+        xc, yc, r = circle[:3]
+        # The window covers the circle and the uncertainty of the coarse level
+        half_size = int(np.ceil(r + 2*search_range)) + 2
+        x1, x2 = max(0, int(xc) - half_size), min(mat_image.shape[1], int(xc) + half_size + 1)
+        y1, y2 = max(0, int(yc) - half_size), min(mat_image.shape[0], int(yc) + half_size + 1)
+        window = mat_image[y1:y2, x1:x2]
+
+        # Only look for circles with radius close to the coarse estimate
+        circles = cv2.HoughCircles(window, cv2.HOUGH_GRADIENT, 1,
+                                max(1, search_range), param1 = p1, param2 = max(1, int(p2/2)),
+                                minRadius = max(1, int(r - search_range)),
+                                maxRadius = int(np.ceil(r + search_range)))
+
+        # If nothing is found, keep the coarse estimate
+        try:
+            candidates = circles[0,:]
+        except TypeError:
+            return circle[:3]
+
+        # Keep the candidate closest to the coarse estimate
+        candidates[:,0] += x1
+        candidates[:,1] += y1
+        dist = np.hypot(candidates[:,0] - xc, candidates[:,1] - yc)
+        if np.min(dist) > 2*search_range:
+            return circle[:3]
+
+        return candidates[np.argmin(dist), :3]
+
+    @instrumented('subpixel refinement')
+    def refine_subpixel(mat_image, rois, det_method = 'hough', n_rays = 64, n_samples = 41, n_iter = 2,
+                        max_shift = 0.5, max_change = 0.25):
+
+        """
+        Sub-pixel refinement of the detected vesicles. The image is sampled along
+        rays around each vesicle (all vesicles in a single interpolation call),
+        the membrane peak is located on each ray, and a circle with a second
+        order harmonic is fitted to the radial position of the peaks.
+
+        INPUT:
+            mat_image: numpy array, single channel image (membrane enhanced)
+            rois: numpy array, detected vesicles [xc, yc, s, ...]
+            det_method: string, detection method. For 'hough', s is the radius,
+                        for the other methods, s is the size of the vesicle
+            n_rays: int, number of rays per vesicle
+            n_samples: int, number of samples along each ray
+            n_iter: int, number of iterations re-centering the rays
+            max_shift: float, largest shift of the centre, relative to the radius
+            max_change: float, largest change of the radius, relative to the radius
+        OUTPUT:
+            refined: numpy array, [xc, yc, r, ellipticity] for each vesicle.
+                        Vesicles that could not be fitted, or whose fit moved further
+                        than max_shift or max_change, keep their input values
+        """
+
+        # Get the centre and the radius of all the vesicles
+        rois = np.asarray(rois, dtype = float)
+        xc, yc = rois[:,0].copy(), rois[:,1].copy()
+        if det_method == 'hough':
+            r = rois[:,2].copy()
+        else:
+            r = rois[:,2]/2
+        ellipticity = np.zeros_like(r)
+        fitted = np.zeros(len(r), dtype = bool)
+
+        # Angles of the rays and design matrix of the fit:
+        # r(theta) = r0 + dx cos(theta) + dy sin(theta) + a cos(2 theta) + b sin(2 theta)
+        theta = np.linspace(0, 2*np.pi, n_rays, endpoint = False)
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        design = np.stack((np.ones(n_rays), cos_t, sin_t, np.cos(2*theta), np.sin(2*theta)), axis = 1)
+        # Normalised positions along each ray, from -1 to 1 around the current radius
+        s_ray = np.linspace(-1, 1, n_samples)
+
+        mat_image = ImageType.as_float32(mat_image)
+
+        for _ in range(n_iter):
+            # Search window along the ray, proportional to the radius
+            half_width = np.maximum(3, 0.25*r)
+            radius_ray = r[:,None] + half_width[:,None]*s_ray[None,:]
+            # Coordinates of all the samples [vesicle, ray, sample]
+            x_ray = xc[:,None,None] + radius_ray[:,None,:]*cos_t[None,:,None]
+            y_ray = yc[:,None,None] + radius_ray[:,None,:]*sin_t[None,:,None]
+            profiles = ndimage.map_coordinates(mat_image, [y_ray.ravel(), x_ray.ravel()],
+                                            order = 1, mode = 'nearest').reshape(x_ray.shape)
+
+            # Peak of each ray, interpolated with a parabola through the neighbours
+            ind_peak = np.argmax(profiles, axis = 2)
+            valid = (ind_peak > 0) & (ind_peak < n_samples - 1)
+            ind_peak = np.clip(ind_peak, 1, n_samples - 2)
+            p_prev = np.take_along_axis(profiles, (ind_peak - 1)[..., None], axis = 2)[..., 0]
+            p_peak = np.take_along_axis(profiles, ind_peak[..., None], axis = 2)[..., 0]
+            p_next = np.take_along_axis(profiles, (ind_peak + 1)[..., None], axis = 2)[..., 0]
+            curvature = p_prev - 2*p_peak + p_next
+            valid &= curvature < 0
+            offset = np.where(valid, 0.5*(p_prev - p_next)/np.where(valid, curvature, -1), 0)
+            # Discard rays where the peak is not above the background of the ray
+            valid &= p_peak > np.median(profiles, axis = 2)
+
+            # Radial position of the membrane on each ray
+            step = 2*half_width/(n_samples - 1)
+            r_peak = r[:,None] - half_width[:,None] + (ind_peak + offset)*step[:,None]
+
+            # Weighted least squares for all vesicles at once
+            weights = valid.astype(float)
+            normal_mat = np.einsum('vt,ti,tj->vij', weights, design, design)
+            normal_vec = np.einsum('vt,ti,vt->vi', weights, design, r_peak)
+            # Only fit the vesicles with enough valid rays
+            fit_ok = np.sum(valid, axis = 1) >= max(8, n_rays/4)
+            if not np.any(fit_ok):
+                break
+            coef = np.linalg.solve(normal_mat[fit_ok], normal_vec[fit_ok][..., None])[..., 0]
+
+            # Update centre and radius. The first harmonic is the shift of the centre
+            xc[fit_ok] += coef[:,1]
+            yc[fit_ok] += coef[:,2]
+            r[fit_ok] = coef[:,0]
+            # The second harmonic gives the semi-axes r0 +/- amplitude
+            amplitude = np.hypot(coef[:,3], coef[:,4])
+            ellipticity[fit_ok] = 2*amplitude/(coef[:,0] + amplitude)
+            fitted |= fit_ok
+
+        # Fits that moved too far from the detection (e.g. locked on a neighbouring vesicle) are rejected
+        r_input = rois[:,2] if det_method == 'hough' else rois[:,2]/2
+        fitted &= np.hypot(xc - rois[:,0], yc - rois[:,1]) <= max_shift*r_input
+        fitted &= np.abs(r - r_input) <= max_change*r_input
+
+        # Vesicles that could not be fitted keep their input values
+        refined = np.stack((xc, yc, r, ellipticity), axis = 1)
+        refined[~fitted] = np.stack((rois[~fitted, 0], rois[~fitted, 1], r_input[~fitted],
+                                    np.zeros(np.sum(~fitted))), axis = 1)
+
+        return refined
+
+    @instrumented('template matching')
+    def template(mat_image, template_image, det_settings, monitor = None):
+
+        if monitor is None:
+            monitor = PipelineMonitor()
+
+        # convert image and template to uint8 -> NECESSARY for Template Matching to work!
+        # (it also works for float32, but we force it here to uint8 for simplicity)
+        mat_image = VesicleDetection.image_uint8(mat_image)
+        template_image = VesicleDetection.image_uint8(template_image)
+
+        # Get parameters
+        min_resize = float(det_settings['template_minre'].get())
+        max_resize = float(det_settings['template_maxre'].get())
+        number_scales = int(det_settings['template_nscales'].get())
+        threshold = float(det_settings['template_thmatch'].get())
+
+        # Define array of scales for multiscale detection
+        a_scale = np.linspace(min_resize, max_resize, number_scales)
+        a_scale = [round(x,2) for x in a_scale]
+        # Initialize variables
+        cx = [] # Center in x
+        cy = [] # Center in y
+        ca = [] # Scale
+        match = []  # Match
+
+        # Loop for multiscale detection
+        with monitor.stage('template scales', total = len(a_scale)):
+            for a in a_scale:
+                # Resize template according to scale
+                template = cv2.resize(template_image, None, fx = a, fy = a)
+                w, h = template.shape[::-1]
+                # If template is bigget ahn the image, break the loop
+                if (w >= mat_image.shape[0]) or (h >= mat_image.shape[1]):
+                    break
+
+                # Apply template matching
+                match_output = cv2.matchTemplate(mat_image, template, cv2.TM_CCOEFF_NORMED)
+
+                # Only select the locations that are above the threshold
+                match_select = np.where(match_output >= threshold)
+
+                # Add the results at the current scale
+                cx.extend(match_select[1] + w/2) 
+                cy.extend(match_select[0] + h/2) 
+                ca.extend(w + 0*match_select[1])
+                match.extend(match_output[match_select[0], match_select[1]])
+                monitor.advance()
+
+        # Transform lists into numpy arrays
+        cx = np.array(cx)
+        cy = np.array(cy)
+        ca = np.array(ca)
+        match = np.array(match)
+
+        # Filter the results by discarding overlaping bounding boxes
+        accepted = VesicleDetection.filter_overlaps(cx, cy, ca, match, mat_image.shape)
+        new_xc = [int(x) for x in cx[accepted]]
+        new_yc = [int(x) for x in cy[accepted]]
+        new_bbox = [int(x) for x in ca[accepted]]
+        new_match = list(match[accepted])
+
+        # Filtered values of center in x,y and bounding box size
+        if len(new_xc) < 1:
+            match_results = None
+        else: 
+            match_results = np.stack((np.array(new_xc), np.array(new_yc),
+                                    np.array(new_bbox), np.array(new_match)), axis = 1)
+       
+        # Return bounding boxes for the detected objects and the bounding box matching score
+        return match_results
+        
+    def filter_overlaps(cx, cy, ca, match, mat_shape):
+
+        """
+        Discard the matches falling within the bounding box of a better match. The matches are
+        visited by decreasing matching value, and each accepted bounding box discards all the
+        remaining matches within it, which are found with a spatial index of the matches
+
+        INPUT:
+            cx, cy: numpy arrays, center of the matches
+            ca: numpy array, size of the bounding box of the matches
+            match: numpy array, matching value
+            mat_shape: tuple, shape of the image, the bounding boxes are clipped to the image
+        OUTPUT:
+            accepted: numpy array, index of the accepted matches, by decreasing matching value
+        """
+
+        # Order results by matching value
+        ind_sort = np.argsort(match)[::-1]
+        fx = cx[ind_sort].astype(int)
+        fy = cy[ind_sort].astype(int)
+        bbox = ca[ind_sort].astype(int)
+        sort_match = match[ind_sort]
+        index = RoiIndex(np.stack((fx, fy), axis = 1), 'center')
+
+        # Matches still to visit
+        remaining = np.ones(len(fx), dtype = bool)
+        accepted = []
+        i = 0
+        while i < len(fx):
+            # Next match still to visit
+            i += int(np.argmax(remaining[i:]))
+            if remaining[i] == False:
+                break
+            accepted.append(i)
+            remaining[i] = False
+            # Boxes with a zero matching value don't discard any match
+            if sort_match[i] == 0:
+                continue
+
+            # Bounding box of the match, clipped to the image
+            x, y, s = fx[i], fy[i], bbox[i]
+            x1, x2 = max(int(x - s/2), 0), min(int(x + s/2), mat_shape[1])
+            y1, y2 = max(int(y - s/2), 0), min(int(y + s/2), mat_shape[0])
+            inside = index.in_box(x1, x2 - 1, y1, y2 - 1)
+            remaining[inside] = False
+
+        return ind_sort[np.array(accepted, dtype = int)]
+
+    @instrumented('floodfill')
+    def floodfill(mat_image, det_settings, monitor = None):
+
+        if monitor is None:
+            monitor = PipelineMonitor()
+
+        # Get parameters
+        threshold = float(det_settings['flood_th'].get())
+        min_area = float(det_settings['flood_minarea'].get())
+        min_area = min_area**2
+
+        # Threshold the image
+        image_th = ImageMask.threshold(mat_image, threshold)
+
+        # Get seedpoint for floodfilling. The seed should be localted in outer aqueous phase, and not 
+        # within vesicle. Take 10 seedpoints along the x-direction to find which one gives the most flooded pixels
+        h, w = image_th.shape[:2]
+        seed_xs = np.linspace(2, w, 10).astype(int)
+
+        # Initialise iteration
+        pixels_flooded_current = 0
+        seed_point_current = (0,0)
+
+        # For each seed point, track number of pixels that is flooded
+        with monitor.stage('seed points', total = len(seed_xs)):
+            for seed_x in seed_xs:
+                seed_point = (seed_x-1,0)
+                # Flood the image with the current seedpoint
+                flooded_img = VesicleDetection.flood(image_th, seed_point)      
+                # Count number of flooded pixels
+                pixels_flooded_next = np.sum((flooded_img>0).astype(int))
+
+                # If number of flooded pixels has increased, keep the seedpoint
+                if pixels_flooded_next > pixels_flooded_current:
+                    seed_point_current = seed_point
+                    pixels_flooded_current = pixels_flooded_next
+                monitor.advance()
+
+        # First floodfilling to find the vesicle contour
+        flooded_outer = VesicleDetection.flood(image_th, seed_point_current)
+        # Interior: 0, membranes: 1, exterior: 255
+        # Only keep the ineer area: remove membrane and exterior
+        inner_holes = (flooded_outer == 0).astype(int)
+        # Second floodfilling to fill the holes
+        flooded_outer_rep = inner_holes.copy().astype('uint8')
+        flooded_outer_rep = VesicleDetection.flood(flooded_outer_rep, seed_point_current)
+        # Non-flooded pixels are vesicle lumen
+        inner = (flooded_outer_rep < 255).astype(int)
+        inner = inner.astype('uint8')
+
+        # Connect points and label them
+        img_label = measure.label(inner, background = 0)
+        img_label = morphology.remove_small_objects(img_label, min_size = min_area, connectivity = 1)
+
+        # Relabel the vesicles
+        mask_labels = 0*img_label
+        new_id = 0
+        # Relabel the vesicles
+        ves_labels = np.unique(img_label.flatten())[1:]
+        with monitor.stage('labelling vesicles', total = len(ves_labels)):
+            for ves_label in ves_labels:
+                new_id += 1
+                mask_labels[img_label == ves_label] = new_id
+                monitor.advance()
+        
+        # Get the centroids for each vesicle
+        props = measure.regionprops(mask_labels)
+        x_all = []; y_all = []; amajor = []
+        for region in sorted(props, key = lambda r: r.label):
+            y, x = region.centroid
+            amajor.append(region.major_axis_length)
+            x_all.append(x)
+            y_all.append(y)
+        # Transform lists to numpy arrays
+        amajor = np.array(amajor)
+        x_all = np.array(x_all)
+        y_all = np.array(y_all)
+
+        if len(amajor) >= 1:
+            floodfill_results = np.stack((x_all, y_all, amajor), axis = 1)
+        else:
+            floodfill_results = None
+
+        return floodfill_results, mask_labels
+
+    def flood(image_th, seed_point):
+
+        # Copy the image to prevent cv2 of destroying it
+        image_fill = image_th.copy()
+        # Get shape of image
+        h, w = image_fill.shape
+
+        # Create empty mask that is one pixel wider on each side
+        mask = np.zeros((h+2, w+2), np.uint8)
+
+        # Create flooded image
+        _, flooded_img, _, _ = cv2.floodFill(image_fill, mask, seed_point, 255)
+
+        return flooded_img
+
+    def image_uint8(mat_image):
+
+        # Convert image to uint8 -> NECESSARY for detection methods to work
+        # Sometimes it can also work with float32, but we force it to uint8 for simplicity
+        # The range [0, max] of the image is mapped to [0, 255], without overflow at the max pixel
+        mat_image = ImageType.rescale(mat_image, 'uint8')
+
+        return mat_image
+
+    def save_results(detected_vesicles, detection_method, mask_floodfill = None):
+
+        # Assign id for the vesicles based on number of vesicles
+        id_vesicles = np.arange(1, len(detected_vesicles)+1)
+
+        # Initialise dictionary where to store the results
+        det_results = {}
+        det_results['method'] = detection_method
+        det_results['id_vesicle'] = id_vesicles
+
+        # Save results depending on the method used
+        if detection_method == 'floodfill':
+            det_results['mask_rois'] = mask_floodfill
+        
+        det_results['rois'] = detected_vesicles
+        
+        return det_results
+
+
+
+   
+        
@@ -30,6 +30,10 @@ except ModuleNotFoundError: print('ttkthemes not found: using standard OS interf
 from ui_menu import MenuMain
 # Import the CanvasFullImage class responsible of creating main display canvas
 from ui_canvas import CanvasFullImage
+# Import the StageCache class, keeping the intermediate results of the analysis
+from core.stage_cache import StageCache
+# Import the JobExecutor class, running the heavy computations in a worker thread
+from ui_jobs import JobExecutor
 
 
 # Initialise the application
@@ -53,6 +57,8 @@ class disGUVery(tk.Frame):
         self.add_menu()
         # Add the main display to the main Window -> keep track of canvas
         self.gw_maindisplay = self.add_display()
+        # Executor of the computations that run in the background
+        self.gw_jobs = JobExecutor(self)
 
         # Bind key shortcuts
         self.bind_shortcuts()
@@ -102,16 +108,19 @@ class disGUVery(tk.Frame):
 
         # Information about the colormap
         self.appdata_colormap = {'channels': [None, 'gray', 'hot', 'cividis'], 
-                                'current': tk.StringVar()}
+                                'current': tk.StringVar(),
+                                # Contrast limits of each image {image name: {channel: [low, high]}}
+                                'limits': {}}
 
         # Information about the membrane enhancement settings
         self.appdata_settingsenhance = {'method': ['Hough Detection',
                                                     'Template Matching',
                                                     'Floodfill'],
-                                        'hough': [15, 45], 
-                                        'template': [15,45],
-                                        'flood': [5, 105],
-                                        'current': ['hough', tk.StringVar(value = '15'), tk.StringVar(value = '45')],
+                                        'hough': [15, 45, 'gaussian'], 
+                                        'template': [15,45, 'gaussian'],
+                                        'flood': [5, 105, 'gaussian'],
+                                        'current': ['hough', tk.StringVar(value = '15'), tk.StringVar(value = '45'),
+                                                    tk.StringVar(value = 'gaussian')],
                                         'ch_status': [[], []]
                                         }
         
@@ -123,6 +132,7 @@ class disGUVery(tk.Frame):
                                         'hough_mindist': tk.StringVar(value = '200'),
                                         'hough_minrad': tk.StringVar(value = '10'),
                                         'hough_maxrad': tk.StringVar(value = '400'),
+                                        'hough_downsample': tk.StringVar(value = '1'),
                                         'template_minre': tk.StringVar(value = '0.8'),
                                         'template_maxre': tk.StringVar(value = '1.2'),
                                         'template_nscales': tk.StringVar(value = '10'),
@@ -151,6 +161,10 @@ class disGUVery(tk.Frame):
         # Results for membrane detection
         self.appdata_resultsmembrane = {}
 
+        # Cache of the intermediate results of the analysis stages, shared by the panels and the batch runs.
+        # It's only used once enabled in the batch processing panel (see appdata_settingsbatch['stage_cache'])
+        self.appdata_stagecache = StageCache()
+
         # Settings for the vesicle size distribution computation
         self.appdata_settingsvessizedist = {'nbins': tk.StringVar(value = '10'), 
                                             'min' : tk.StringVar(),
@@ -176,13 +190,19 @@ class disGUVery(tk.Frame):
         self.appdata_settingsbatch = {'preprocess': [tk.IntVar(value = 1), tk.IntVar(value = 1)],
                                     'vesdet_method': [tk.StringVar(value = 'Hough Detection'), ['Hough Detection', 'Template Matching', 'Floodfill']],
                                     'vesdet': [tk.IntVar(value = 1), tk.IntVar(value = 1)],
+                                    'subpixel': tk.IntVar(value = 0),
                                     'membrane': [tk.IntVar(value = 1), tk.IntVar(value = 0)],
                                     'intprofiles_an': [tk.IntVar(value = 1), tk.IntVar(value = 0), tk.IntVar(value = 0)],
                                     'intprofiles_rad': [tk.IntVar(value = 1), tk.IntVar(value = 0), tk.IntVar(value = 0)],
                                     'metrics_size':  tk.IntVar(value = 1),
                                     'metrics_encap': [tk.IntVar(value = 1), tk.IntVar(value =  0), 
                                                     [tk.IntVar(value = 1), tk.IntVar(value = 0), tk.IntVar(value = 0)]],
-                                    'savedir': tk.StringVar()}
+                                    'savedir': tk.StringVar(),
+                                    'export_format': [tk.StringVar(value = 'CSV'), ['CSV', 'npz', 'HDF5', 'Parquet']],
+                                    'results_store': tk.IntVar(value = 0),
+                                    'checkpoint': tk.IntVar(value = 0),
+                                    'instrumentation': tk.IntVar(value = 0),
+                                    'stage_cache': tk.IntVar(value = 0)}
 
     def add_menu(self):
 
@@ -18,53 +18,617 @@
 # this program. If not, see <https://www.gnu.org/licenses/>.
 ###############################################################################
 
-from matplotlib import cm
-from matplotlib.colors import ListedColormap
+from collections import OrderedDict
+
+import matplotlib
+from matplotlib.artist import Artist
 from matplotlib.patches import Circle, Rectangle
+from matplotlib.collections import PatchCollection, PathCollection
+from matplotlib.colors import to_rgba
+from matplotlib.font_manager import FontProperties
+from matplotlib.image import AxesImage
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import IdentityTransform, Bbox, TransformedBbox
 
 import numpy as np
 
+from core.data_processing import RoiIndex
+# OpenCV is imported on first use (see lazy_import)
+from core.lazy_import import LazyModule
+cv2 = LazyModule('cv2')
+
 class ImageDisplay():
 
-    def show_image(img, img_axis, cmap_options, channel):
+    def show_image(img, img_axis, cmap_options, channel, compositor = None, limits = None):
 
         # colormap to show the image, for each channel we have one colormap
         # get the colormap from the corresponding channel        
         if channel != 0: colormap = cmap_options[channel]
         else: colormaps = [x for x in cmap_options[1:]]
+        # Contrast limits of each channel (None for the range of the channel)
+        if limits is None: limits = {}
         
         if channel > 0:
-            img_object = img_axis.imshow(img, cmap = colormap, zorder = 0)
+            vmin, vmax = limits.get(channel, None) or [None, None]
+            img_object = ImageDisplay.imshow(img, img_axis, cmap = colormap, vmin = vmin, vmax = vmax)
         else:
-            for ic in range(img.shape[2]):
-                img_channel = img[:,:,ic]
-                my_cmap = cm.get_cmap(colormaps[ic])
-                my_cmap_new = my_cmap(np.arange(my_cmap.N))
-                if ic > 0:
-                    my_cmap_new[:, -1] = np.linspace(0, 1, my_cmap.N)
-                    my_cmap = ListedColormap(my_cmap_new)
-                img_object = img_axis.imshow(img_channel, cmap = my_cmap, alpha = 0.95, zorder = 0)
+            # All the channels are composited into a single RGB image
+            if compositor is None:
+                compositor = ChannelCompositor()
+            compositor.set_image(img, colormaps[:img.shape[2]], [limits.get(ic+1, None) for ic in range(img.shape[2])])
+            img_object = ImageDisplay.imshow(compositor.rgb(), img_axis)
 
         return img_object
 
+    def imshow(img, img_axis, cmap = None, vmin = None, vmax = None, alpha = None, zorder = 0, average = True):
+
+        # Show an image as imshow does, drawing only the visible part of the image at the
+        # resolution of the screen (see PyramidImage). Masks of labels are shown with average = False
+        img_object = PyramidImage(img_axis, average = average, cmap = cmap, zorder = zorder)
+        img_object.set_data(img)
+        img_object.set_alpha(alpha)
+        img_object.set_clim(vmin, vmax)
+        img_object.autoscale_None()
+        img_object.set_clip_path(img_axis.patch)
+        img_axis.set_aspect('equal')
+        img_object.set_extent(img_object.get_extent())
+        img_axis.add_image(img_object)
+
+        return img_object
+
+    def histograms(img, n_bins = 256):
+
+        """
+        Histogram of each channel of an image, over the range of the channel
+
+        INPUT:
+            img: numpy array, single or multichannel image
+            n_bins: int, number of bins
+        OUTPUT:
+            histograms: list, (counts, bin edges) of each channel
+        """
+
+        if img.ndim == 2: img = img[:,:,None]
+        histograms = []
+        for ic in range(img.shape[2]):
+            lo, hi = float(np.min(img[:,:,ic])), float(np.max(img[:,:,ic]))
+            counts, edges = np.histogram(img[:,:,ic], bins = n_bins, range = (lo, max(hi, lo + 1)))
+            histograms.append((counts, edges))
+
+        return histograms
+
+    def delete_labels(mask_labels, labels):
+
+        """
+        Delete labels from a mask of labels and number the remaining labels from 1, keeping their
+        order. All the labels are changed at once through a lookup table, and the mask is changed
+        in place
+
+        INPUT:
+            mask_labels: numpy array, mask of non-negative integer labels (0 is the background)
+            labels: list or numpy array, labels to delete
+        """
+
+        # Labels present in the mask, without the deleted ones
+        present = np.bincount(mask_labels.ravel()) > 0
+        present[0] = False
+        labels = np.asarray(labels, dtype = int)
+        present[labels[labels < len(present)]] = False
+
+        # Lookup table from the old to the new labels
+        lut = np.zeros(len(present), dtype = mask_labels.dtype)
+        lut[present] = np.arange(1, np.count_nonzero(present) + 1)
+        mask_labels[...] = lut[mask_labels]
+
+    def preview_level(img, max_size):
+
+        # Level of the image pyramid (see ImagePyramid) that fits in max_size pixels.
+        # Return the preview and its step
+        step = 1
+        while max(img.shape[0], img.shape[1])/step > max_size:
+            step *= 2
+
+        return ImagePyramid(img).level(step), step
+
+class ImagePyramid():
+
+    """
+    Pyramid of an image: each level halves the size of the previous one, each pixel being the
+    mean of a block of 2x2 pixels, such that thin structures (membranes of 1-2 pixels) are
+    kept, with a lower intensity, when the image is shown zoomed out. The levels are built the
+    first time they are needed, and kept. Odd sizes are padded with the last row or column.
+    With average = False, the levels take every 2**level pixel instead (masks of labels).
+
+    Usage:
+        pyramid = ImagePyramid(img)
+        img_level = pyramid.level(4)    # image 4 times smaller
+    """
+
+    def __init__(self, img, average = True):
+
+        self.levels = [img]
+        self.average = average
+
+    def level(self, step):
+
+        # Level with one pixel for each block of step x step pixels of the image (step is a power of 2)
+        if self.average is False:
+            return self.levels[0][::step, ::step]
+        n_level = int(np.log2(step))
+        while len(self.levels) <= n_level:
+            self.levels.append(ImagePyramid.downsample(self.levels[-1]))
+
+        return self.levels[n_level]
+
+    def resize(img, width, height):
+
+        # Area averaged image of width x height pixels, if it is smaller than the image.
+        # Masked images and types not supported by OpenCV are kept as they are
+        if not (0 < width < img.shape[1] and 0 < height < img.shape[0]):
+            return img
+        if np.ma.isMaskedArray(img) and np.ma.getmask(img) is not np.ma.nomask and np.ma.getmask(img).any():
+            return img
+        img = np.ascontiguousarray(np.ma.getdata(img))
+        if img.dtype.name not in ['uint8', 'uint16', 'int16', 'float32', 'float64']:
+            return img
+
+        return cv2.resize(img, (width, height), interpolation = cv2.INTER_AREA)
+
+    def downsample(img):
+
+        # Mean of the blocks of 2x2 pixels, keeping the type of the image (and its masked pixels)
+        masked = np.ma.isMaskedArray(img)
+        data = np.ma.filled(img.astype('float32'), np.nan) if masked else img
+        height, width = data.shape[:2]
+        if height % 2 or width % 2:
+            data = np.pad(data, [(0, height % 2), (0, width % 2)] + [(0, 0)]*(data.ndim - 2), mode = 'edge')
+        blocks = data.reshape(data.shape[0]//2, 2, data.shape[1]//2, 2, *data.shape[2:])
+        img_level = blocks.mean(axis = (1, 3), dtype = 'float32')
+
+        # Blocks with a masked pixel are masked
+        mask_level = np.isnan(img_level) if masked else None
+        if masked:
+            img_level[mask_level] = 0
+        if np.issubdtype(img.dtype, np.integer):
+            img_level = np.rint(img_level).astype(img.dtype)
+        else:
+            img_level = img_level.astype(img.dtype, copy = False)
+
+        return np.ma.masked_array(img_level, mask_level) if masked else img_level
+
+class PyramidImage(AxesImage):
+
+    """
+    Image drawing only the part of the image in view, from the level of the image pyramid
+    (see ImagePyramid) closest to the resolution of the screen. When the image is zoomed out,
+    fewer pixels are resampled. When it is zoomed in, only the visible pixels are resampled.
+    The data of the image is not changed, the levels are built when first drawn and kept
+    until the data is set again.
+    """
+
+    def __init__(self, ax, average = True, **kwargs):
+
+        self.average = average
+        self.pyramid = None
+        AxesImage.__init__(self, ax, **kwargs)
+
+    def set_data(self, A):
+
+        # The levels of the previous data are dropped
+        AxesImage.set_data(self, A)
+        self.pyramid = None
+
+    def view_level(self, magnification = 1.0):
+
+        # Part of the image in view and its step, as [row_start, row_end, col_start, col_end, step]
+        # None if the whole image is drawn at full resolution
+        height, width = self._A.shape[:2]
+        left, right, bottom, top = self.get_extent()
+        (x0, x1), (y0, y1) = self.axes.viewLim.intervalx, self.axes.viewLim.intervaly
+        cols = np.sort((np.array([x0, x1]) - left)/(right - left)*width)
+        rows = np.sort((np.array([y0, y1]) - top)/(bottom - top)*height)
+        c0, c1 = int(max(np.floor(cols[0]), 0)), int(min(np.ceil(cols[1]), width))
+        r0, r1 = int(max(np.floor(rows[0]), 0)), int(min(np.ceil(rows[1]), height))
+        if c1 <= c0 or r1 <= r0:
+            return None
+
+        # Largest step with at least one pixel of the level per pixel of the screen
+        screen_size = max(self.axes.bbox.width*magnification, self.axes.bbox.height*magnification, 1)
+        step = 1
+        while max(c1 - c0, r1 - r0)/(2*step) >= screen_size:
+            step *= 2
+        c0, r0 = c0 - c0 % step, r0 - r0 % step
+        if step == 1 and [r0, r1, c0, c1] == [0, height, 0, width]:
+            return None
+
+        return [r0, r1, c0, c1, step]
+
+    def make_image(self, renderer, magnification = 1.0, unsampled = False):
+
+        # Images drawn unsampled (vector backends) and flipped images are drawn as usual
+        if unsampled or self.origin != 'upper' or self._A is None or self.axes is None:
+            return AxesImage.make_image(self, renderer, magnification, unsampled)
+        level = self.view_level(magnification)
+        if level is None:
+            return AxesImage.make_image(self, renderer, magnification, unsampled)
+
+        # Part of the level in view, and its extent
+        r0, r1, c0, c1, step = level
+        if self.pyramid is None:
+            self.pyramid = ImagePyramid(self._A, self.average)
+        view_img = self.pyramid.level(step)[r0//step:-(-r1//step), c0//step:-(-c1//step)]
+        height, width = self._A.shape[:2]
+        left, right, bottom, top = self.get_extent()
+        dx, dy = (right - left)/width, (bottom - top)/height
+        x1, x2 = left + c0*dx, left + min(c0 + view_img.shape[1]*step, width)*dx
+        y1, y2 = top + min(r0 + view_img.shape[0]*step, height)*dy, top + r0*dy
+        bbox = Bbox(np.array([[x1, y1], [x2, y2]]))
+        out_bbox = TransformedBbox(bbox, self.get_transform())
+        clip = ((self.get_clip_box() or self.axes.bbox) if self.get_clip_on() else self.figure.bbox)
+
+        # The level is averaged down to the pixels of the screen, and matplotlib resamples it about 1:1.
+        # Colormapped images are averaged on their intensities, before the colormap
+        if self.average is True:
+            view_img = ImagePyramid.resize(view_img, int(round(abs(out_bbox.width)*magnification)),
+                                        int(round(abs(out_bbox.height)*magnification)))
+
+        return self._make_image(view_img, bbox, out_bbox, clip, magnification, unsampled = unsampled)
+
+class ChannelCompositor():
+
+    """
+    Composite of the channels of an image into a single RGB image. Each channel is mapped
+    through a lookup table (uint8 RGB, built from its colormap and contrast limits, and cached),
+    and the channels are added. As in the previous display, where the channels were overlaid
+    with an alpha ramp, the colors of all channels but the first are weighted by the intensity.
+    The sum of the channels is kept, such that changing the contrast or the colormap of one
+    channel only maps that channel again.
+
+    Usage:
+        compositor = ChannelCompositor()
+        compositor.set_image(img, ['gray', 'hot', 'cividis'])
+        img_object = axis.imshow(compositor.rgb())
+        img_object.set_data(compositor.set_channel(1, limits = [100, 2000]))
+    """
+
+    # Lookup tables {(colormap, limits, levels, ramp): table}, shared by all the compositors
+    lut_cache = OrderedDict()
+    lut_cache_size = 32
+    # Number of levels of the tables for the images that are not 8 or 16-bit
+    float_levels = 4096
+
+    def __init__(self):
+
+        self.image = None
+        self.colormaps = []
+        self.limits = []
+        self.sum = None
+
+    def set_image(self, img, colormaps, limits = None):
+
+        """
+        Set the image to composite
+
+        INPUT:
+            img: numpy array, multichannel image (height, width, channels)
+            colormaps: list, name of the colormap of each channel
+            limits: list, [low, high] contrast limits of each channel, None for the range of the channel
+        """
+
+        self.image = img
+        self.colormaps = list(colormaps)
+        if limits is None:
+            limits = [None]*len(self.colormaps)
+        self.limits = [[float(np.min(img[:,:,ic])), float(np.max(img[:,:,ic]))] if limits[ic] is None
+                        else [float(limits[ic][0]), float(limits[ic][1])] for ic in range(len(self.colormaps))]
+
+        # Add all the channels
+        self.sum = np.zeros(img.shape[:2] + (3,), dtype = np.uint16)
+        for ic in range(len(self.colormaps)):
+            self.sum += self.channel_layer(ic)
+
+    def set_channel(self, ic, colormap = None, limits = None):
+
+        # Change the colormap and/or contrast limits of channel ic (starting at 0), return the new composite
+        layer_old = self.channel_layer(ic)
+        if colormap is not None: self.colormaps[ic] = colormap
+        if limits is not None: self.limits[ic] = [float(limits[0]), float(limits[1])]
+        self.sum -= layer_old
+        self.sum += self.channel_layer(ic)
+
+        return self.rgb()
+
+    def rgb(self):
+
+        # Composite image, saturated at 255
+        return np.minimum(self.sum, 255).astype(np.uint8)
+
+    def channel_layer(self, ic):
+
+        # RGB values of a channel, through its lookup table
+        img_channel = self.image[:,:,ic]
+        lo, hi = self.limits[ic]
+        if img_channel.dtype in [np.uint8, np.uint16]:
+            # The table covers all the values of the type, the contrast limits are in the table
+            lut = ChannelCompositor.lut(self.colormaps[ic], (lo, hi), np.iinfo(img_channel.dtype).max + 1, ic > 0)
+            return lut[img_channel]
+
+        # Other types are scaled to the levels of the table first
+        levels = ChannelCompositor.float_levels
+        lut = ChannelCompositor.lut(self.colormaps[ic], (0, levels - 1), levels, ic > 0)
+        index = (img_channel.astype(np.float32) - lo)*((levels - 1)/max(hi - lo, 1e-12))
+        index = np.clip(index, 0, levels - 1).astype(np.uint16)
+
+        return lut[index]
+
+    def lut(colormap, limits, levels, ramp):
+
+        # Lookup table of a colormap for the values 0..levels-1, with the contrast limits.
+        # If ramp is True, the colors are weighted by the intensity
+        key = (colormap, limits, levels, ramp)
+        if key in ChannelCompositor.lut_cache:
+            ChannelCompositor.lut_cache.move_to_end(key)
+            return ChannelCompositor.lut_cache[key]
+
+        lo, hi = limits
+        intensity = np.clip((np.arange(levels) - lo)/max(hi - lo, 1e-12), 0, 1)
+        colors = matplotlib.colormaps[colormap](intensity)[:,:3]
+        if ramp is True:
+            colors = colors*intensity[:, None]
+        table = np.round(255*colors).astype(np.uint8)
+
+        ChannelCompositor.lut_cache[key] = table
+        if len(ChannelCompositor.lut_cache) > ChannelCompositor.lut_cache_size:
+            ChannelCompositor.lut_cache.popitem(last = False)
+
+        return table
+
+class ViewportCulling():
+
+    """
+    Collection of ROIs drawing only the items in view. The items are the objects of a RoiIndex,
+    and on each draw the index gives the objects overlapping the view (with a margin in screen
+    pixels). Only their paths, offsets and colors are given to the renderer, the collection
+    itself keeps all the items. Used as the first base class of a collection.
+    """
+
+    # Margin around the view, in screen pixels
+    view_margin = 2
+
+    def set_index(self, index):
+
+        # Spatial index of the items of the collection (data_processing.RoiIndex)
+        self.index = index
+        self.view_ind = None
+
+    def items_in_view(self):
+
+        # Index of the items overlapping the view, None if they all do
+        index = getattr(self, 'index', None)
+        if index is None or self.axes is None or len(index) == 0:
+            return None
+        x0, x1 = np.sort(self.axes.viewLim.intervalx)
+        y0, y1 = np.sort(self.axes.viewLim.intervaly)
+        margin = self.view_margin*max((x1 - x0)/max(self.axes.bbox.width, 1), (y1 - y0)/max(self.axes.bbox.height, 1))
+        in_view = index.in_box(x0 - margin, x1 + margin, y0 - margin, y1 + margin)
+        if len(in_view) == len(index):
+            return None
+
+        return in_view
+
+    def culled(self, values):
+
+        # Values of the items in view, while drawing. Values shared by all the items are kept
+        if self.view_ind is None or len(values) != len(self.index):
+            return values
+        if isinstance(values, np.ndarray):
+            return values[self.view_ind]
+
+        return [values[i] for i in self.view_ind]
+
+    def draw(self, renderer):
+
+        self.view_ind = self.items_in_view()
+        if self.view_ind is not None and len(self.view_ind) == 0:
+            self.view_ind = None
+            self.stale = False
+            return
+        try:
+            super().draw(renderer)
+        finally:
+            self.view_ind = None
+
+    def get_paths(self):
+        return self.culled(super().get_paths())
+
+    def get_offsets(self):
+        return self.culled(super().get_offsets())
+
+    def get_facecolor(self):
+        return self.culled(super().get_facecolor())
+
+    def get_edgecolor(self):
+        return self.culled(super().get_edgecolor())
+
+class RoiCollection(ViewportCulling, PatchCollection):
+
+    # Patches of the detected objects, drawing only the objects in view
+    pass
+
+class LabelCollection(ViewportCulling, PathCollection):
+
+    """
+    Labels of the detected objects drawn as a single collection of text paths (one path per
+    label, placed at the position of the object), instead of one Text artist per object.
+    The collection is picked by hit-testing the array of ROIs: a click inside an object, or
+    close to its label, picks it. The picked index is given in event.ind, as for the other
+    collections, and the label of the object is labels.ids[index].
+    """
+
+    # Text paths of the strings already drawn, centered horizontally, in points
+    path_cache = {}
+    # The labels are culled by their position, with a margin for the size of the text
+    view_margin = 40
+
+    def __init__(self, positions, ids, img_axis, rois = None, object_type = 'text', size = 14, index = None, **kwargs):
+
+        # The labels are placed at the center of the ROIs. The spatial index of the ROIs
+        # can be shared with the collection of the objects
+        self.ids = np.asarray(ids)
+        self.positions = np.asarray(positions, dtype = float).reshape(-1, 2)
+        self.rois = self.positions if rois is None else np.asarray(rois, dtype = float)
+        self.object_type = object_type
+        self.set_index(RoiIndex(self.rois, object_type) if index is None else index)
+
+        paths = [LabelCollection.text_path(str(s), size) for s in self.ids]
+        # The paths are in points, scaled with the dpi of the figure as in scatter plots
+        PathCollection.__init__(self, paths, sizes = [1], offsets = self.positions,
+                                transform = IdentityTransform(), edgecolors = 'none', linewidths = 0, **kwargs)
+        # The offsets are in data coordinates (set_offset_transform exists from matplotlib 3.6)
+        try:
+            self.set_offset_transform(img_axis.transData)
+        except AttributeError:
+            self._transOffset = img_axis.transData
+
+    def text_path(s, size):
+
+        key = (s, size)
+        if key not in LabelCollection.path_cache:
+            path = TextPath((0, 0), s, size = size, prop = FontProperties(family = ['sans-serif']))
+            # Bounds of the vertices, the exact extents of the curves are much slower to get
+            x_center = (path.vertices[:,0].min() + path.vertices[:,0].max())/2 if len(path.vertices) else 0
+            LabelCollection.path_cache[key] = Path(path.vertices - [x_center, 0], path.codes)
+
+        return LabelCollection.path_cache[key]
+
+    def set_label_colors(self, color, ind = None):
+
+        # Set the color of all the labels, or only of the labels with index ind
+        if ind is None:
+            self.set_facecolor(color)
+        else:
+            colors = np.array(self.get_facecolor()).reshape(-1, 4)
+            if len(colors) != len(self.ids):
+                colors = np.resize(colors if len(colors) > 0 else [0, 0, 0, 0], (len(self.ids), 4))
+            colors[ind] = to_rgba(color)
+            self.set_facecolor(colors)
+
+    def contains(self, mouseevent):
+
+        # Hit-test the ROIs: objects containing the click, and labels closer than the pick radius
+        picker = self.get_picker()
+        if picker in [None, False] or len(self.ids) == 0 or mouseevent.inaxes is not self.axes:
+            return False, {}
+        x, y = self.axes.transData.inverted().transform((mouseevent.x, mouseevent.y))
+        # Pick radius from screen pixels to data units
+        radius = picker if isinstance(picker, (int, float)) and picker is not True else 5
+        scale = np.abs(self.axes.transData.transform([1, 1]) - self.axes.transData.transform([0, 0]))
+        radius = radius/max(scale.max(), 1e-12)
+
+        # The closest object is picked
+        hit = np.union1d(self.index.at(x, y), self.index.within(x, y, radius))
+        if len(hit) == 0:
+            return False, {}
+        dist = np.hypot(self.rois[hit,0] - x, self.rois[hit,1] - y)
+
+        return True, {'ind': np.array([hit[np.argmin(dist)]])}
+
+class MaskOverlay(Artist):
+
+    """
+    Pixels of masks and contours (e.g. the edges of the refined membrane detection) drawn as a
+    raster layer, instead of one scatter marker per pixel. On each draw, the pixels in view are
+    painted into an RGBA image the size of the axis, at least one screen pixel each, such that thin
+    edges are still visible when the image is zoomed out. The pixels out of view are not drawn.
+
+    Usage:
+        overlay = MaskOverlay(label = 'rmd_contour', zorder = 1)
+        img_axis.add_artist(overlay)
+        overlay.add_points(x, y, 'cyan')
+        overlay.add_mask(mask, 'orange', offset = [x1, y1])
+    """
+
+    def __init__(self, label = '', **kwargs):
+
+        Artist.__init__(self)
+        self.set_label(label)
+        self.set(**kwargs)
+        # Layers of points drawn in order [x, y, rgba]
+        self.layers = []
+
+    def add_points(self, x, y, color):
+
+        # Add pixels with their coordinates (x: columns, y: rows) and a color
+        x = np.rint(np.asarray(x, dtype = float)).astype(int).ravel()
+        y = np.rint(np.asarray(y, dtype = float)).astype(int).ravel()
+        rgba = (np.array(to_rgba(color))*255).astype(np.uint8)
+        self.layers.append([x, y, rgba])
+        self.stale = True
+
+    def add_mask(self, mask, color, offset = [0, 0]):
+
+        # Add the non-zero pixels of a mask, placed at offset [x, y] in the image
+        y, x = np.nonzero(mask)
+        self.add_points(x + offset[0], y + offset[1], color)
+
+    def get_window_extent(self, renderer = None):
+
+        return self.axes.bbox if self.axes is not None else Artist.get_window_extent(self, renderer)
+
+    def draw(self, renderer):
+
+        if not self.get_visible() or self.axes is None or not self.layers:
+            return
+
+        # Size of the axis on screen, and size of an image pixel on screen
+        bbox = self.axes.bbox
+        x0, y0 = int(np.floor(bbox.x0)), int(np.floor(bbox.y0))
+        width, height = int(np.ceil(bbox.x1)) - x0, int(np.ceil(bbox.y1)) - y0
+        if width <= 0 or height <= 0:
+            return
+        transform = self.axes.transData
+        scale = np.abs(transform.transform([1, 1]) - transform.transform([0, 0]))
+        size = np.maximum(1, np.rint(scale)).astype(int)
+
+        # Paint the pixels in view, each one covering its size on screen
+        layer_image = np.zeros((height, width, 4), dtype = np.uint8)
+        for x, y, rgba in self.layers:
+            xy = transform.transform(np.column_stack([x, y])) - scale/2 - [x0, y0]
+            ix, iy = np.floor(xy[:,0]).astype(int), np.floor(xy[:,1]).astype(int)
+            in_view = (ix > -size[0]) & (ix < width) & (iy > -size[1]) & (iy < height)
+            ix, iy = ix[in_view], iy[in_view]
+            for dx in range(size[0]):
+                for dy in range(size[1]):
+                    cols, rows = ix + dx, iy + dy
+                    keep = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+                    # Rows of the layer start at the bottom of the axis, as the screen coordinates
+                    layer_image[rows[keep], cols[keep]] = rgba
+
+        gc = renderer.new_gc()
+        gc.set_clip_rectangle(bbox)
+        gc.set_alpha(self.get_alpha() if self.get_alpha() is not None else 1)
+        renderer.draw_image(gc, x0, y0, layer_image)
+        gc.restore()
+        self.stale = False
+
 class ObjectDisplay():
 
     def text_info(drawn_text, img_axis, **kwargs):
 
         # Set color of the text drawn
         textcolor = kwargs.get('textcolor', 'mediumvioletred')
+        drawn_text = np.asarray(drawn_text, dtype = object).reshape(-1, 3)
         
-        # Draw the text strings on their coordinates
-        for ic in range(len(drawn_text)):
-            x, y = drawn_text[ic][0], drawn_text[ic][1]
-            s_value = str(drawn_text[ic][2])
-            img_axis.text(x, y, s_value, 
-                            ha = 'center', family = 'sans-serif',
-                            size = 12, color = textcolor)
+        # Draw the text strings on their coordinates, in a single collection
+        labels = LabelCollection(drawn_text[:,:2].astype(float), drawn_text[:,2], img_axis, size = 12,
+                                facecolors = textcolor, label = kwargs.get('label', ''), gid = 'roi_text')
+        img_axis.add_collection(labels, autolim = False)
     
     def show_object(drawn_object, img_axis, **kwargs):
         """
-        Function to draw the required objects into the target container
+        Function to draw the required objects into the target container. All the objects are
+        drawn as a single collection, and their labels as a single LabelCollection
 
         INPUT
             drawn_object :      list, [object_type, object_param]
@@ -77,7 +641,8 @@ class ObjectDisplay():
 
         # Define objects
         object_type = drawn_object[0]
-        object_par = drawn_object[1]
+        object_par = np.asarray(drawn_object[1], dtype = float)
+        if object_par.ndim < 2: object_par = object_par.reshape(-1, 3 if object_type != 'center' else 2)
 
         # Set color of the lines for objects drawn and for text
         edgecolor = kwargs.get('edgecolor','yellow')
@@ -87,7 +652,7 @@ class ObjectDisplay():
         alphacolor = kwargs.get('alpha', 1)
         # Get vesicle ids
         v_ids = np.arange(1, len(object_par)+1)
-        vesicle_ids = kwargs.get('ids', v_ids)
+        vesicle_ids = np.asarray(kwargs.get('ids', v_ids))
         # Get item label
         item_label = kwargs.get('label', 'vesicle')
         text_label = f'{item_label}_text'
@@ -98,36 +663,31 @@ class ObjectDisplay():
         # Get option to ignore zeros in center coordinates
         ignore_zeros = kwargs.get('ignore_zeros', True)
 
-        for ic in np.arange(len(object_par)):
-            try: 
-                x,y,s = object_par[ic][0:3]
-            except ValueError:
-                x,y = object_par[ic][0:2]
-            if (ignore_zeros is False) or ((x != 0) and (y != 0)):
-                id_ves = vesicle_ids[ic]
-                # Define object to draw depending on type
-                if object_type == 'circle':
-                    citem = Circle((x,y), s,
-                                fc = facecolor,
-                                ec = edgecolor,
-                                alpha = alphacolor, 
-                                label = item_label)
-                elif object_type == 'box':
-                    citem = Rectangle((x - s/2, y - s/2), s, s,
-                                    fc = facecolor,
-                                    ec = edgecolor,
-                                    alpha = alphacolor, 
-                                    label = item_label)
-                elif object_type == 'center':
-                    citem = Circle((x,y), 1,
-                                fc = 'none',
-                                ec = edgecolor,
-                                label = item_label)
-                # Add artist to the image axis
-                img_axis.add_patch(citem)
-                # Add text with object label
-                if draw_text == True:
-                    img_axis.text(x, y, id_ves, picker = pick,
-                            ha = 'center', family = 'sans-serif',
-                            size = 14, color = textcolor, label = text_label)        
-        
+        # Objects to draw
+        keep = np.ones(len(object_par), dtype = bool)
+        if ignore_zeros is True:
+            keep = (object_par[:,0] != 0) & (object_par[:,1] != 0)
+        rois = object_par[keep]
+        vesicle_ids = vesicle_ids[keep]
+
+        # Define objects to draw depending on type
+        if object_type == 'circle':
+            patches = [Circle((x,y), s) for x, y, s in rois[:,:3]]
+        elif object_type == 'box':
+            patches = [Rectangle((x - s/2, y - s/2), s, s) for x, y, s in rois[:,:3]]
+        elif object_type == 'center':
+            patches = [Circle((x,y), 1) for x, y in rois[:,:2]]
+            facecolor = 'none'
+        # Add the collection to the image axis
+        objects = RoiCollection(patches, facecolors = facecolor, edgecolors = edgecolor, alpha = alphacolor,
+                                label = item_label, gid = 'roi')
+        # Spatial index of the objects, for culling and picking
+        index = RoiIndex(rois, object_type)
+        objects.set_index(index)
+        img_axis.add_collection(objects, autolim = False)
+
+        # Add text with object label
+        if draw_text == True:
+            labels = LabelCollection(rois[:,:2], vesicle_ids, img_axis, rois = rois, object_type = object_type,
+                                    index = index, facecolors = textcolor, label = text_label, picker = pick, gid = 'roi_text')
+            img_axis.add_collection(labels, autolim = False)
@@ -23,6 +23,7 @@ from tkinter import ttk
 
 # import custom widgets
 import ui_custom_widgets as ctk
+from core.membrane import BMAsegmentation
 
 class BmaPanel():
 
@@ -170,50 +171,3 @@ class BmaPanel():
             if len(struct_channel) < 1:
                 self.controller.appdata_channels[channel_used].set('membrane')
                 print(f'Channel {channel_used} has been assigned to the membrane signal.')
-        
-
-class BMAsegmentation():
-
-    def run(det_results, settings_var, offset_box):
-
-        # Get the rois from the detection results
-        rois = det_results['rois']
-
-        # Options for the inside offset, and outside offset
-        pix_width = int(settings_var['width'].get())
-        offset_in_opt = [0, int(pix_width/2), pix_width]
-        offset_out_opt = [pix_width, int(pix_width/2), 0]
-        
-        # Determine offset to make the inner and outer membrane boundary
-        contour_pos = settings_var['contour_position'].get()
-        offset_in = offset_in_opt[contour_pos]
-        offset_out = offset_out_opt[contour_pos]
-
-        # Build list with rois equivalent to the inner and outer contour
-        rois_in = rois[:,:3].copy()
-        rois_out = rois[:,:3].copy()
-
-        if det_results['method'] == 'hough':
-            for ic, roi in enumerate(rois):
-                rois_in[ic][2] = roi[2] - offset_in 
-                rois_out[ic][2] = roi[2] + offset_out 
-        else:
-            for ic, roi in enumerate(rois):
-                rois_in[ic][2] = roi[2]/2 - offset_in - offset_box
-                rois_out[ic][2] = roi[2]/2 + offset_out - offset_box
-        
-        return rois_in, rois_out         
-
-    def combine_rois(rois_in, rois_out):
-
-        # Create a new array like rois_in
-        rois_combined = rois_in.copy()
-        # Resize to allow for buffer
-        rois_combined.resize(rois_out.shape[0], 6)
-        # Assign values from rois in and out
-        rois_combined[:,:3] = rois_in
-        rois_combined[:,3:] = rois_out
-        # Reduce the array to only have [x,y,rin,rout]
-        rois_combined = rois_combined[:,[0,1,2,5]]
-        
-        return rois_combined
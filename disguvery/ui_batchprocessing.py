@@ -22,17 +22,18 @@ from tkinter import ttk
 import tkinter.filedialog
 
 import os
-
-from data_processing import ProfileIntegration
+import contextlib
 
 # Import custom widgets
 import ui_custom_widgets as ctk
-from file_handling import FileExport, FileImage
-from data_processing import GeoMat
-from image_processing import ImageCorrection, ImageFilters, ImageCheck
-from ui_encapefficiency import EncapEfficiency
-from vesicle_detection import VesicleDetection
-from ui_basicmembrane import BMAsegmentation
+from core.file_handling import FileExport, FileImage, ProfileWriter, ColumnarExport
+from core.results_store import ResultsStore
+from core.pipeline import BatchCheckpoint, settings_snapshot, settings_hash, array_hash, file_hash, frozen_controller
+from core.pipeline import PipelineMonitor, PipelineCancelled
+from core.instrumentation import Instrumentation
+from core.image_processing import ImageCheck
+from core.membrane import BMAsegmentation
+from core import detection, profiles, encapsulation
 from ui_vessizedist import VesSizePanel
 
 class BatchPanel():
@@ -74,6 +75,8 @@ class BatchPanel():
             rbutton.grid(row = 0, column = i, sticky = 'nsew', padx = 2, pady = 5)
         vesexportCheckbox = ttk.Checkbutton(vesLabelFrame, text = 'Export', variable=settings_var['vesdet'][1])
         vesexportCheckbox.grid(row = 2, column = 0, sticky = 'nsw', padx = 5, pady = 5)
+        subpixCheckbox = ttk.Checkbutton(vesLabelFrame, text = 'Sub-pixel refinement', variable = settings_var['subpixel'])
+        subpixCheckbox.grid(row = 3, column = 0, sticky = 'nsw', padx = 5, pady = 5, columnspan = 2)
 
         # Create Membrane Segmentation options
         memLabelFrame = ttk.LabelFrame(bpanel, text = 'Membrane Segmentation')
@@ -112,6 +115,20 @@ class BatchPanel():
         
         folderButton.grid(row = 0, column = 0, sticky = 'nsw', padx = 5, pady = 7)
         folderLabel.grid(row = 0, column = 1, sticky = 'nsew', padx = 10, pady = 7)
+        formatLabel = ttk.Label(optLabelFrame, text = 'Format')
+        formatCombobox = ttk.Combobox(optLabelFrame, width = 8, state = 'readonly', textvariable = settings_var['export_format'][0],
+                                    values = settings_var['export_format'][1])
+        formatLabel.grid(row = 1, column = 0, sticky = 'nsw', padx = 5, pady = 7)
+        formatCombobox.grid(row = 1, column = 1, sticky = 'nsw', padx = 10, pady = 7)
+        storeCheckbox = ttk.Checkbutton(optLabelFrame, text = 'Results database', variable = settings_var['results_store'])
+        storeCheckbox.grid(row = 1, column = 2, sticky = 'nsw', padx = 10, pady = 7)
+        checkpointCheckbox = ttk.Checkbutton(optLabelFrame, text = 'Resume (skip unchanged)', variable = settings_var['checkpoint'])
+        checkpointCheckbox.grid(row = 2, column = 0, sticky = 'nsw', padx = 5, pady = 7, columnspan = 2)
+        timingCheckbox = ttk.Checkbutton(optLabelFrame, text = 'Timing report', variable = settings_var['instrumentation'])
+        timingCheckbox.grid(row = 2, column = 2, sticky = 'nsw', padx = 10, pady = 7)
+        cacheCheckbox = ttk.Checkbutton(optLabelFrame, text = 'Cache stage results', variable = settings_var['stage_cache'],
+                                        command = self.set_stagecache)
+        cacheCheckbox.grid(row = 3, column = 0, sticky = 'nsw', padx = 5, pady = 7, columnspan = 2)
         
         # Buttons to test and run
         testcurrentButton = ttk.Button(bpanel, text = 'Test on Current Image', command = self.test_current)
@@ -143,48 +160,128 @@ class BatchPanel():
         if dir_save:
             self.controller.appdata_settingsbatch['savedir'].set(dir_save)
 
+    def set_stagecache(self):
+
+        # Use the cache of the intermediate results (in the panels and in the batch runs) or not
+        enabled = self.controller.appdata_settingsbatch['stage_cache'].get() == 1
+        self.controller.appdata_stagecache.enabled = enabled
+        print(f'Cache of the stage results {"enabled" if enabled else "disabled"} ({self.controller.appdata_stagecache.folder})')
+
     def run_all_images(self):
 
         controller = self.controller
+        # The images are processed in the background, with a frozen copy of the settings
+        appdata = frozen_controller(controller)
+        # Settings batch processing
+        settings_batch = appdata.appdata_settingsbatch
+        image_names = list(controller.appdata_imageinfo.keys())
+
+        def batch(job):
+            # The pre-processing buffers are reused between images
+            buffers_batch = {}
+            # Detection results of each image, assigned to the images once the batch is done
+            results_vesdet = {}
+            # Tables of all the images are exported together in columnar formats, and to the results database.
+            # They are opened here, as the database can only be used in the thread it was created
+            columnar_export = self.columnar_export('batch_results', settings_batch)
+            results_store = self.results_store(settings_batch)
+            # Checkpoint of the campaign, to resume it and to skip the unchanged stages
+            if settings_batch['checkpoint'].get() == 1:
+                checkpoint = BatchCheckpoint(settings_batch['savedir'].get())
+            else:
+                checkpoint = None
+            # The template is the same for all the images, it's only hashed once
+            template_key = BatchRun.template_key(appdata, settings_batch)
+            # Time and memory of the stages, written for each image and summarised at the end of the batch
+            savedir = settings_batch['savedir'].get()
+            if settings_batch['instrumentation'].get() == 1:
+                instrumentation = Instrumentation()
+                recording = instrumentation.recording()
+            else:
+                instrumentation = None
+                recording = contextlib.nullcontext()
+
+            # Get the image name for the dictionary of imageinfo.
+            # If the batch is cancelled, the results of the finished images are kept
+            try:
+                with recording, job.monitor.stage('images', total = len(image_names)):
+                    for img_name in image_names:
+                        if instrumentation is not None:
+                            instrumentation.image = img_name
+                        img_dir = appdata.appdata_imageinfo[img_name]['directory']
+                        img_ext = appdata.appdata_imageinfo[img_name]['extension']
+                        filename = os.path.join(os.path.normpath(img_dir), f'{img_name}.{img_ext}')
+                        print(f'Working with image {filename} ------------')
+
+                        # Skip the images whose results have already been exported with the same settings.
+                        # Results exported to the whole campaign files are always collected again
+                        if checkpoint is not None:
+                            input_key = file_hash(filename)
+                            stage_keys = BatchRun.stage_keys(appdata, settings_batch, input_key, template_key)
+                            if checkpoint.done(img_name, 'export', stage_keys['export']) and (columnar_export, results_store) == (None, None):
+                                print('Results found in checkpoint, skipping image')
+                                results_vesdet[img_name] = checkpoint.load(img_name, 'detection', stage_keys['detection'])[1]
+                                job.monitor.advance()
+                                continue
+                        else:
+                            input_key = None
+                
+                        # Read the image
+                        img_info, img_n, source_image = FileImage.open(filename, verbose = False)
+
+                        det_results, bma_results, profiles_results, encap_results = BatchRun.run(appdata, source_image, settings_batch,
+                                                                                display_results = False,
+                                                                                buffers = buffers_batch,
+                                                                                checkpoint = checkpoint,
+                                                                                img_name = img_name,
+                                                                                input_key = input_key,
+                                                                                template_key = template_key,
+                                                                                monitor = job.monitor)
+
+                        # Export the desired results
+                        with job.monitor.stage('export'):
+                            self.export_results(img_name, det_results, profiles_results, encap_results, columnar_export,
+                                                results_store, settings_batch)
+                        if checkpoint is not None:
+                            checkpoint.save(img_name, 'export', stage_keys['export'])
+                        results_vesdet[img_name] = det_results
+                        if instrumentation is not None:
+                            instrumentation.write_image(os.path.join(savedir, f'{img_name}_timing.csv'), img_name)
+                        job.monitor.advance()
+                    if instrumentation is not None:
+                        instrumentation.image = ''
+            except PipelineCancelled:
+                print('Batch processing cancelled')
+
+            # Write the columnar export and close the results database
+            if columnar_export is not None:
+                columnar_export.close()
+            if results_store is not None:
+                results_store.close()
+            # Time spent in each stage of the batch
+            if instrumentation is not None:
+                instrumentation.report(os.path.join(savedir, 'batch_timing_summary.csv'))
+            else:
+                job.monitor.report_timings()
 
-        # Get the image name for the dictionary of imageinfo
-        for img_name in controller.appdata_imageinfo.keys():
-            img_dir = controller.appdata_imageinfo[img_name]['directory']
-            img_ext = controller.appdata_imageinfo[img_name]['extension']
-            filename = os.path.join(os.path.normpath(img_dir), f'{img_name}.{img_ext}')
-            print(f'Working with image {filename} ------------')
-            
-            # Read the image
-            img_info, img_n, source_image = FileImage.open(filename, verbose = False)
-
-            # Settings batch processing
-            settings_batch = controller.appdata_settingsbatch
-            det_results, bma_results, profiles_results, encap_results = BatchRun.run(controller, source_image, settings_batch,
-                                                                    display_results = False)
-
-            # Export the desired results
-            if settings_batch['vesdet'][1].get() == 1 and det_results is not None:
-                # Export vesicle detection results
-                filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_detected_vesicles.csv')
-                FileExport.vesicle_detection(filename, det_results)
-            if profiles_results is not None:
-                # Export intensity profiles
-                filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_results.csv')
-                FileExport.intensity_profiles(filename, profiles_results)
-            if encap_results is not None:
-                for k, v in encap_results.items():
-                    filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_encapresults_{k}')
-                    FileExport.encapsulation_results(filename, v[0], v[1])
-            # Assign the detection results to the current image
-            controller.appdata_resultsvesdet[img_name] = det_results
+            return results_vesdet, job.cancelled()
 
-        # Run vesicle size distribution if required
-        if settings_batch['metrics_size'].get() == 1:
-            # Set the method for calculation for all the images
-            controller.appdata_settingsvessizedist['input_data'].set(1)
-            # Open the window 
-            controller.gw_vessizedist = VesSizePanel(controller)
-            controller.gw_vessizedist.compute_histogram(overwrite_minmax = True)
+        def batch_done(output):
+            results_vesdet, cancelled = output
+            # Assign the detection results to the images, and the channel labels set by the detection
+            controller.appdata_resultsvesdet.update(results_vesdet)
+            for ich in [1,2,3,4]:
+                controller.appdata_channels[ich].set(appdata.appdata_channels[ich].get())
+
+            # Run vesicle size distribution if required
+            if settings_batch['metrics_size'].get() == 1 and cancelled is False:
+                # Set the method for calculation for all the images
+                controller.appdata_settingsvessizedist['input_data'].set(1)
+                # Open the window 
+                controller.gw_vessizedist = VesSizePanel(controller)
+                controller.gw_vessizedist.compute_histogram(overwrite_minmax = True)
+
+        controller.gw_jobs.submit('Batch processing', batch, on_done = batch_done)
 
     def test_current(self):
 
@@ -200,18 +297,14 @@ class BatchPanel():
         det_results, bma_results, profiles_results, encap_results = BatchRun.run(controller, mat_image, settings_batch)
 
         # Export the desired results
-        if settings_batch['vesdet'][1].get() == 1 and det_results is not None:
-            # Export vesicle detection results
-            filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_detected_vesicles.csv')
-            FileExport.vesicle_detection(filename, det_results)
-        if profiles_results is not None:
-            # Export intensity profiles
-            filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_results.csv')
-            FileExport.intensity_profiles(filename, profiles_results)
-        if encap_results is not None:
-            for k, v in encap_results.items():
-                filename = os.path.join(settings_batch['savedir'].get(), f'{img_name}_encapresults_{k}')
-                FileExport.encapsulation_results(filename, v[0], v[1])
+        columnar_export = self.columnar_export(f'{img_name}_results')
+        results_store = self.results_store()
+        self.export_results(img_name, det_results, profiles_results, encap_results, columnar_export,
+                            results_store)
+        if columnar_export is not None:
+            columnar_export.close()
+        if results_store is not None:
+            results_store.close()
         # Assign the detection results to the current image
         controller.appdata_resultsvesdet[img_name] = det_results
 
@@ -225,42 +318,149 @@ class BatchPanel():
             controller.gw_vessizedist.compute_histogram(overwrite_minmax = True)
 
 
+    def columnar_export(self, name, settings_batch = None):
+
+        # Open a columnar export in the save folder, if a columnar format has been chosen
+        if settings_batch is None:
+            settings_batch = self.controller.appdata_settingsbatch
+        export_format = settings_batch['export_format'][0].get().lower()
+        if export_format == 'csv':
+            return None
+
+        filename = os.path.join(settings_batch['savedir'].get(), name)
+        return ColumnarExport(filename, export_format)
+
+    def results_store(self, settings_batch = None):
+
+        # Open the results database of the save folder, if required, and start a new run
+        if settings_batch is None:
+            settings_batch = self.controller.appdata_settingsbatch
+        if settings_batch['results_store'].get() == 0:
+            return None
+
+        results_store = ResultsStore(os.path.join(settings_batch['savedir'].get(), 'disguvery_results.sqlite'))
+        results_store.start_run(settings_batch['vesdet_method'][0].get().lower())
+        return results_store
+
+    def export_results(self, img_name, det_results, profiles_results, encap_results, columnar_export = None,
+                        results_store = None, settings_batch = None):
+
+        # Export the results of an image, as CSV files or in the tables of the columnar export
+        # Masks are always saved as images
+        if settings_batch is None:
+            settings_batch = self.controller.appdata_settingsbatch
+        savedir = settings_batch['savedir'].get()
+
+        # Add all the results of the image to the results database, in a single transaction
+        if results_store is not None:
+            img_dir = self.controller.appdata_imageinfo.get(img_name, {}).get('directory', None)
+            results_store.add_image(img_name, img_dir, det_results, profiles_results, encap_results)
+
+        if settings_batch['vesdet'][1].get() == 1 and det_results is not None:
+            # Export vesicle detection results
+            filename = os.path.join(savedir, f'{img_name}_detected_vesicles.csv')
+            if columnar_export is None:
+                FileExport.vesicle_detection(filename, det_results)
+            else:
+                columnar_export.add_detection(img_name, det_results)
+                FileExport.regions_mask(filename, det_results)
+        if profiles_results is not None:
+            # Stream the intensity profiles to the files of the image
+            filename = os.path.join(savedir, f'{img_name}_results.csv')
+            if columnar_export is None:
+                with ProfileWriter(filename) as profile_writer:
+                    profile_writer.append(profiles_results)
+            else:
+                columnar_export.add_profiles(img_name, profiles_results)
+        if encap_results is not None:
+            for k, v in encap_results.items():
+                filename = os.path.join(savedir, f'{img_name}_encapresults_{k}')
+                if columnar_export is None:
+                    FileExport.encapsulation_results(filename, v[0], v[1])
+                else:
+                    columnar_export.add_encapsulation(img_name, k, v[0])
+                    FileExport.encapsulation_mask(filename, v[1])
+
 class BatchRun(): 
                   
-    def run(controller, mat_image, settings_batch, display_results = True): 
+    def run(controller, mat_image, settings_batch, display_results = True, buffers = None,
+            checkpoint = None, img_name = None, input_key = None, template_key = None, monitor = None): 
+
+        # Progress, cancellation and timing of the stages
+        if monitor is None:
+            monitor = PipelineMonitor()
 
         # Get vesicle detection method
         det_method = settings_batch['vesdet_method'][0].get().lower()
 
+        # Cache of the intermediate results, keyed by the content of the image. The image is only
+        # hashed if the cache is used, or if the checkpoint has no key for it
+        stage_cache = controller.appdata_stagecache
+        image_key = None
+        if stage_cache.active() or (checkpoint is not None and input_key is None):
+            image_key = array_hash(mat_image)
+        # Template of the detection, hashed once for the detection and the checkpoint
+        if template_key is None:
+            template_key = BatchRun.template_key(controller, settings_batch)
+
+        # Keys of the stages, to reuse the results of the checkpoint that have the same input and settings
+        if checkpoint is not None:
+            if input_key is None: input_key = image_key
+            stage_keys = BatchRun.stage_keys(controller, settings_batch, input_key, template_key)
+        else:
+            stage_keys = None
+
         # Preprocessing (enhancement)
         enhance_type = [False, False]
         if settings_batch['preprocess'][0].get() == 1: enhance_type[0] = True
         if settings_batch['preprocess'][1].get() == 1: enhance_type[1] = True
 
-        if True in enhance_type:
-            print('Image pre-processing...')
-            enhanced_image = BatchRun.enhancement(mat_image, controller.appdata_settingsenhance, 
-                                            enhance_type, det_method)
-        else:
-            enhanced_image = mat_image.copy()
+        # The enhanced image is only computed when a stage needs it
+        params_enhance = [enhance_type, det_method, 
+                        settings_snapshot({k: v for k, v in controller.appdata_settingsenhance.items() if k != 'ch_status'})]
+        enhanced = {}
+        def enhanced_image():
+            if 'image' not in enhanced:
+                if True in enhance_type:
+                    print('Image pre-processing...')
+                    with monitor.stage('enhancement'):
+                        enhanced['image'] = stage_cache.cached(image_key, 'enhancement', params_enhance,
+                                                lambda: BatchRun.enhancement(mat_image, controller.appdata_settingsenhance, 
+                                                                            enhance_type, det_method, buffers))
+                else:
+                    enhanced['image'] = mat_image.copy()
+            return enhanced['image']
 
         if display_results is True:
-            controller.gw_maindisplay.clear_showimage(enhanced_image)
+            controller.gw_maindisplay.clear_showimage(enhanced_image())
 
         # Vesicle detection. This step is mandatory
         # Set the current channel according to chosen option
         vesdet_channel = int(settings_batch['vesdet'][0].get())
         controller.appdata_channels['current'].set(vesdet_channel)
-        ch_image = ImageCheck.single_channel(enhanced_image, vesdet_channel)
-        
-        # If the method is template, retrieve the template image
-        if 'template' in det_method:
-            template_image = controller.appdata_templateimage
-        else: 
-            template_image = None
-        # Run the vesicle detection
-        print('Detecting vesicles...')
-        det_results = BatchRun.vesicledet(ch_image, det_method, controller.appdata_settingsvesdet, template_image)
+
+        def detection():
+            ch_image = ImageCheck.single_channel(enhanced_image(), vesdet_channel)
+            # If the method is template, retrieve the template image
+            if 'template' in det_method:
+                template_image = controller.appdata_templateimage
+            else: 
+                template_image = None
+            # Run the vesicle detection
+            print('Detecting vesicles...')
+            det_results = BatchRun.vesicledet(ch_image, det_method, controller.appdata_settingsvesdet, template_image,
+                                            monitor)
+            # Refine the detected vesicles with sub-pixel accuracy, if required
+            if settings_batch['subpixel'].get() == 1 and det_results is not None:
+                print('Refining vesicles...')
+                det_results = BatchRun.refine(ch_image, det_results)
+            return det_results
+
+        # Parameters of the detection, including the ones of the enhanced image it is run on
+        params_det = [params_enhance, vesdet_channel, template_key, settings_snapshot(controller.appdata_settingsvesdet),
+                    settings_batch['subpixel'].get()]
+        det_results = BatchRun.stage(checkpoint, img_name, 'detection', stage_keys,
+                                lambda: stage_cache.cached(image_key, 'detection', params_det, detection), monitor)
         if det_results is not None:
             results_forint = det_results
             # Show the detection results
@@ -271,14 +471,17 @@ class BatchRun():
             # Set current channel as the membrane channel
             if 'membrane' not in controller.appdata_channels.values():
                 controller.appdata_channels[vesdet_channel].set('membrane')
-        # Run the membrane segmentation
-        if settings_batch['membrane'][0].get() == 1:
-            settings_bma = controller.appdata_settingsbma
-            if 'hough' in det_method:
-                offset_box = 0
-            else:
-                offset_box = int(settings_bma['offset'][1].get())
-            rois_in, rois_out = BMAsegmentation.run(det_results, controller.appdata_settingsbma, offset_box)
+        # Run the membrane segmentation, if there are vesicles
+        if settings_batch['membrane'][0].get() == 1 and det_results is not None:
+            def membrane():
+                settings_bma = controller.appdata_settingsbma
+                if 'hough' in det_method:
+                    offset_box = 0
+                else:
+                    offset_box = int(settings_bma['offset'][1].get())
+                return BMAsegmentation.run(det_results, controller.appdata_settingsbma, offset_box)
+
+            rois_in, rois_out = BatchRun.stage(checkpoint, img_name, 'membrane', stage_keys, membrane, monitor)
             results_forint = bma_results =  BMAsegmentation.combine_rois(rois_in, rois_out)
             # Show the results
             if display_results is True:
@@ -297,53 +500,78 @@ class BatchRun():
         intrad_set = controller.appdata_settingsbatch['intprofiles_rad']
         intan_channels = [i+1 for i,x in enumerate(intan_set) if x.get() == 1]
         intrad_channels = [i+1 for i,x in enumerate(intrad_set) if x.get() == 1]
-        
-        # Settings variable
-        settings_int = controller.appdata_settingsiprofile
-        
-        # Check which profile computation to run. Initialise variables
-        angular_profiles_all, radial_profiles_all = None, None
-        if intan_channels:
-            # Run angular integration
-            print('Computing angular intensity profiles...')
-            angular_profiles_all = BatchRun.anprofiles(mat_image, len(det_results['rois']), results_forint, 
-                                                    intan_channels, settings_int,
-                                                    controller.appdata_channels)
-        if intrad_channels:
-            # Run radial integration
-            print('Computing radial intensity profiles...')
-            radial_profiles_all = BatchRun.radprofiles(mat_image, len(det_results['rois']), results_forint, 
-                                                    intrad_channels, settings_int)
-        if None not in [angular_profiles_all, radial_profiles_all]:
-            profiles_results = {}
-            try: 
-                keys_ves = angular_profiles_all.keys()
-            except AttributeError:
-                keys_ves = radial_profiles_all.keys()
-            for ikey in keys_ves:
-                profiles_results[ikey] = {'angular': angular_profiles_all.get(ikey, None),
-                                        'radial': radial_profiles_all.get(ikey, None)}
+
+        def profiles():
+            # Settings variable
+            settings_int = controller.appdata_settingsiprofile
+            
+            # Check which profile computation to run. Initialise variables
+            angular_profiles_all, radial_profiles_all = None, None
+            if intan_channels:
+                # Run angular integration
+                print('Computing angular intensity profiles...')
+                angular_profiles_all = BatchRun.anprofiles(mat_image, results_forint, 
+                                                        intan_channels, settings_int,
+                                                        controller.appdata_channels, monitor)
+            if intrad_channels:
+                # Run radial integration
+                print('Computing radial intensity profiles...')
+                radial_profiles_all = BatchRun.radprofiles(mat_image, results_forint, 
+                                                        intrad_channels, settings_int, monitor)
+            if None not in [angular_profiles_all, radial_profiles_all]:
+                profiles_results = {}
+                try: 
+                    keys_ves = angular_profiles_all.keys()
+                except AttributeError:
+                    keys_ves = radial_profiles_all.keys()
+                for ikey in keys_ves:
+                    profiles_results[ikey] = {'angular': angular_profiles_all.get(ikey, None),
+                                            'radial': radial_profiles_all.get(ikey, None)}
+            else: profiles_results = None
+            return profiles_results
+
+        # The profiles are only computed if there are vesicles and channels to integrate
+        if det_results is not None and (intan_channels or intrad_channels):
+            # Parameters of the profiles: vesicles (or membranes), channels and settings
+            params_profiles = [array_hash(results_forint['rois'] if isinstance(results_forint, dict) else results_forint),
+                            settings_snapshot([settings_batch['intprofiles_an'], settings_batch['intprofiles_rad'],
+                                            controller.appdata_channels, controller.appdata_settingsiprofile])]
+            profiles_results = BatchRun.stage(checkpoint, img_name, 'profiles', stage_keys,
+                                        lambda: stage_cache.cached(image_key, 'profiles', params_profiles, profiles), monitor)
         else: profiles_results = None
 
-        # Run the encapsulation efficiency analysis
-        if settings_batch['metrics_encap'][0].get() == 1:
-            print('Computing Encapsulation Efficiency')
-            if settings_batch['metrics_encap'][1].get() == 0:
-                mask_source = 'detection'
-            else:
-                mask_source = 'refined'
-            # Get the settings for encapsulation refined mask
-            encap_settings = controller.appdata_settingsencap
-            # Get the membrane channel
-            ch_membrane = [ich for ich in [1,2,3,4] if 'membrane' in controller.appdata_channels[ich].get()][0]
-            # get the  channels to run encapsulation at
-            ch_encap = [ich+1 for ich, ch in enumerate(settings_batch['metrics_encap'][2]) if ch.get() == 1]
-            # Get background correction
-            bg_corr = encap_settings['bg_correction'].get()
-            # Get the labels mask. The detection is to be done on the enhanced image
-            m_image = ImageCheck.single_channel(enhanced_image, ch_membrane)
-            mask_labels = BatchRun.encapsulation_mask(m_image, mask_source, det_results, encap_settings)
-            encap_results = BatchRun.encapsulation(mat_image, mask_labels, ch_encap, bg_corr)
+        # Run the encapsulation efficiency analysis, if there are vesicles
+        if settings_batch['metrics_encap'][0].get() == 1 and det_results is not None:
+            def encapsulation():
+                print('Computing Encapsulation Efficiency')
+                if settings_batch['metrics_encap'][1].get() == 0:
+                    mask_source = 'detection'
+                else:
+                    mask_source = 'refined'
+                # Get the settings for encapsulation refined mask
+                encap_settings = controller.appdata_settingsencap
+                # Get the membrane channel
+                ch_membrane = [ich for ich in [1,2,3,4] if 'membrane' in controller.appdata_channels[ich].get()][0]
+                # get the  channels to run encapsulation at
+                ch_encap = [ich+1 for ich, ch in enumerate(settings_batch['metrics_encap'][2]) if ch.get() == 1]
+                # Get background correction
+                bg_corr = encap_settings['bg_correction'].get()
+                # Get the labels mask. The refined mask is detected on the enhanced image,
+                # the detection mask only needs the size of the image
+                def labels_mask():
+                    if mask_source == 'refined':
+                        m_image = ImageCheck.single_channel(enhanced_image(), ch_membrane)
+                    else:
+                        m_image = ImageCheck.single_channel(mat_image, ch_membrane)
+                    return BatchRun.encapsulation_mask(m_image, mask_source, det_results, encap_settings)
+                params_mask = [params_enhance, ch_membrane, mask_source, array_hash(det_results['rois']),
+                            settings_snapshot(encap_settings)]
+                mask_labels = stage_cache.cached(image_key, 'encapsulation_mask', params_mask, labels_mask)
+                encap_results = BatchRun.encapsulation(mat_image, mask_labels, ch_encap, bg_corr, monitor)
+                return encap_results, mask_labels
+
+            encap_results, mask_labels = BatchRun.stage(checkpoint, img_name, 'encapsulation', stage_keys, encapsulation,
+                                                    monitor)
             # Visualize mask used
             if display_results is True:
                 controller.gw_maindisplay.overlay_mask(mask_labels, alpha = 0.3, remove_old = True)
@@ -352,209 +580,147 @@ class BatchRun():
         # Return the detection results
         return det_results, bma_results, profiles_results, encap_results
 
-    def enhancement(input_image, settings_enhance, enhance_type, det_method = None):
+    def stage(checkpoint, img_name, stage, stage_keys, compute, monitor = None):
+
+        # Run a stage of the batch processing, or get its output from the checkpoint
+        # if it has been completed before with the same key. The stage is timed by the monitor
+        if monitor is None:
+            monitor = PipelineMonitor()
+
+        with monitor.stage(stage):
+            if checkpoint is None:
+                return compute()
+
+            found, output = checkpoint.load(img_name, stage, stage_keys[stage])
+            if found is True:
+                print(f'Skipping {stage}: results found in checkpoint')
+            else:
+                output = compute()
+                checkpoint.save(img_name, stage, stage_keys[stage], output)
+
+        return output
+
+    def template_key(controller, settings_batch):
+
+        # Hash of the template image, if the detection uses it
+        det_method = settings_batch['vesdet_method'][0].get().lower()
+        if 'template' in det_method and controller.appdata_templateimage is not None:
+            return array_hash(controller.appdata_templateimage)
+
+        return None
+
+    def stage_keys(controller, settings_batch, input_key, template_key = None):
+
+        """
+        Keys of the stages of the batch processing. The key of each stage is a hash of the key
+        of the stages it depends on and of its settings, such that changing a setting only
+        invalidates the stages that use it (and the ones after them)
+
+        INPUT:
+            controller: main application, with the settings of each analysis
+            settings_batch: dictionary, batch processing settings
+            input_key: string, hash of the input image
+            template_key: string, hash of the template image (see template_key). If None, it's computed
+        OUTPUT:
+            stage_keys: dictionary, {stage: key}
+        """
+
+        det_method = settings_batch['vesdet_method'][0].get().lower()
+        vesdet_channel = int(settings_batch['vesdet'][0].get())
+        # Channel labels, as set after the detection (the detection channel is the membrane channel)
+        channels = {ich: controller.appdata_channels[ich].get() for ich in [1,2,3,4]}
+        channels[vesdet_channel] = 'membrane'
+        # Template image used for the detection
+        if template_key is None:
+            template_key = BatchRun.template_key(controller, settings_batch)
+        # Enhancement settings, without the status of the current image
+        settings_enhance = {k: v for k, v in controller.appdata_settingsenhance.items() if k != 'ch_status'}
+
+        stage_keys = {}
+        stage_keys['enhancement'] = settings_hash(input_key, det_method, settings_snapshot(settings_batch['preprocess']),
+                                                settings_snapshot(settings_enhance))
+        stage_keys['detection'] = settings_hash(stage_keys['enhancement'], vesdet_channel, template_key,
+                                                settings_snapshot(controller.appdata_settingsvesdet),
+                                                settings_snapshot(settings_batch['subpixel']))
+        stage_keys['membrane'] = settings_hash(stage_keys['detection'], settings_snapshot(settings_batch['membrane']),
+                                                settings_snapshot(controller.appdata_settingsbma))
+        stage_keys['profiles'] = settings_hash(stage_keys['membrane'], channels,
+                                                settings_snapshot([settings_batch['intprofiles_an'], settings_batch['intprofiles_rad']]),
+                                                settings_snapshot(controller.appdata_settingsiprofile))
+        stage_keys['encapsulation'] = settings_hash(stage_keys['detection'], channels,
+                                                settings_snapshot(settings_batch['metrics_encap']),
+                                                settings_snapshot(controller.appdata_settingsencap))
+        stage_keys['export'] = settings_hash(stage_keys['profiles'], stage_keys['encapsulation'],
+                                                settings_snapshot([settings_batch['vesdet'][1], settings_batch['export_format'][0],
+                                                                settings_batch['savedir']]))
+
+        return stage_keys
+
+    def enhancement(input_image, settings_enhance, enhance_type, det_method = None, buffers = None):
 
         # For smoothing and enhancement, we take the full image
         # enhance_type = [smooth, enhance], Boolean
+        # buffers: dictionary with the arrays reused between images, None to allocate new ones
 
         # Update enhancement settings based on detection method
         if len(settings_enhance['current'][1].get()) < 1:
             method_key = [x for x in settings_enhance.keys() if x in det_method]
-            settings_enhance['current'][0].set(method_key[0])
+            settings_enhance['current'][0] = method_key[0]
             settings_enhance['current'][1].set(str(settings_enhance[method_key[0]][0]))
             settings_enhance['current'][2].set(str(settings_enhance[method_key[0]][1]))
+            settings_enhance['current'][3].set(settings_enhance[method_key[0]][2])
 
-        if enhance_type[0] is True:
-            # Get the filter size for smoothing
-            filter_size = int(settings_enhance['current'][1].get())
-            # Check that filter size is odd, and force it if it's not
-            filter_size = ImageFilters.check_filtersize(filter_size)
+        # Filter sizes for smoothing and enhancing, None to skip the step
+        smooth_size = int(settings_enhance['current'][1].get()) if enhance_type[0] is True else None
+        enhance_size = int(settings_enhance['current'][2].get()) if enhance_type[1] is True else None
+        # Get the background estimator for enhancing
+        enhance_method = settings_enhance['current'][3].get()
 
-            # Smooth image
-            smoothed_image = ImageFilters.smooth(input_image, filter_size)
-        else:
-            smoothed_image = input_image.copy()
+        # Smooth and enhance the image in a single pass, reusing the buffers if given
+        return detection.enhance(input_image, smooth_size, enhance_size, enhance_method, buffers)
 
-        if enhance_type[1] is True:
-            # Get the filter size for enhancing
-            filter_size = int(settings_enhance['current'][2].get())
-            # Check that filter size is off, and force it if it's not
-            filter_size = ImageFilters.check_filtersize(filter_size)
+    def vesicledet(input_image, det_method, settings_det, template_image = None, monitor = None):
 
-            # Enhance image
-            enhanced_image = ImageFilters.enhance(smoothed_image, filter_size)
-        else:
-            enhanced_image = smoothed_image
-
-        # Return the output image
-        return enhanced_image
-
-    def vesicledet(input_image, det_method, settings_det, template_image = None):
-
-        # Initialise mask_regions variable, used only in floodfill
-        mask_regions = None
-        if 'hough' in det_method:
-            # Run hough detection
-            det_vesicles = VesicleDetection.hough(input_image, settings_det)
-        elif 'template' in det_method:
-            # Run Template Matching. There needs to be a template image!
-            if template_image is None:
-                print('ERROR: no template image found, set or load a template first!')
-                det_vesicles = None
-            else:
-                det_vesicles = VesicleDetection.template(input_image, template_image, settings_det)
-        else:
-            # Run Floodfill detection
-            det_vesicles, mask_regions = VesicleDetection.floodfill(input_image, settings_det)        
+        # Run the detection with the settings of the vesicle detection panel
+        return detection.detect(input_image, det_method, settings_det, template_image, monitor)
 
-        if det_vesicles is not None:
-            # Format results accordingly
-            det_results = VesicleDetection.save_results(det_vesicles, det_method.split()[0], mask_regions)
-        else:
-            print('No vesicles were detected with current method and settings')
-            det_results = None
+    def refine(input_image, det_results):
+
+        # Fit the membrane around each detected vesicle, return the refined detection results
+        return detection.refine(input_image, det_results)
 
-        return det_results
-   
-    def anprofiles(input_image, nvesicles, det_results, ch_toint, settings_int, appdata_channels):
+    def anprofiles(input_image, det_results, ch_toint, settings_int, appdata_channels, monitor = None):
 
         # Get normalisation option. Only intensity normalisation is valid here
         norm_int = bool(settings_int['int_norm'].get())
         #  Get angular interval
         dtheta = int(settings_int['angular_profile'][1].get())
+        # Background correction of each channel, and channels labelling the membrane
+        bg_corr = {ic: settings_int['bg_corr'][ic-1].get() for ic in ch_toint}
+        membrane_channels = [ic for ic in ch_toint if 'membrane' in appdata_channels[ic].get()]
 
-        # Run the computation for all the vesicles.
-        # Initialise variable to store the results
-        all_profiles = {}
-        # Compute for each desired channel
-        for ic in ch_toint:
-            # Get the type of structure labeled with the channel. If membrane, apply rlim
-            if 'membrane' in appdata_channels[ic].get(): 
-                rlim_channel = True
-            else:
-                rlim_channel = None
-            # Get the image from the corresponding channel
-            mat_image = ImageCheck.single_channel(input_image, ic)
-            # Correct the background intensity for the whole image, if required
-            bg_corr = settings_int['bg_corr'][ic-1].get()
-            if 'Image' in bg_corr: 
-                mat_image = ImageCorrection.substract_background(mat_image.astype('float16'), corr_type = bg_corr)
-
-            for ivesicle in range(nvesicles):
-                # Get bounding box
-                image_bbox, bbox_center, rlim_results = BatchRun.bbox_profiles(mat_image, det_results, int(ivesicle))
-                # Set limits to compute segmented membrane radius
-                if rlim_channel is True:
-                    rlim_channel = rlim_results
-               
-                # Correct background intensity for the ROI, if required
-                if 'ROI' in bg_corr:
-                    image_bbox = ImageCorrection.substract_background(image_bbox.astype('float16'), corr_type = bg_corr)
-                # Compute angular profiles
-                angular_profiles, mean_radius, _ = ProfileIntegration.angular(image_bbox, bbox_center[0:2], dtheta,
-                                                                            rlim = rlim_channel, 
-                                                                            norm = norm_int)
-                s_vesicle = f'ves {ivesicle + 1}'
-                if s_vesicle not in all_profiles.keys():
-                    all_profiles[s_vesicle] = {'mean radius': mean_radius}
-                all_profiles[f'ves {ivesicle + 1}'][f'ch {ic}'] =  angular_profiles
-                
-        return all_profiles
+        return profiles.angular_profiles(input_image, det_results, ch_toint, dtheta, norm_int, bg_corr,
+                                        membrane_channels, monitor)
 
-    def radprofiles(input_image, nvesicles, det_results, ch_toint, settings_int):
+    def radprofiles(input_image, det_results, ch_toint, settings_int, monitor = None):
 
         # Get normalisation options. Both intensity and radial normalisation are valid
         norm_int = bool(settings_int['int_norm'].get())
         norm_rad = bool(settings_int['rad_norm'].get())
         # Get radial interval
-        dr = int(settings_int['radial_profile'][1].get()) 
-
-        # Run the computation for all the vesicles. 
-        # Initialise variable to store the results
-        all_profiles = {}
-
-        # Compute for each desired channel
-        for ic in ch_toint:
-            # Get the image from the corresponding channel
-            mat_image = ImageCheck.single_channel(input_image, ic)
-            # Correct the background intensity for the whole image, if required
-            bg_corr = settings_int['bg_corr'][ic-1].get()
-            if 'Image' in bg_corr: 
-                mat_image = ImageCorrection.substract_background(mat_image.astype('float16'), corr_type = bg_corr)
-            for ivesicle in range(nvesicles):
-                # Get bounding box
-                image_bbox, bbox_center, rlim_results = BatchRun.bbox_profiles(mat_image, det_results, int(ivesicle))
-                
-                # Correct background intensity for the ROI, if required
-                if 'ROI' in bg_corr:
-                    image_bbox = ImageCorrection.substract_background(image_bbox.astype('float16'), corr_type = bg_corr)
-                # Compute the radial profiles
-                radial_profiles, found_error = ProfileIntegration.radial(image_bbox, bbox_center[0:2], dr, 
-                                                                    norm = norm_int)
-                # If required, normalise the radius
-                if norm_rad is True:
-                    radial_profiles[:,0] /= bbox_center[-1]
-                
-                s_vesicle = f'ves {ivesicle + 1}'
-                if s_vesicle not in all_profiles.keys():
-                    all_profiles[s_vesicle] = { }
-                all_profiles[f'ves {ivesicle + 1}'][f'ch {ic}'] =  radial_profiles
-
-        return all_profiles
-
-    def bbox_profiles(mat_image, det_results, ivesicle):
-
-        # Get the bounding box for the vesicles in the intensity profiles computation
-
-        # The detection results will be a dictionary for the output of vesicle detection
-        if isinstance(det_results, dict):
-            [xc, yc, r] = det_results['rois'][ivesicle][:3]
-            if 'hough' not in det_results['method']:
-                r /= 2
-            rlim_results = None
-        else:
-            [xc, yc] = det_results[ivesicle,[0,1]]
-            r = det_results[ivesicle, 3]
-            rlim_results = [det_results[ivesicle, 2], r]
+        dr = int(settings_int['radial_profile'][1].get())
+        # Background correction of each channel
+        bg_corr = {ic: settings_int['bg_corr'][ic-1].get() for ic in ch_toint}
 
-        # Set bounding box coordinates and center
-        x1, x2 = int(xc - r - 5), int(xc + r + 5)
-        y1, y2 = int(yc - r - 5), int(yc + r + 5)
-        bbox_center = [int(xc-x1), int(yc-y1), r]
+        return profiles.radial_profiles(input_image, det_results, ch_toint, dr, norm_int, norm_rad, bg_corr, monitor)
 
-        # Get the image only to the bounding box of the detected vesicle
-        image_bbox = mat_image[y1:y2, x1:x2]
-
-        return image_bbox, bbox_center, rlim_results
-    
     def encapsulation_mask(input_image, mask_source, det_results, det_settings):
 
-        if mask_source == 'detection':
-            if det_results['method'] == 'hough': half_r = False
-            else: half_r = True
-            try: 
-                mask_all = det_results['mask_rois']
-            except KeyError:
-                mask_all = GeoMat.mask_contours(det_results['rois'], input_image.shape[0:2], half_r)
-        else:
-            # Get the image from the membrane channel
-            mask_all = EncapEfficiency.mask_refined(input_image, det_results['rois'], 
-                                        float(det_settings['flood_th'].get()),
-                                        det_settings['flood_minarea'])
+        # Labels mask from the detection, or refined with the settings of the encapsulation panel
+        return encapsulation.encapsulation_mask(input_image, det_results, mask_source,
+                                                float(det_settings['flood_th'].get()), det_settings['flood_minarea'])
 
-        mask_labels = mask_all.astype(int)
+    def encapsulation(input_image, mask_labels, channels, bg_corr, monitor = None):
 
-        return mask_labels
-    
-    def encapsulation(input_image, mask_labels, channels, bg_corr):
-        
         # Compute the encapsulation efficiency for each selected channel
-        # Initialise variable to store results
-        encap_results = {}
-        for ich in channels:
-            mat_image = ImageCheck.single_channel(input_image, ich)
-            encap_results_ch, _ = EncapEfficiency.run(mat_image, mask_labels, bg_corr)
-            masked_image = mat_image*(mask_labels >0).astype(int)
-            encap_results[f'ch {ich}'] = [encap_results_ch, masked_image]
-
-        return encap_results
\ No newline at end of file
+        return encapsulation.encapsulation(input_image, mask_labels, channels, bg_corr, monitor)
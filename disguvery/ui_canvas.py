@@ -22,10 +22,12 @@ from tkinter import ttk
 
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.widgets import RectangleSelector, LassoSelector
+from matplotlib.path import Path
 
 import numpy as np
 
-from display import ImageDisplay, ObjectDisplay
+from display import ImageDisplay, ObjectDisplay, ChannelCompositor, MaskOverlay
 
 class CanvasFullImage():
 
@@ -60,6 +62,18 @@ class CanvasFullImage():
         self.canvas = canvas
         self.axis_img = axis_img
 
+        # The overlays (objects, labels and mask points) are animated artists, drawn on top of
+        # the rendered image kept as background. Updating them only redraws the overlays (blitting)
+        self.background = None
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+        # Composite of the channels, when all of them are shown
+        self.compositor = ChannelCompositor()
+        self.shown_channel = None
+        self.shown_image = None
+        # Raster layer of the last mask shown
+        self.s_smask = None
+
     def clear_axis(self):
 
         # clear axis
@@ -101,7 +115,10 @@ class CanvasFullImage():
         except (AttributeError, ValueError):
             pass
         
-        self.s_img = ImageDisplay.show_image(img, img_axis, cmap_options, current_channel)
+        self.s_img = ImageDisplay.show_image(img, img_axis, cmap_options, current_channel, self.compositor,
+                                            self.contrast_limits())
+        self.shown_channel = current_channel
+        self.shown_image = img
         self.canvas.draw()
 
         # If required, update the current working image
@@ -109,6 +126,35 @@ class CanvasFullImage():
         if update_current == True:
             self.shown_ascurrent(img, current_channel)
 
+    def contrast_limits(self):
+
+        # Contrast limits of the channels of the current image, set in the contrast panel
+        try:
+            img_name = self.controller.appdata_imagesource['name']
+            return self.controller.appdata_colormap['limits'].get(img_name, {})
+        except (AttributeError, KeyError):
+            return {}
+
+    def update_channel(self, channel, colormap = None, limits = None):
+
+        # Change the colormap and/or the contrast limits of a channel of the shown image (channels start at 1).
+        # When all the channels are shown, only the changed channel is mapped again
+        if self.shown_channel == 0:
+            self.s_img.set_data(self.compositor.set_channel(channel - 1, colormap, limits))
+        elif channel == self.shown_channel:
+            self.s_img.set_data(self.shown_image)
+            if colormap is not None: self.s_img.set_cmap(colormap)
+            if limits is not None: self.s_img.set_clim(*limits)
+        else:
+            return
+        self.canvas.draw()
+
+    def show_preview(self, rgb_preview):
+
+        # Show a downsampled RGB preview in place of the image, with the same extent (see ImageDisplay.preview_level)
+        self.s_img.set_data(rgb_preview)
+        self.canvas.draw()
+
     def clear_showobject(self, drawn_object, **kwargs):
 
         # Get image axis where to display
@@ -116,18 +162,15 @@ class CanvasFullImage():
         # Get label of old artist objects
         label_old = kwargs.get('label_old', 'vesicle')
        
-        # Clear old patch objects
-        if label_old == 'all':
-            old_objects = [x for x in img_axis.patches]
-            old_text = [x for x in img_axis.texts]
-        else:
-            old_objects = [x for x in img_axis.patches if label_old == x.get_label()]
-            old_text = [x for x in img_axis.texts if label_old in x.get_label()]
-
-        for patch in old_objects:
-            img_axis.patches.remove(patch)
-        for s in old_text:
-            img_axis.texts.remove(s)
+        # Clear old overlays: the collections of objects have the label of the objects,
+        # and the collections of text labels their label followed by '_text'
+        for overlay in self.overlays(img_axis):
+            if label_old == 'all':
+                overlay.remove()
+            elif overlay.get_gid() == 'roi' and label_old == overlay.get_label():
+                overlay.remove()
+            elif overlay.get_gid() == 'roi_text' and label_old in overlay.get_label():
+                overlay.remove()
 
         # If the drawn_object is not none, it adds the artists
         if drawn_object is not None: 
@@ -137,8 +180,8 @@ class CanvasFullImage():
             else:
                 ObjectDisplay.show_object(drawn_object, img_axis, **kwargs)
         
-        # Draw canvas
-        self.canvas.draw()
+        # Draw the overlays
+        self.update_overlays(img_axis)
         
     def overlay_mask(self, mask, **kwargs):
         
@@ -155,7 +198,9 @@ class CanvasFullImage():
                 pass
 
         # Show mask on axis without clearing it
-        self.s_mask = self.axis_img.imshow(mask, alpha = c_alpha, cmap = colormap, zorder = 10)
+        # The labels of the mask are not averaged when zoomed out
+        self.s_mask = ImageDisplay.imshow(mask, self.axis_img, cmap = colormap, alpha = c_alpha, zorder = 10,
+                                        average = False)
 
         # Draw canvas
         self.canvas.draw()
@@ -176,29 +221,28 @@ class CanvasFullImage():
         # Get color for the scatter points
         scolor = kwargs.get('color', 'blue')
 
-        # clear old objects if required
+        # clear old points if required
         if remove_old is True:
-            old_scatter = [x for x in img_axis.collections if label_old in x.get_label()]
-            for s in old_scatter:
-                img_axis.collections.remove(s)
+            for s in self.mask_overlays(img_axis):
+                if label_old in s.get_label():
+                    s.remove()
         
-        # If the scatter points is not none, add the collection with the desired label
+        # If the scatter points is not none, add them to the raster layer with the desired label
         if scatter_points is not None:
-            img_axis.scatter(scatter_points[0], scatter_points[1], s = 1, marker = '.',
-                            c = scolor, label = label_new)
+            layer = [x for x in self.mask_overlays(img_axis) if x.get_label() == label_new and x is not self.s_smask]
+            if layer:
+                layer = layer[-1]
+            else:
+                layer = img_axis.add_artist(MaskOverlay(label = label_new, zorder = 1))
+            layer.add_points(scatter_points[0], scatter_points[1], scolor)
 
-        # Draw canvas
-        self.canvas.draw()
+        # Draw the overlays
+        self.update_overlays(img_axis)
   
     def show_scattermask(self, mask, **kwargs):
 
-        # Get the coordinates of the mask
-        ye, xe = np.where(mask)
-
-        # If there is an offset, add it to the coordinates
+        # If there is an offset, the mask is placed at this position of the image
         offset_points = kwargs.get('offset', [0,0])
-        xe = xe + offset_points[0]
-        ye = ye + offset_points[1]
 
         # Get the color for hte points drawn
         point_color = kwargs.get('color', 'orange')
@@ -214,11 +258,70 @@ class CanvasFullImage():
             except (AttributeError, ValueError):
                 pass
 
-        # Show the points overlayed
-        self.s_smask = self.axis_img.scatter(xe, ye, s = 1, marker = '.', c = point_color, label = label_scatter)
+        # Show the pixels of the mask as a raster layer
+        self.s_smask = self.axis_img.add_artist(MaskOverlay(label = label_scatter, zorder = 1))
+        self.s_smask.add_mask(mask, point_color, offset = offset_points)
 
-        # Draw canvas
-        self.canvas.draw()
+        # Draw the overlays
+        self.update_overlays()
+
+    def mask_overlays(self, img_axis = None):
+
+        # Raster layers of masks and contour points drawn on the image
+        if img_axis is None: img_axis = self.axis_img
+        return [x for x in img_axis.artists if isinstance(x, MaskOverlay)]
+
+    def on_draw(self, event):
+
+        # After a full draw of the canvas, keep the rendered image as background and draw the
+        # overlays on top. Figures saved from the toolbar are drawn with their own renderer
+        if event.renderer is getattr(self.canvas, 'renderer', None):
+            self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        for artist in sorted(self.axis_img.collections + self.mask_overlays(), key = lambda x: x.get_zorder()):
+            if artist.get_animated():
+                artist.draw(event.renderer)
+
+    def animated_overlays(self):
+
+        # Collections and raster layers drawn on top of the background (objects, labels and mask points),
+        # in drawing order. The ones added since the last update become animated
+        overlays = self.axis_img.collections + self.mask_overlays()
+        for artist in overlays:
+            artist.set_animated(True)
+
+        return sorted(overlays, key = lambda x: x.get_zorder())
+
+    def update_overlays(self, img_axis = None):
+
+        # Redraw only the overlays on the background. A full draw is done if there is no background yet,
+        # or if the overlays are not in the main image axis
+        overlays = self.animated_overlays()
+        if self.background is None or (img_axis is not None and img_axis is not self.axis_img):
+            self.canvas.draw()
+            return
+
+        self.canvas.restore_region(self.background)
+        for artist in overlays:
+            self.axis_img.draw_artist(artist)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def overlays(self, img_axis = None):
+
+        # Collections of objects and of text labels drawn on the image
+        if img_axis is None: img_axis = self.axis_img
+        return [x for x in img_axis.collections if x.get_gid() in ['roi', 'roi_text']]
+
+    def text_labels(self, img_axis = None):
+
+        # Collections of text labels drawn on the image
+        return [x for x in self.overlays(img_axis) if x.get_gid() == 'roi_text']
+
+    def color_labels(self, color):
+
+        # Set the color of all the text labels and update the canvas
+        for labels in self.text_labels():
+            labels.set_label_colors(color)
+        self.update_overlays()
 
     def shown_ascurrent(self, img, channel):
 
@@ -245,19 +348,21 @@ class CanvasFullImage():
                 self.cid_pick = self.canvas.mpl_connect('pick_event', lambda event: self.select_object(event))
             # Initialise selected objects variable
             self.object_selected = []
-            # Configure all the text objects in the canvas to be pickable
-            for s in self.axis_img.texts:
-                s.set(picker = 20, color = on_color)
+            # Configure all the text labels in the canvas to be pickable
+            for labels in self.text_labels():
+                labels.set_picker(20)
+                labels.set_label_colors(on_color)
             state_mpl = 'connected'
         else:
             del self.cid_pick
             if delete_on_disconnect == True: 
                 del self.object_selected
-            for s in self.axis_img.texts:
-                s.set(picker = False, color = off_color)
+            for labels in self.text_labels():
+                labels.set_picker(False)
+                labels.set_label_colors(off_color)
             state_mpl = 'disconnected'
 
-        self.canvas.draw()
+        self.update_overlays()
 
         return state_mpl
 
@@ -276,41 +381,102 @@ class CanvasFullImage():
         else:
             del self.cid_right
 
+    def bind_region(self, mode = 'box'):
+
+        # Select all the objects within a box or a lasso drawn with the left button.
+        # Any previous region selector is replaced
+        self.unbind_region()
+        if mode == 'box':
+            self.region_selector = RectangleSelector(self.axis_img,
+                                        lambda eclick, erelease: self.select_box(eclick, erelease),
+                                        useblit = True, button = [1], minspanx = 5, minspany = 5,
+                                        spancoords = 'pixels')
+        else:
+            self.region_selector = LassoSelector(self.axis_img, lambda verts: self.select_region(verts),
+                                        useblit = True, button = [1])
+
+    def unbind_region(self):
+
+        # Disconnect the region selector, if any
+        try:
+            self.region_selector.set_active(False)
+            self.region_selector.disconnect_events()
+        except AttributeError:
+            pass
+        else:
+            del self.region_selector
+
+    def select_box(self, eclick, erelease):
+
+        # Corners of the box, in data coordinates
+        x0, x1 = sorted([eclick.xdata, erelease.xdata])
+        y0, y1 = sorted([eclick.ydata, erelease.ydata])
+        self.select_region([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+
+    def select_region(self, verts):
+
+        # Select the objects whose center is within the polygon, in a single query for all of them
+        if len(verts) < 3 or any(v[0] is None or v[1] is None for v in verts):
+            return
+        if not hasattr(self, 'object_selected'):
+            self.object_selected = []
+        region = Path(verts)
+        (x0, y0), (x1, y1) = np.min(verts, axis = 0), np.max(verts, axis = 0)
+        for labels in self.text_labels():
+            # Labels that can't be picked (e.g. the hidden labels of the membrane circles) are not selected
+            if not labels.get_picker():
+                continue
+            # Candidates from the spatial index, then the centers within the polygon
+            candidates = labels.index.in_box(x0, x1, y0, y1)
+            selected = candidates[region.contains_points(labels.positions[candidates])]
+            if len(selected) == 0:
+                continue
+            labels.set_label_colors('deeppink', selected)
+            self.object_selected.extend((labels.ids[selected].astype(int) - 1).tolist())
+
+        # Update the overlays
+        self.update_overlays()
+
     def select_object(self, event,**kwargs):
 
         # Only proceed if the event was triggered with the left click
         if event.mouseevent.button == 1:
-            # Get the artist that was selected and highlight it
-            selected_object = event.artist
-            selected_object.set(color = 'deeppink')
+            # Get the label of the object that was selected and highlight it
+            labels, ind = event.artist, event.ind[0]
+            labels.set_label_colors('deeppink', [ind])
             # Ge the text, it should be equal to the vesicle id
-            selected_id = int(selected_object.get_text()) - 1
+            selected_id = int(labels.ids[ind]) - 1
             # Add selected id to the variable of selected objects
             self.object_selected.append(selected_id)
             
-            # Update canvas
-            self.canvas.draw()
+            # Update the overlays
+            self.update_overlays()
 
     def delete_selected(self, event, input_data, **kwargs):
 
         if event.button == 3:
             # Keep only the unique elements of the object selection and clear original variable
-            selected_ids  = list(set(self.object_selected))
+            selected_ids  = np.unique(np.asarray(self.object_selected, dtype = int))
             self.object_selected = []
+            if len(selected_ids) == 0:
+                return
 
             # Delete the selected objects from input data (input data is numpy array)
             clean_data = np.delete(input_data[1], selected_ids, axis = 0)
             input_data[1] = clean_data
 
-            # Delete the selected objects from the mask data
+            # Delete the selected objects from the mask data, and relabel the remaining ones
+            # from 1 (the mask is changed in place)
             mask_data = kwargs.get('input_mask', None)
             if mask_data is not None:
-                for s_ind in selected_ids:
-                    mask_data[mask_data == (s_ind+1)] = 0
-                for ic, ilabel in enumerate(np.unique(mask_data.flatten())[1:]):
-                    mask_data[mask_data == ilabel] = ic+1
-                self.s_mask.remove()
-                self.overlay_mask(mask_data, alpha = 0.3)
+                ImageDisplay.delete_labels(mask_data, selected_ids + 1)
+                # Only the data of the mask is updated, and the background is drawn again
+                try:
+                    self.s_mask.set_data(mask_data)
+                    self.s_mask.set_clim(np.min(mask_data), np.max(mask_data))
+                except AttributeError:
+                    self.overlay_mask(mask_data, alpha = 0.3)
+                self.background = None
             # Update canvas with the clean results
             self.clear_showobject(input_data, textcolor = 'skyblue', pick = 20)
 
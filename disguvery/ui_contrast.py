@@ -0,0 +1,229 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# import tkinter
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+# import custom widgets
+import ui_custom_widgets as ctk
+# import custom canvas
+from ui_canvas import CanvasEmbeddedPlot
+
+from display import ImageDisplay, ChannelCompositor
+from core.pipeline import array_hash
+from core.image_processing import ImageType
+
+class ContrastPanel():
+
+    # Colormaps offered for the channels
+    colormaps = ['gray', 'hot', 'cividis', 'viridis', 'magma', 'inferno', 'Greens', 'Reds', 'Blues', 'Purples']
+
+    def __init__(self, controller = None):
+        # As the contrast panel is a toplevel window it doesn't need a master widget
+        # We do need the controller to trigger actions easily
+        self.controller = controller
+
+        # Initialise the contrast panel
+        contrastpanel = ctk.ControlPanel(title = 'Contrast')
+
+        # Configure layout of the panel
+        contrastpanel.configure_layout(rows = [1], cols = [0])
+
+        # Create frame containers for widgets
+        all_frames = [f_channel, f_display, f_settings] = contrastpanel.create_frames(3)
+        for n, iframe in enumerate(all_frames):
+            iframe.grid(row = n, column = 0, sticky = 'nsew', padx = 5, pady = 5)
+        f_settings.columnconfigure(1, weight = 1)
+
+        # Create and place the channel and colormap selection
+        self.channel_var = tk.StringVar()
+        self.colormap_var = tk.StringVar()
+        ch_label = ttk.Label(f_channel, text = 'Channel: ')
+        self.ch_combobox = ttk.Combobox(f_channel, width = 10, state = 'readonly', textvariable = self.channel_var)
+        cmap_label = ttk.Label(f_channel, text = 'Colormap: ')
+        cmap_combobox = ttk.Combobox(f_channel, width = 10, state = 'readonly', textvariable = self.colormap_var,
+                                    values = ContrastPanel.colormaps)
+        for n, w in enumerate([ch_label, self.ch_combobox, cmap_label, cmap_combobox]):
+            w.grid(row = 0, column = n, sticky = 'nsw', padx = 5, pady = 5)
+        self.ch_combobox.bind('<<ComboboxSelected>>', lambda event: self.select_channel())
+        cmap_combobox.bind('<<ComboboxSelected>>', lambda event: self.set_colormap())
+
+        # Create and place canvas for the histogram
+        self.display = CanvasEmbeddedPlot(f_display, small_font = True)
+
+        # Create and place the sliders of the contrast limits
+        self.limits_var = [tk.DoubleVar(), tk.DoubleVar()]
+        self.sliders = []
+        for n, s in enumerate(['Min: ', 'Max: ']):
+            l = ttk.Label(f_settings, text = s)
+            l.grid(row = n, column = 0, sticky = 'nsw', padx = 5, pady = 5)
+            slider = ttk.Scale(f_settings, orient = 'horizontal', length = 250, variable = self.limits_var[n],
+                            command = lambda value, n = n: self.preview(n))
+            slider.grid(row = n, column = 1, sticky = 'nsew', padx = 5, pady = 5)
+            # The full image is only updated when the slider is released
+            slider.bind('<ButtonRelease-1>', lambda event: self.apply())
+            value_label = ttk.Label(f_settings, width = 8, textvariable = self.limits_var[n])
+            value_label.grid(row = n, column = 2, sticky = 'nsw', padx = 5, pady = 5)
+            self.sliders.append(slider)
+
+        # Create and place buttons
+        auto_button = ttk.Button(f_settings, text = 'Auto', command = self.auto)
+        reset_button = ttk.Button(f_settings, text = 'Reset', command = self.reset)
+        auto_button.grid(row = 2, column = 0, sticky = 'nsew', padx = 5, pady = 5)
+        reset_button.grid(row = 2, column = 1, sticky = 'nsw', padx = 5, pady = 5)
+
+        # Place close button
+        contrastpanel.closeButton.grid(row = 3, column = 0, sticky = 'nse', padx = 5, pady = 5)
+
+        # Keep track of window
+        self.window = contrastpanel
+
+        # Get the histograms of the current image and show the first channel
+        self.load_image()
+
+    def load_image(self):
+
+        # Image shown in the main display, and its histograms. The histograms are kept in the stage cache
+        # if it's used (the image is only hashed for the cache)
+        maindisplay = self.controller.gw_maindisplay
+        self.image = maindisplay.shown_image
+        if self.image is None:
+            print('There is no image to adjust. Open an image first.')
+            return
+        stage_cache = self.controller.appdata_stagecache
+        compute = lambda: ImageDisplay.histograms(self.image, 256)
+        if stage_cache.active():
+            self.histograms = stage_cache.cached(array_hash(self.image), 'histograms', [256], compute)
+        else:
+            self.histograms = compute()
+
+        # Channels that can be adjusted: all of them if they are all shown, the shown one otherwise
+        if maindisplay.shown_channel == 0:
+            channels = list(range(1, self.image.shape[2] + 1))
+        else:
+            channels = [maindisplay.shown_channel]
+        self.ch_combobox.config(values = [f'Channel {ch}' for ch in channels])
+        self.ch_combobox.current(0)
+
+        # Preview of the shown image, averaged down to fit in the main display (see ImagePyramid)
+        width, height = maindisplay.canvas.get_width_height()
+        preview, _ = ImageDisplay.preview_level(self.image, max(width, height, 256))
+
+        # Compositor of the preview, with the current colormaps and limits of the shown channels
+        if preview.ndim == 2: preview = preview[:,:,None]
+        cmap_options = self.controller.appdata_colormap['channels']
+        self.preview_compositor = ChannelCompositor()
+        self.preview_compositor.set_image(preview, [cmap_options[ch] for ch in channels],
+                                        [self.image_limits().get(ch, None) for ch in channels])
+        self.select_channel()
+
+    def channel(self):
+
+        # Current channel of the panel (starting at 1)
+        return int(self.channel_var.get().split()[-1])
+
+    def channel_index(self):
+
+        # Index of the current channel in the shown image (and in its histograms and preview)
+        return self.ch_combobox.current()
+
+    def select_channel(self):
+
+        # Show the histogram, the colormap and the limits of the selected channel
+        channel = self.channel()
+        counts, edges = self.histograms[self.channel_index()]
+        self.colormap_var.set(self.controller.appdata_colormap['channels'][channel])
+
+        limits = self.image_limits().get(channel, [edges[0], edges[-1]])
+        for n, slider in enumerate(self.sliders):
+            slider.config(from_ = edges[0], to = edges[-1])
+            self.limits_var[n].set(round(limits[n], 2))
+
+        # Plot the histogram (log scale) and the limits
+        self.display.axis_plot.cla()
+        centers = (edges[:-1] + edges[1:])/2
+        self.display.axis_plot.fill_between(centers, np.log1p(counts), step = 'mid', color = 'lightsteelblue')
+        self.limit_lines = [self.display.axis_plot.axvline(x, color = 'mediumvioletred', lw = 1) for x in limits]
+        self.display.axis_plot.set_xlabel('intensity')
+        self.display.axis_plot.set_ylabel('log(counts)')
+        self.display.canvas.draw()
+
+    def image_limits(self):
+
+        # Contrast limits of the channels of the current image
+        img_name = self.controller.appdata_imagesource['name']
+        return self.controller.appdata_colormap['limits'].setdefault(img_name, {})
+
+    def current_limits(self):
+
+        # Limits of the sliders, keeping min below max
+        lo, hi = self.limits_var[0].get(), self.limits_var[1].get()
+        return [min(lo, hi), max(hi, lo + 1e-6)]
+
+    def preview(self, n_slider):
+
+        # Update the limits on the histogram, and show the preview with the new limits through the lookup tables
+        limits = self.current_limits()
+        self.limits_var[n_slider].set(round(self.limits_var[n_slider].get(), 2))
+        for line, x in zip(self.limit_lines, limits):
+            line.set_xdata([x, x])
+        self.display.canvas.draw_idle()
+
+        rgb_preview = self.preview_compositor.set_channel(self.channel_index(), limits = limits)
+        self.controller.gw_maindisplay.show_preview(rgb_preview)
+
+    def apply(self):
+
+        # Keep the limits of the channel and update the full image
+        limits = self.current_limits()
+        self.image_limits()[self.channel()] = limits
+        self.controller.gw_maindisplay.update_channel(self.channel(), limits = limits)
+
+    def set_colormap(self):
+
+        # Set the colormap of the selected channel
+        colormap = self.colormap_var.get()
+        self.controller.appdata_colormap['channels'][self.channel()] = colormap
+        self.preview_compositor.set_channel(self.channel_index(), colormap = colormap)
+        self.controller.gw_maindisplay.update_channel(self.channel(), colormap = colormap)
+
+    def auto(self):
+
+        # Saturate 0.35% of the pixels at each end. The percentiles are taken on the intensities
+        # of the channel (see ImageType.limits), not on the bins of its histogram
+        channel_image = self.image if self.image.ndim == 2 else self.image[:,:,self.channel_index()]
+        lo, hi = ImageType.limits(channel_image, [0.35, 99.65])
+        self.limits_var[0].set(round(lo, 2))
+        self.limits_var[1].set(round(hi, 2))
+        self.preview(0)
+        self.apply()
+
+    def reset(self):
+
+        # Back to the full range of the channel, forgetting its limits
+        counts, edges = self.histograms[self.channel_index()]
+        self.limits_var[0].set(round(edges[0], 2))
+        self.limits_var[1].set(round(edges[-1], 2))
+        self.preview(0)
+        self.image_limits().pop(self.channel(), None)
+        self.controller.gw_maindisplay.update_channel(self.channel(), limits = [edges[0], edges[-1]])
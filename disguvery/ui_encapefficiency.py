@@ -21,13 +21,13 @@
 from tkinter import ttk
 import tkinter.filedialog
 
-import numpy as np
-from data_processing import GeoMat
+from core.data_processing import GeoMat
 
 # import custom widgets
 import ui_custom_widgets as ctk 
-from image_processing import ImageCheck, ImageCorrection, ImageMask
-from file_handling import FileExport
+from core.image_processing import ImageCheck
+from core.file_handling import FileExport
+from core.encapsulation import EncapEfficiency
 
 class EncapPanel():
 
@@ -234,81 +234,3 @@ class EncapPanel():
                 FileExport.encapsulation_results(filename, self.temp_results_rois, self.temp_results_imgmask)
         else:
             print('There are no encapsulation results to be saved')
-
-class EncapEfficiency():
-
-    def mask_refined(input_image, rois, flood_th, flood_minarea):
-
-        # Build mask of refined floodfill results
-        mask_all = 0*input_image
-
-        for i, vesicle in enumerate(rois):
-            [xc, yc, r] = vesicle[:3]
-            x1, x2 = int(xc - r), int(xc + r)
-            y1, y2 = int(yc - r), int(yc + r)
-
-            # Correct the limits of the bounding box if necessary
-            if x1 < 0: x1 = 0
-            if y1 < 0: y1 = 0
-            if x2 > input_image.shape[1]: x2 = input_image.shape[1]
-            if y2 > input_image.shape[0]: y2 = input_image.shape[0]
-
-            image_th = ImageMask.threshold(input_image[y1:y2, x1:x2], flood_th)
-            min_area = 0.01*flood_minarea*(image_th.shape[0])
-            mask_flood = ImageMask.floodfill(image_th, min_area, method = 'inside')
-            mask_all[y1:y2, x1:x2]= (mask_flood != 0).astype(int)*(i+1)
-          
-
-        return mask_all
-
-    def run(mat_image, mask_labels, bg_corr, return_fordisplay = False):
-
-        roi_labels = np.unique(mask_labels)
-        results_encap = np.zeros_like(roi_labels)
-        roi_area = np.zeros_like(roi_labels)
-
-        # Correct background if required
-        
-        if  bg_corr == 1:
-            bg_corr_type = 'mean'
-            bg_int = ImageCorrection.substract_background(mat_image.astype('float16'), bg_corr_type, inplace = False)
-        elif bg_corr == 2:
-            bg_corr_type = 'ROI corner'
-        else:
-            bg_corr_type = None
-            bg_int = 0
-
-        xall = np.zeros(len(results_encap))
-        yall = np.zeros(len(results_encap))
-
-        for id_roi in roi_labels:
-            mask_roi = 0*mask_labels
-            mask_roi[mask_labels == id_roi] = 1
-            roi_int = mat_image*mask_roi
-            mean_roi_int = np.mean(roi_int[roi_int>0].flatten())
-
-            # If required, correct the ROI corner background
-            if bg_corr_type == 'ROI corner':
-                xmin, ymin = np.min(np.where(mask_roi)[1]), np.min(np.where(mask_roi)[0])
-                xmax, ymax = np.max(np.where(mask_roi)[1]), np.max(np.where(mask_roi)[0])
-                roi_img = mat_image[ymin:ymax, xmin:xmax]
-                bg_int = ImageCorrection.substract_background(roi_img.astype('float16'), bg_corr_type, inplace = False)
-
-            try:
-                xall[id_roi] =  np.mean(np.where(mask_roi)[1])
-            except IndexError:
-                pass
-            else:
-                yall[id_roi] = np.mean(np.where(mask_roi)[0])
-
-                results_encap[id_roi] = mean_roi_int - bg_int
-                roi_area[id_roi] = np.sum(mask_roi)
-
-        results_encap_all = np.stack((roi_labels, xall,yall, results_encap , roi_area), axis = 1)
-    
-        if return_fordisplay is True:
-            results_display = np.stack((xall[1:], yall[1:], results_encap[1:]), axis = 1)
-        else:
-            results_display = None
-
-        return results_encap_all, results_display
\ No newline at end of file
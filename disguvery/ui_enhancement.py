@@ -25,7 +25,7 @@ from tkinter import ttk
 import ui_custom_widgets as ctk
 
 # Import the functions to smooth/enhance the image
-from image_processing import ImageFilters
+from core.image_processing import ImageFilters
 
 class EnhancePanel():
 
@@ -58,6 +58,7 @@ class EnhancePanel():
         enhance_value = str(appdata_settings[current_method][1])
         controller.appdata_settingsenhance['current'][1].set(smooth_value)
         controller.appdata_settingsenhance['current'][2].set(enhance_value)
+        controller.appdata_settingsenhance['current'][3].set(appdata_settings[current_method][2])
 
         # Create settings widgets and place them
         s_label = ttk.Label(f_settings, text = 'Settings: ')
@@ -87,6 +88,14 @@ class EnhancePanel():
         for n, e_widget in enumerate([e_label, e_entry, e_button]):
             e_widget.grid(row = 1, column = n, sticky = 'nsew', padx = 5, pady = 5)
 
+        # Create widgets for the background estimator used to enhance and place them
+        b_label = ttk.Label(f_main, text = 'Background: ')
+        b_combobox = ttk.Combobox(f_main, width = 10, state = 'readonly', values = ImageFilters.background_methods,
+                                    textvariable = controller.appdata_settingsenhance['current'][3])
+
+        for n, b_widget in enumerate([b_label, b_combobox]):
+            b_widget.grid(row = 2, column = n, sticky = 'nsew', padx = 5, pady = 5)
+
         # Place 'Close' Button
         enhancepanel.closeButton.grid(row = 2, column = 0, sticky = 'nse', padx = 2, pady = 2)
 
@@ -106,6 +115,7 @@ class EnhancePanel():
         settings_var['current'][0] = method_key[0]
         settings_var['current'][1].set(smooth_value)
         settings_var['current'][2].set(enhance_value)
+        settings_var['current'][3].set(settings_var[method_key[0]][2])
 
     def save_settings(self):
 
@@ -118,6 +128,7 @@ class EnhancePanel():
         # Set values in respective dictionary
         settings_var[current_method][0] = int(settings_var['current'][1].get())
         settings_var[current_method][1] = int(settings_var['current'][2].get())
+        settings_var[current_method][2] = settings_var['current'][3].get()
 
         # Print message in the terminal to notify the user about the updated settings
         print(f'The membrane enhancement settings for {current_method} detection have been saved.')
@@ -192,8 +203,13 @@ class EnhancePanel():
         # Update settings values
         self.update_filtersize(filter_size, 'enhance')
 
+        # Get the background estimator, and keep it in the settings of the current method
+        settings_var = self.controller.appdata_settingsenhance
+        enhance_method = settings_var['current'][3].get()
+        settings_var[settings_var['current'][0]][2] = enhance_method
+
         # Enhance image
-        enhanced_image = ImageFilters.enhance(mat_image, filter_size)
+        enhanced_image = ImageFilters.enhance(mat_image, filter_size, enhance_method)
         # Update current image with the smoothed image in the right channel
         if update_single_channel is True:
             self.controller.appdata_imagecurrent[:,:,current_channel - 1] = 1*enhanced_image
@@ -23,7 +23,7 @@ from tkinter import ttk
 import os
 # Import custom widgets
 import ui_custom_widgets as ctk
-from file_handling import FileImage
+from core.file_handling import FileImage
 
 class FileManager():
 
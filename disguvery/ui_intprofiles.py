@@ -24,13 +24,16 @@ from tkinter import ttk
 import tkinter.filedialog
 
 import numpy as np
-from data_processing import ProfileIntegration
-from image_processing import ImageCheck, ImageCorrection
+from core.data_processing import ProfileIntegration
+from core.image_processing import ImageCheck, ImageCorrection
 from ui_canvas import CanvasEmbeddedPlot
 
 # Import custom widgets
 import ui_custom_widgets as ctk
-from file_handling import FileExport
+from core.file_handling import FileExport
+# Import the functions to run the computation in the background
+from core.pipeline import frozen_controller
+from ui_jobs import post
 
 
 class IprofilePanel():
@@ -267,8 +270,7 @@ class IprofilePanel():
 
         if check_button == 3:
             # set the color of all the text labels back to the original 'on' color
-            for s in self.controller.gw_maindisplay.axis_img.texts:
-                s.set(color = 'skyblue')
+            self.controller.gw_maindisplay.color_labels('skyblue')
             # Clear the bounding boxes
             self.controller.gw_maindisplay.clear_showobject(drawn_object = None, 
                                                             label_old = 'selected_bbox')
@@ -291,13 +293,13 @@ class IprofilePanel():
 
         # Only proceed if the event was triggered with the left click
         if event.mouseevent.button == 1:
-            # Get the artist that was selected and highlight it
-            selected_object = event.artist
-            selected_object.set(color = 'deeppink')
+            # Get the label of the object that was selected and highlight it
+            labels, ind = event.artist, event.ind[0]
+            labels.set_label_colors('deeppink', [ind])
             # Ge the text, it should be equal to the vesicle id
-            selected_id = int(selected_object.get_text()) - 1
-            # Update canvas
-            self.controller.gw_maindisplay.canvas.draw()
+            selected_id = int(labels.ids[ind]) - 1
+            # Update the overlays
+            self.controller.gw_maindisplay.update_overlays()
 
             # Retrieve detection results
             det_results, type_det = self.get_detresults()
@@ -307,10 +309,16 @@ class IprofilePanel():
             # Assign results to vesicle
             self.temp_results[f'ves {selected_id + 1}'] = {'radial': radial_profiles, 'angular': angular_profiles}
             
-    def run_on_vesicle(self, selected_vesicle, input_results):
+    def run_on_vesicle(self, selected_vesicle, input_results, job = None, appdata = None):
+
+        # When running in the background (job), the data and settings of the application are
+        # a frozen copy (appdata), and the display is updated on the main thread
+        if appdata is None:
+            appdata = self.controller
+        monitor = None if job is None else job.monitor
 
         # Get variable settings
-        settings_var = self.controller.appdata_settingsiprofile
+        settings_var = appdata.appdata_settingsiprofile
          
         # Retrieve detection results
         det_results, type_det = input_results
@@ -356,14 +364,14 @@ class IprofilePanel():
         bbox_center = [int(xc-x1), int(yc-y1)]
 
         # Update display with the bounding box
-        self.controller.gw_maindisplay.clear_showobject(['box', [[xc, yc, (x2 - x1)]]],
+        post(job, self.controller.gw_maindisplay.clear_showobject, ['box', [[xc, yc, (x2 - x1)]]],
                                                                 label = 'selected_bbox',
                                                                 edgecolor = 'magenta', 
                                                                 draw_text = False, 
                                                                 label_old = 'nothing')
         
         # get current channel to get back to once computation is done
-        initial_channel = self.controller.appdata_channels['current'].get()
+        initial_channel = appdata.appdata_channels['current'].get()
         # Set colors for line plots
         colors_channels = ['k', 'firebrick', 'steelblue']
 
@@ -379,11 +387,11 @@ class IprofilePanel():
             radial_profiles_all = {}
             for ic in ch_toint:
                 # Set the working channel to the channel selected
-                self.controller.appdata_channels['current'].set(ic)
+                appdata.appdata_channels['current'].set(ic)
                 
                 # Check if the image is the right dimension
-                current_channel = self.controller.appdata_channels['current'].get()
-                mat_image = ImageCheck.single_channel(self.controller.appdata_imagecurrent, current_channel)
+                current_channel = appdata.appdata_channels['current'].get()
+                mat_image = ImageCheck.single_channel(appdata.appdata_imagecurrent, current_channel)
 
                 # correct background intensity for the whole image, if required
                 bg_corr = settings_var['bg_corr'][ic - 1].get()
@@ -399,7 +407,7 @@ class IprofilePanel():
 
 
                 radial_profiles, found_error = ProfileIntegration.radial(image_bbox, bbox_center, dr, 
-                                                                        norm = norm_int)
+                                                                        norm = norm_int, monitor = monitor)
 
                 # If required, normalise the radius
                 if norm_rad is True:
@@ -413,7 +421,7 @@ class IprofilePanel():
                     textlabel = f'v{selected_vesicle + 1}c{ic}'
                 else:
                     textlabel = f'v{selected_vesicle + 1}'
-                self.rdisplay.plot_line(radial_profiles[:,0], radial_profiles[:,1], 
+                post(job, self.rdisplay.plot_line, radial_profiles[:,0], radial_profiles[:,1], 
                                     xlabel = rlabel, ylabel = int_label, 
                                     textlabel = textlabel, alpha = 0.8,
                                     color = colors_channels[ic-1])
@@ -434,16 +442,16 @@ class IprofilePanel():
             angular_profiles_all = {}
             for ic in ch_toint:
                 # Set the working channel to the channel selected
-                self.controller.appdata_channels['current'].set(ic)
+                appdata.appdata_channels['current'].set(ic)
                 # Get the type of structure labeled with the corresponding channel
-                struct_channel = self.controller.appdata_channels[ic].get()
+                struct_channel = appdata.appdata_channels[ic].get()
                 # If the structure is related to the membrane, the rlim applied
                 if 'membrane' in struct_channel: rlim_channel = rlim_results
                 else: rlim_channel = None
                 
                 # Check if the image is the right dimension
-                current_channel = self.controller.appdata_channels['current'].get()
-                mat_image = ImageCheck.single_channel(self.controller.appdata_imagecurrent, current_channel)
+                current_channel = appdata.appdata_channels['current'].get()
+                mat_image = ImageCheck.single_channel(appdata.appdata_imagecurrent, current_channel)
 
                 # correct background intensity for the whole image, if required
                 bg_corr = settings_var['bg_corr'][ic - 1].get()
@@ -460,7 +468,8 @@ class IprofilePanel():
                 # Compute angular profiles
                 angular_profiles, mean_radius, _ = ProfileIntegration.angular(image_bbox, bbox_center, dtheta, 
                                                                                 rlim = rlim_channel,
-                                                                                norm = norm_int)
+                                                                                norm = norm_int,
+                                                                                monitor = monitor)
 
                 # Update plot for angular profile
                 if len(ch_toint) > 1:
@@ -468,13 +477,13 @@ class IprofilePanel():
                 else:
                     textlabel = f'v{selected_vesicle + 1}'
                 
-                self.adisplay.plot_line(angular_profiles[:,0], angular_profiles[:,1], 
+                post(job, self.adisplay.plot_line, angular_profiles[:,0], angular_profiles[:,1], 
                                     xlabel = "\u03b8" + "(deg)", ylabel = int_label, 
                                     textlabel = textlabel, alpha = 0.8,
                                     color = colors_channels[ic-1])
                 # If the mean radius is variable, also plot the profile
                 if mean_radius is not None and compute_rad is True:
-                    self.adisplay.plot_secline(angular_profiles[:,0], mean_radius[:,0],
+                    post(job, self.adisplay.plot_secline, angular_profiles[:,0], mean_radius[:,0],
                                     xlabel = "\u03b8" + "(deg)", ylabel = 'r (pix)', alpha = 0.8,
                                     textlabel = textlabel) 
                 compute_rad = False
@@ -484,7 +493,7 @@ class IprofilePanel():
             angular_profiles_all = None
             
         # Set channel back to initial one
-        self.controller.appdata_channels['current'].set(initial_channel)
+        appdata.appdata_channels['current'].set(initial_channel)
 
         # return results of radial and angular profiles, as well as the mean radius
         return radial_profiles_all, angular_profiles_all
@@ -508,10 +517,23 @@ class IprofilePanel():
             # RMD stores results in the 'contours' key
             all_vesicles = [x for x in np.unique(det_results['contours']) if x > 0]
 
-        for ivesicle in all_vesicles:
-            radial_profiles, angular_profiles = self.run_on_vesicle(ivesicle, [det_results, type_det])
-            # Assign results to vesicle
-            self.temp_results[f'ves {ivesicle + 1}'] = {'radial': radial_profiles, 'angular': angular_profiles}
+        # The profiles are computed in the background, with a frozen copy of the settings
+        appdata = frozen_controller(self.controller)
+
+        def profiles(job):
+            results = {}
+            with job.monitor.stage('vesicles', total = len(all_vesicles)):
+                for ivesicle in all_vesicles:
+                    radial_profiles, angular_profiles = self.run_on_vesicle(ivesicle, [det_results, type_det], job, appdata)
+                    # Assign results to vesicle
+                    results[f'ves {ivesicle + 1}'] = {'radial': radial_profiles, 'angular': angular_profiles}
+                    job.monitor.advance()
+            return results
+
+        def save_temp(results):
+            self.temp_results.update(results)
+
+        self.controller.gw_jobs.submit('Intensity profiles', profiles, on_done = save_temp)
 
     def close_panel(self):
 
@@ -0,0 +1,239 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import threading
+import queue
+import traceback
+
+from tkinter import ttk
+
+import ui_custom_widgets as ctk
+from core.pipeline import PipelineMonitor, PipelineCancelled
+
+def post(job, func, *args, **kwargs):
+
+    # Run a function of the interface (display update) on the main thread: through the job
+    # when running in the worker thread, directly otherwise
+    if job is None:
+        return func(*args, **kwargs)
+    job.post(func, *args, **kwargs)
+
+class Job():
+
+    """
+    Computation running in the worker thread. The work function receives the job, which is
+    used to send the display updates to the main thread. Its monitor (see PipelineMonitor)
+    is passed to the analysis functions, to report the progress and to cancel the computation.
+    Tkinter widgets and variables must never be used directly from the work function: settings
+    are read before the job starts (see pipeline.frozen_controller) and the results are
+    applied in on_done, on the main thread.
+
+    Usage:
+        def work(job):
+            with job.monitor.stage('items', total = len(items)):
+                for item in items:
+                    ...
+                    job.monitor.advance()
+            return results
+        controller.gw_jobs.submit('Title', work, on_done = lambda results: ...)
+    """
+
+    def __init__(self, title, work, on_done = None, on_cancel = None):
+
+        self.title = title
+        self.work = work
+        self.on_done = on_done
+        self.on_cancel = on_cancel
+        # Messages sent from the worker thread to the main thread
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.monitor = PipelineMonitor(callback = self.stage_progress, cancel_event = self.cancel_event)
+
+    def stage_progress(self, stages):
+
+        # Progress of the stages of the monitor. The bar follows the first stage with a known total,
+        # the text shows all the open stages
+        value, total = 0, None
+        text = []
+        for name, stage_value, stage_total in stages:
+            if stage_total:
+                if total is None:
+                    value, total = stage_value, stage_total
+                text.append(f'{name} {stage_value}/{stage_total}')
+            else:
+                text.append(name)
+        self.progress(value, total, ', '.join(text) if text else None)
+
+    def progress(self, value, total = None, text = None):
+
+        # Report the progress of the computation (value out of total)
+        self.messages.put(('progress', (value, total, text)))
+
+    def post(self, func, *args, **kwargs):
+
+        # Run a function on the main thread
+        self.messages.put(('call', (func, args, kwargs)))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+
+        # Stop the computation if it has been cancelled
+        self.monitor.check()
+
+    def run(self):
+
+        # Run the work function, in the worker thread
+        try:
+            output = self.work(self)
+        except PipelineCancelled:
+            self.messages.put(('cancelled', None))
+        except Exception as error:
+            traceback.print_exc()
+            self.messages.put(('error', error))
+        else:
+            self.messages.put(('done', output))
+
+class JobProgress(ctk.ControlPanel):
+
+    # Window with the progress of a job and a button to cancel it
+    def __init__(self, job):
+
+        ctk.ControlPanel.__init__(self, title = job.title, topmost = True)
+        self.job = job
+
+        self.textLabel = ttk.Label(self, text = f'{job.title}...', width = 40)
+        self.progressBar = ttk.Progressbar(self, orient = 'horizontal', length = 300, mode = 'indeterminate')
+        self.cancelButton = ttk.Button(self, text = 'Cancel', command = self.cancel)
+        for n, w in enumerate([self.textLabel, self.progressBar]):
+            w.grid(row = n, column = 0, sticky = 'nsew', padx = 10, pady = 5)
+        self.cancelButton.grid(row = 2, column = 0, sticky = 'nse', padx = 10, pady = 5)
+        self.progressBar.start()
+
+        # Closing the window cancels the job
+        self.protocol('WM_DELETE_WINDOW', self.cancel)
+
+    def update_progress(self, value, total = None, text = None):
+
+        # The bar is determinate as soon as the total is known
+        if total:
+            if str(self.progressBar.cget('mode')) != 'determinate':
+                self.progressBar.stop()
+                self.progressBar.config(mode = 'determinate')
+            self.progressBar.config(maximum = total, value = value)
+        if text is not None:
+            self.textLabel.config(text = text)
+        elif total:
+            self.textLabel.config(text = f'{self.job.title}: {value}/{total}')
+
+    def cancel(self):
+
+        self.job.cancel()
+        self.textLabel.config(text = 'Cancelling...')
+        self.cancelButton.state(['disabled'])
+
+class JobExecutor():
+
+    """
+    Runs the heavy computations of the panels in a worker thread, such that the interface
+    stays responsive. The messages of the job are polled with after() and handled on the main
+    thread. A single job runs at a time.
+    """
+
+    def __init__(self, controller, poll_interval = 50):
+
+        self.controller = controller
+        self.poll_interval = poll_interval
+        self.job = None
+        self.window = None
+
+    def busy(self):
+        return self.job is not None
+
+    def submit(self, title, work, on_done = None, on_cancel = None):
+
+        """
+        Start a job
+
+        INPUT:
+            title: string, title of the job, shown in the progress window
+            work: function taking the job as argument, run in the worker thread
+            on_done: function taking the output of work as argument, run on the main thread
+            on_cancel: function without arguments, run on the main thread if the job is cancelled
+        OUTPUT:
+            job: the job started, None if another job is running
+        """
+
+        if self.job is not None:
+            print(f'{self.job.title} is running. Wait until it finishes or cancel it.')
+            return None
+
+        self.job = Job(title, work, on_done, on_cancel)
+        self.window = JobProgress(self.job)
+        threading.Thread(target = self.job.run, daemon = True).start()
+        self.controller.after(self.poll_interval, self.poll)
+
+        return self.job
+
+    def poll(self):
+
+        # Handle the messages sent by the job since the last poll. Only the last progress is shown
+        job = self.job
+        progress = None
+        while True:
+            try:
+                message, content = job.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if message == 'progress':
+                progress = content
+            elif message == 'call':
+                func, args, kwargs = content
+                func(*args, **kwargs)
+            else:
+                self.finish(job, message, content)
+                return
+
+        if progress is not None:
+            self.window.update_progress(*progress)
+
+        self.controller.after(self.poll_interval, self.poll)
+
+    def finish(self, job, message, content):
+
+        # Close the progress window and hand the output over
+        self.job = None
+        self.window.destroy()
+        self.window = None
+
+        if message == 'done':
+            if job.on_done is not None:
+                job.on_done(content)
+        elif message == 'cancelled':
+            print(f'{job.title} cancelled')
+            if job.on_cancel is not None:
+                job.on_cancel()
+        elif message == 'error':
+            print(f'{job.title} failed: {content}')
@@ -26,10 +26,11 @@ import tkinter.filedialog
 import os
 
 # Import hte file handling functions
-from file_handling import FileImage, FileExport
+from core.file_handling import FileImage, FileExport
 # Import the control panels
 from ui_filemanager import FileManager
 from ui_channelmanager import ChannelManager
+from ui_contrast import ContrastPanel
 from ui_enhancement import EnhancePanel
 from ui_intprofiles import IprofilePanel
 from ui_refinedmembrane import RmdPanel
@@ -224,6 +225,8 @@ class MenuImage(tk.Menu):
         self.add_channelmenu(self, controller.appdata_channels['current'])
         # Add channel manager
         self.add_command(label = 'Channel Manager', command = self.show_manager)
+        # Add contrast adjustment
+        self.add_command(label = 'Contrast', command = self.show_contrast)
         # Add option to reset the image
         self.add_command(label = 'Reset Image', accelerator = '<Ctrl + r>', command = self.image_reset)
 
@@ -287,6 +290,15 @@ class MenuImage(tk.Menu):
             # If it doesn't exist create it
             self.controller.gw_channelmanager = ChannelManager(self.controller)
 
+    def show_contrast(self):
+
+        # Check if window exists and raise on top of the other windows
+        try:
+            self.controller.gw_contrast.window.lift()
+        except (AttributeError, tk.TclError):
+            # If it doesn't exist create it
+            self.controller.gw_contrast = ContrastPanel(self.controller)
+
     def image_reset(self):
 
         # Show the source image, clearing the axis first
@@ -316,6 +328,8 @@ class MenuDetection(tk.Menu):
         # Add option to select and delete vesicles
         self.add_separator()
         self.add_command(label = 'Select and Delete', accelerator = '<Ctrl-d>', command = self.select_delete)
+        self.add_command(label = 'Box Select and Delete', command = lambda: self.select_delete('box'))
+        self.add_command(label = 'Lasso Select and Delete', command = lambda: self.select_delete('lasso'))
        
         # Bind select and delete to key-event
         self.controller.bind_all('<Control-d>', lambda event: self.select_delete())
@@ -425,9 +439,10 @@ class MenuDetection(tk.Menu):
         else:
             print('There are no saved results of vesicle detection.')
 
-    def select_delete(self):
+    def select_delete(self, mode = 'pick'):
 
-        # Function to select and delete the vesicles
+        # Function to select and delete the vesicles. The vesicles are picked one by one, and
+        # with mode 'box' or 'lasso' all the vesicles within a region can be selected as well
 
         # The variable to use for handling selected object is the vesicle detection results
         # Note: it works with the TEMPORAL results data, so it can only be triggered 
@@ -447,6 +462,11 @@ class MenuDetection(tk.Menu):
             state_mpl = self.controller.gw_maindisplay.bind_onpick()
             # Bind right-click event with a delete object function of the main display
             self.controller.gw_maindisplay.bind_right(input_data = det_vesicles, input_mask = det_mask)
+            # Bind the selection of regions
+            if state_mpl == 'connected' and mode != 'pick':
+                self.controller.gw_maindisplay.bind_region(mode)
+            else:
+                self.controller.gw_maindisplay.unbind_region()
 
 class MenuMembrane(tk.Menu):
 
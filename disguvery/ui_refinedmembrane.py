@@ -23,9 +23,9 @@ import numpy as np
 
 # Import custom widgets
 import ui_custom_widgets as ctk
-from skimage.filters import apply_hysteresis_threshold
-# Import image processing functions
-from image_processing import ImageFilters, ImageMask
+# Import the refined membrane detection
+from core.membrane import RMDsegmentation
+from core.pipeline import array_hash
 
 class RmdPanel():
 
@@ -94,6 +94,14 @@ class RmdPanel():
 
     def mask(self):
 
+        # Compute the edge mask of the current image
+        self.temp_results_mask = self.edge_mask(*self.mask_input())
+
+        # Update display
+        self.controller.gw_maindisplay.show_scattermask(self.temp_results_mask[2])
+
+    def mask_input(self):
+
         # Settings variable
         settings_var = self.controller.appdata_settingsrmd
 
@@ -105,30 +113,22 @@ class RmdPanel():
         # Threshold used to discard edges, based on normalised WT modulus
         img_th_low = settings_var['img_th'][0]
         img_th_high = float(settings_var['img_th'][1].get())
-       
-        # Compute the 2D Wavelet using the first derivative
-        WT_mod, WT_arg = ImageFilters.wavelet2d_firstdet(input_image, a_scale)
-        # Get the thinned edges using a modified canny detector
-        mask_edge = ImageMask.wt_edges(WT_mod, WT_arg)
-        # Normalise the modulus
-        WT_norm = WT_mod / np.max(WT_mod.flatten())
-    
-        # Clear the borders
-        mask_edge[:int(a_scale/2), :] = 0
-        mask_edge[-int(a_scale/2):, :] = 0
-        mask_edge[:, -int(a_scale/2):] = 0
-        mask_edge[:, :int(a_scale/2)] = 0
-        
-        # Apply hysteresis threshold
-        WT_norm_edge = mask_edge*WT_norm
-        mask_edgehigh = (WT_norm_edge > img_th_high).astype(int)
-        mask_edge = mask_edgehigh + apply_hysteresis_threshold(WT_norm_edge, img_th_low, img_th_high).astype(int)
 
-        # Save results in a temporable variable
-        self.temp_results_mask = [WT_mod, WT_arg, mask_edge]
+        return input_image, a_scale, img_th_low, img_th_high
 
-        # Update display
-        self.controller.gw_maindisplay.show_scattermask(mask_edge)
+    def edge_mask(self, input_image, a_scale, img_th_low, img_th_high):
+
+        # The mask is computed once for each image and settings, and kept in the stage cache if it's used.
+        # The image is only hashed for the cache
+        stage_cache = self.controller.appdata_stagecache
+        compute = lambda: RMDsegmentation.edge_mask(input_image, a_scale, img_th_low, img_th_high)
+        if stage_cache.active():
+            params_mask = [a_scale, img_th_low, img_th_high]
+            WT_mod, WT_arg, mask_edge = stage_cache.cached(array_hash(input_image), 'rmd_mask', params_mask, compute)
+        else:
+            WT_mod, WT_arg, mask_edge = compute()
+
+        return [WT_mod, WT_arg, mask_edge]
 
     def check_image(self): 
 
@@ -187,99 +187,81 @@ class RmdPanel():
         search_width = float(settings_var['search_w'].get())
         ves_th = float(settings_var['vesicle_th'].get())
 
-        # Check if there are mask results saved already in the app
+        # Check if there are mask results saved already in the app, otherwise the mask is computed first
         try: 
-            self.temp_results_mask     
+            results_mask = self.temp_results_mask
         except AttributeError:
-            self.mask()
-        finally: 
-            WT_mod, WT_arg, mask_edge = self.temp_results_mask
+            results_mask, mask_input = None, self.mask_input()
 
         # Attempt to get the temporal results
         try:
-            all_contours, centers = self.temp_results
+            temp_results = self.temp_results
         except AttributeError:
-            all_contours = np.zeros(WT_mod.shape, dtype = int)
-            # Results of detection are the same size as all rois
-            centers = np.zeros((len(all_rois),2))
-
-        # Make the WT argument only positive
-        WT_arg_pos = WT_arg.copy()
-        WT_arg_pos[WT_arg_pos < 0] = WT_arg_pos[WT_arg_pos < 0] + 180
-
-        # Iterate over the vesicles
-        for ves in selected_vesicle:
-            roi = all_rois[ves]
-            x_center, y_center = roi[0], roi[1]
-            if det_method == 'hough':
-                bbox = 2*roi[2] + 2*margin_bbox
+            temp_results = None
+
+        # The detection runs in the background, the display is updated on the main thread
+        maindisplay = self.controller.gw_maindisplay
+
+        def chain_vesicles(job):
+            if results_mask is None:
+                WT_mod, WT_arg, mask_edge = self.edge_mask(*mask_input)
+                job.post(maindisplay.show_scattermask, mask_edge)
+            else:
+                WT_mod, WT_arg, mask_edge = results_mask
+
+            # The results are copied, such that they are kept as they are if the detection is cancelled
+            if temp_results is None:
+                all_contours = np.zeros(WT_mod.shape, dtype = int)
+                # Results of detection are the same size as all rois
+                centers = np.zeros((len(all_rois),2))
             else:
-                bbox =  roi[2] + 2*margin_bbox
+                all_contours, centers = temp_results[0].copy(), temp_results[1].copy()
 
-            # Define coordinates of the bounding box
-            y1 = int(y_center - bbox/2); y2 = int(y_center + bbox/2)
-            x1 = int(x_center - bbox/2); x2 = int(x_center + bbox/2)
+            # Make the WT argument only positive
+            WT_arg_pos = RMDsegmentation.positive_argument(WT_arg)
 
-            # Check coordinates of bounding box are contained in the image
-            if y1 < 0: y1 = 0
-            if x1 < 0: x1 = 0
-            if y2 > mask_edge.shape[1]: y2 = mask_edge.shape[1]
-            if x2 > mask_edge.shape[0]: x2 = mask_edge.shape[0]
+            # Iterate over the vesicles
+            with job.monitor.stage('vesicles', total = len(selected_vesicle)):
+                for ves in selected_vesicle:
+                    # Bounding box of the vesicle
+                    x1, x2, y1, y2, bbox = RMDsegmentation.vesicle_bbox(all_rois[ves], det_method, margin_bbox,
+                                                                        mask_edge.shape)
+                    x_center, y_center = all_rois[ves][0], all_rois[ves][1]
 
-            # Show the bounding box
-            self.controller.gw_maindisplay.clear_showobject(['box', [[x_center, y_center, bbox]]], 
+                    # Show the bounding box
+                    job.post(maindisplay.clear_showobject, ['box', [[x_center, y_center, bbox]]], 
                                                             label_old = 'selected_ves', 
                                                             label = 'selected_ves',
                                                             edgecolor = 'mediumvioletred',
                                                             draw_text = False)
 
-            # Retrieve the WT and the edge mask for only the ROI
-            WT_ves = np.zeros((int(y2-y1), int(x2-x1)))
-            try:
-                WT_ves[:,:] = WT_mod[y1:y2, x1:x2]
-            except ValueError:
-                WT_ves = WT_mod[y1:y2, x1:x2]
-            finally:
-                edge_ves = np.zeros(WT_ves.shape, dtype = int)
-                edge_ves[:,:] = mask_edge[y1:y2, x1:x2]
-
-            # normalize the WT modulus within the ROI and eliminate noise in edge mask
-            WT_norm = WT_ves / np.max(WT_ves[WT_ves!=0].flatten())
-            edge_ves[WT_norm <= ves_th] = 0
-
-            # Construct mask for the positive arguement on the edges
-            mask_WTarg = WT_arg_pos[y1:y2, x1:x2]*edge_ves
-            # Show the mask of the bounding box, with the right offset
-            self.controller.gw_maindisplay.show_scattermask(edge_ves, color = 'red', offset = [x1,y1],
+                    # Edges of the vesicle within the bounding box
+                    edge_ves, mask_WTarg = RMDsegmentation.vesicle_edges(WT_mod, WT_arg_pos, mask_edge,
+                                                                        [x1, x2, y1, y2], ves_th)
+                    # Show the mask of the bounding box, with the right offset
+                    job.post(maindisplay.show_scattermask, edge_ves, color = 'red', offset = [x1,y1],
                                                             label = 'rmd_base')
-            
-            # Run directional search to chain edges
-            ri, ro = ImageMask.chain_search(mask_WTarg, [search_length, search_width])
-
-            # Add offset to the ri/ro coordinates
-            ri[:,0] += x1
-            ri[:,1] += y1
-            ro[:,0] += x1
-            ro[:,1] += y1
-
-            # Calculate center for the contours
-            xc1, yc1 = np.mean(ri[:,0]), np.mean(ri[:, 1])
-            xc2, yc2 = np.mean(ro[:,0]), np.mean(ro[:, 1])
-            centers[ves][0] = np.mean([xc1, xc2])
-            centers[ves][1] = np.mean([yc1, yc2])
-
-            # Add results to the contours matrix
-            all_contours[(ri[:,1], ri[:,0])] = -ves
-            all_contours[(ro[:,1], ro[:,0])] = ves
-
-            # Update display
-            self.controller.gw_maindisplay.clear_showscatter([ri[:,0], ri[:,1]], color = 'cyan', 
+                    
+                    # Run directional search to chain edges
+                    ri, ro = RMDsegmentation.chain_vesicle(mask_WTarg, [x1, y1], search_length, search_width)
+
+                    # Add results to the contours and centers
+                    RMDsegmentation.add_contours(all_contours, centers, ves, ri, ro)
+
+                    # Update display
+                    job.post(maindisplay.clear_showscatter, [ri[:,0], ri[:,1]], color = 'cyan', 
                                                             label = 'rmd_contour')
-            self.controller.gw_maindisplay.clear_showscatter([ro[:,0], ro[:,1]], color = 'blue',
+                    job.post(maindisplay.clear_showscatter, [ro[:,0], ro[:,1]], color = 'blue',
                                                             label = 'rmd_contour')
+                    job.monitor.advance()
 
-        # Update temporal results
-        self.temp_results = all_contours, centers               
+            return [WT_mod, WT_arg, mask_edge], (all_contours, centers)
+
+        def save_temp(output):
+            # Update temporal results
+            self.temp_results_mask, self.temp_results = output
+
+        self.controller.gw_jobs.submit('Refined membrane detection', chain_vesicles, on_done = save_temp)
 
     def clear_display(self):
 
@@ -328,8 +310,3 @@ class RmdPanel():
         if len(struct_channel) < 1:
             self.controller.appdata_channels[channel_used].set('membrane')
             print(f'Channel {channel_used} has been assigned to the membrane signal.')
-
-                                
-
-        
-
@@ -27,12 +27,14 @@ import tkinter.filedialog
 import ui_custom_widgets as ctk
 
 # Import functions for vesicle detection
-from vesicle_detection import VesicleDetection
+from core.vesicle_detection import VesicleDetection
 
 # Import function to handle template files
-from file_handling import FileTemplate
+from core.file_handling import FileTemplate
 # Import function to threshold the image
-from image_processing import ImageMask
+from core.image_processing import ImageMask
+# Import the frozen copy of the settings, to run the detection in the background
+from core.pipeline import frozen_settings
 
 class VesdetPanel():
 
@@ -113,11 +115,11 @@ class VesdetPanel():
 
         # configure layout of frame
         houghframe.columnconfigure([0,1,2,3], weight = 1)
-        houghframe.rowconfigure([0,1,2], weight = 1)
+        houghframe.rowconfigure([0,1,2,3], weight = 1)
 
         # Create Labels
         labels_opt = ['Edge threshold: ', 'Hough threshold: ', 'Min. distance: ', 
-                    'Min. radius: ', 'Max. radius: ']
+                    'Min. radius: ', 'Max. radius: ', 'Downsample: ']
         labels_widgets = []
         for ilabel in labels_opt:
             labels_widgets.append(ttk.Label(houghframe, text = ilabel))
@@ -141,7 +143,7 @@ class VesdetPanel():
 
         # Create run button and place it
         run_button = ttk.Button(houghframe, text = 'Run', command = self.run)
-        run_button.grid(row = 2, column = 2, columnspan = 2, sticky = 'ew', padx = 5, pady = 10)
+        run_button.grid(row = 3, column = 2, columnspan = 2, sticky = 'ew', padx = 5, pady = 10)
 
         return houghframe
 
@@ -270,56 +272,63 @@ class VesdetPanel():
 
     def run(self):
 
-        # Get settings for the vesicle detection
-        det_settings = self.controller.appdata_settingsvesdet
+        # Get settings for the vesicle detection. They are frozen, as the detection runs in the background
+        det_settings = frozen_settings(self.controller.appdata_settingsvesdet)
         # Check if the image is the right dimension
         mat_image = self.check_image(self.controller)
+        template_image = self.controller.appdata_templateimage
 
         # Get the current detection method to run
         current_method = det_settings['method']
         # configure the text of the show results button
         self.showdetButton.config(text = 'Show Detection')
 
-        # Initialise detection results as a None variable
-        det_results = None
-
-        # Run detection based on method selected
-        if current_method == 'hough':
-            # Run hough detection
-            hough_circles = VesicleDetection.hough(mat_image, det_settings)
-            # If the results are not None, format accordingly
-            if hough_circles is not None:
-                det_results = ['circle', hough_circles]
-        elif current_method == 'template':
-            # Get the template image, if no template is set, flag it with a message
-            template_image = self.controller.appdata_templateimage
-            if template_image is not None:
-                # Run the detection based on template matching
-                matched_templates = VesicleDetection.template(mat_image, template_image, det_settings)
+        def detection(job):
+            # Initialise detection results as a None variable
+            det_results, mask_filled = None, None
+
+            # Run detection based on method selected
+            if current_method == 'hough':
+                # Run hough detection
+                hough_circles = VesicleDetection.hough(mat_image, det_settings, job.monitor)
+                # If the results are not None, format accordingly
+                if hough_circles is not None:
+                    det_results = ['circle', hough_circles]
+            elif current_method == 'template':
+                # Get the template image, if no template is set, flag it with a message
+                if template_image is not None:
+                    # Run the detection based on template matching
+                    matched_templates = VesicleDetection.template(mat_image, template_image, det_settings, job.monitor)
+                    # If the results are not None, format accordingly
+                    if matched_templates is not None:
+                        det_results = ['box', matched_templates]
+                else:
+                    print('No template image found.')
+            elif current_method == 'floodfill':
+                # Run Floodfill detection
+                filled_regions, mask_filled = VesicleDetection.floodfill(mat_image, det_settings, job.monitor)
                 # If the results are not None, format accordingly
-                if matched_templates is not None:
-                    det_results = ['box', matched_templates]
+                if filled_regions is not None:
+                    det_results = ['center', filled_regions]
+
+            return det_results, mask_filled
+
+        def show_detection(output):
+            det_results, mask_filled = output
+            # Update temporal results variable
+            self.controller.appdata_detresultstemp = det_results
+
+            # Show results if any
+            if det_results is None:
+                print('No vesicles were detected with the current settings')
+            if current_method != 'floodfill':
+                self.update_display(det_results)
             else:
-                print('No template image found.')
-        elif current_method == 'floodfill':
-            # Run Floodfill detection
-            filled_regions, mask_filled = VesicleDetection.floodfill(mat_image, det_settings)
-            # If the results are not None, format accordingly
-            if filled_regions is not None:
-                det_results = ['center', filled_regions]
-
-        # Update temporal results variable
-        self.controller.appdata_detresultstemp = det_results
-
-        # Show results if any
-        if det_results is None:
-            print('No vesicles were detected with the current settings')
-        try: 
-            self.controller.appdata_maskdettemp = mask_filled
-        except NameError:
-            self.update_display(det_results)
-        else:
-            self.update_display(det_results, mask = mask_filled, update_source = 'image-results')
+                self.controller.appdata_maskdettemp = mask_filled
+                self.update_display(det_results, mask = mask_filled, update_source = 'image-results')
+
+        # Run the detection in the background, and show the results once done
+        self.controller.gw_jobs.submit('Vesicle detection', detection, on_done = show_detection)
     
     def check_image(self, controller = None):
 
@@ -31,7 +31,7 @@ import ui_custom_widgets as ctk
 # import custom canvas
 from ui_canvas import CanvasEmbeddedPlot
 
-from data_processing import FitData
+from core.data_processing import FitData
 
 
 class VesSizePanel():
@@ -0,0 +1,53 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+# Smoke tests of the analysis. The modules of the interface import the analysis as 'core',
+# from the disguvery folder: the folder is added to the path, with the benchmark helpers
+# (synthetic images and settings without tkinter). Run from the repository: python -m pytest
+
+import os
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+
+REPO_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(REPO_DIR, 'disguvery'))
+
+import pytest
+
+@pytest.fixture(scope = 'session')
+def analysis_results():
+
+    # Detection, profiles and encapsulation of a synthetic two-channel image, as given to the exports
+    import _synthetic as syn
+    from core import detection, profiles, encapsulation
+
+    mat_image, truth = syn.multichannel_image(512, n_vesicles = 4, rmin = 30, rmax = 60)
+    enhanced = detection.enhance(mat_image, smooth_size = 15, enhance_size = 45)
+    det_results = detection.hough(enhanced[:,:,1], min_distance = 60)
+    angular = profiles.angular_profiles(mat_image, det_results, channels = [1, 2])
+    radial = profiles.radial_profiles(mat_image, det_results, channels = [1, 2])
+    profiles_results = {k: {'angular': angular.get(k, None), 'radial': radial.get(k, None)} for k in angular}
+    mask_labels = encapsulation.encapsulation_mask(mat_image[:,:,1], det_results)
+    encap_results = encapsulation.encapsulation(mat_image, mask_labels, channels = [1])
+
+    return det_results, profiles_results, encap_results, mask_labels
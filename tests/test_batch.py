@@ -0,0 +1,55 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tkinter')
+
+import _synthetic as syn
+from ui_batchprocessing import BatchRun
+from core.pipeline import BatchCheckpoint, array_hash
+
+def test_batch_no_detection(tmp_path):
+
+    # An image without vesicles runs through all the stages without results
+    controller = syn.controller()
+    mat_image = np.full((256, 256, 2), 200, dtype = np.uint16)
+    results = BatchRun.run(controller, mat_image, controller.appdata_settingsbatch, display_results = False)
+    assert results == (None, None, None, None)
+
+    # The same with a checkpoint, and again when resumed from it
+    for _ in range(2):
+        checkpoint = BatchCheckpoint(str(tmp_path))
+        results = BatchRun.run(controller, mat_image, controller.appdata_settingsbatch, display_results = False,
+                            checkpoint = checkpoint, img_name = 'empty.tif', input_key = array_hash(mat_image))
+        assert results == (None, None, None, None)
+
+def test_batch_detection():
+
+    # Vesicles of a synthetic image are detected and their profiles computed
+    controller = syn.controller()
+    controller.appdata_settingsvesdet['hough_mindist'].set('60')
+    mat_image, truth = syn.multichannel_image(512, n_vesicles = 4, rmin = 30, rmax = 60)
+    det_results, _, profiles_results, encap_results = BatchRun.run(controller, mat_image,
+                                                        controller.appdata_settingsbatch, display_results = False)
+    _, _, n_found = syn.match_circles(det_results['rois'], truth)
+    assert n_found == len(truth)
+    assert profiles_results is not None and encap_results is not None
@@ -0,0 +1,59 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+
+from core.pipeline import BatchCheckpoint, settings_hash, array_hash
+
+def test_checkpoint_keys(tmp_path):
+
+    # A stage is only loaded with the key it was saved with
+    checkpoint = BatchCheckpoint(str(tmp_path))
+    det_results = {'method': 'hough', 'rois': np.array([[10., 20., 5.]])}
+    key = settings_hash(array_hash(np.zeros(4)), ['hough', 15])
+    checkpoint.save('image 1.tif', 'detection', key, det_results)
+
+    found, output = checkpoint.load('image 1.tif', 'detection', key)
+    assert found is True
+    assert np.array_equal(output['rois'], det_results['rois'])
+    assert checkpoint.load('image 1.tif', 'detection', settings_hash('other settings'))[0] is False
+    assert checkpoint.load('image 2.tif', 'detection', key)[0] is False
+
+    # The manifest is read back by a new checkpoint of the same folder
+    assert BatchCheckpoint(str(tmp_path)).done('image 1.tif', 'detection', key)
+
+def test_checkpoint_none_output(tmp_path):
+
+    # A stage saved without output never loads the output of a previous run
+    checkpoint = BatchCheckpoint(str(tmp_path))
+    checkpoint.save('image.tif', 'profiles', 'key 1', {'radial': np.ones(3)})
+    checkpoint.save('image.tif', 'profiles', 'key 2', None)
+
+    assert BatchCheckpoint(str(tmp_path)).load('image.tif', 'profiles', 'key 2') == (True, None)
+    assert checkpoint.load('image.tif', 'profiles', 'key 1')[0] is False
+
+def test_array_hash():
+
+    # The hash depends on the content, the shape and the type of the array
+    image = np.arange(12, dtype = np.uint16).reshape(3, 4)
+    assert array_hash(image) == array_hash(image.copy())
+    assert array_hash(image) != array_hash(image.reshape(4, 3))
+    assert array_hash(image) != array_hash(image.astype(np.int32))
+    assert array_hash(image[:, ::2]) == array_hash(np.ascontiguousarray(image[:, ::2]))
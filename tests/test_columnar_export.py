@@ -0,0 +1,64 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+import pytest
+
+from core.file_handling import ColumnarExport, ProfileWriter
+
+@pytest.mark.parametrize('file_format, extension', [('npz', '.npz'), ('hdf5', '.h5'), ('parquet', '_images.parquet')])
+def test_columnar_export_roundtrip(tmp_path, analysis_results, file_format, extension):
+
+    # The tables are read back with the values of the results of every image
+    if file_format == 'hdf5': pytest.importorskip('h5py')
+    if file_format == 'parquet': pytest.importorskip('pyarrow')
+    det_results, profiles_results, encap_results, _ = analysis_results
+    filename = str(tmp_path / 'results')
+    with ColumnarExport(filename, file_format) as export:
+        for img_name in ['image 1', 'image 2']:
+            export.add_detection(img_name, det_results)
+            export.add_profiles(img_name, profiles_results)
+            export.add_encapsulation(img_name, 'ch 1', encap_results['ch 1'][0])
+
+    tables = ColumnarExport.load(filename + extension)
+    assert list(tables['images']['name']) == ['image 1', 'image 2']
+
+    n_vesicles = len(det_results['rois'])
+    vesicles = tables['vesicles']
+    assert np.array_equal(vesicles['id_image'], np.repeat([0, 1], n_vesicles))
+    assert np.allclose(vesicles['radius'][:n_vesicles], det_results['rois'][:,2])
+    assert np.array_equal(vesicles['id_vesicle'][n_vesicles:], det_results['id_vesicle'])
+
+    # Profiles as written to the CSV files, in single precision
+    blocks = {}
+    for output, block in ProfileWriter.blocks(profiles_results):
+        blocks.setdefault(output, []).append(block)
+    assert 'radial' in blocks and 'angular' in blocks
+    for output, output_blocks in blocks.items():
+        block = np.concatenate(output_blocks)
+        table = tables[f'profiles_{output}']
+        assert len(table['id_image']) == 2*len(block)
+        columns = ColumnarExport.profile_columns[output]
+        assert np.allclose(table[columns[-1]][:len(block)], block[:,-1], rtol = 1e-6, equal_nan = True)
+
+    encap_ch = encap_results['ch 1'][0]
+    encapsulation = tables['encapsulation']
+    assert np.array_equal(encapsulation['roi'][:len(encap_ch)], encap_ch[:,0])
+    assert np.allclose(encapsulation['mean_intensity'][len(encap_ch):], encap_ch[:,3])
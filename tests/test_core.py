@@ -0,0 +1,57 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import _synthetic as syn
+from conftest import REPO_DIR
+from core import io, detection, membrane, profiles, encapsulation
+
+def test_core_without_interface():
+
+    # The core package is imported from the repository without tkinter nor matplotlib
+    code = ('import sys; sys.modules["tkinter"] = None; sys.modules["matplotlib"] = None\n'
+            'from disguvery.core import io, detection, membrane, profiles, encapsulation\n'
+            'assert "tkinter" not in [m.split(".")[0] for m in sys.modules if sys.modules[m] is not None]')
+    subprocess.run([sys.executable, '-c', code], cwd = REPO_DIR, check = True)
+
+def test_core_workflow(tmp_path):
+
+    # Detection, membrane, profiles and encapsulation of a synthetic image, and their export
+    mat_image, truth = syn.multichannel_image(512, n_vesicles = 4, rmin = 30, rmax = 60)
+    enhanced = detection.enhance(mat_image, smooth_size = 15, enhance_size = 45, enhance_method = 'box')
+    det_results = detection.hough(enhanced[:,:,1], min_distance = 60)
+    _, radius_err, n_found = syn.match_circles(det_results['rois'], truth)
+    assert n_found == len(truth) and np.all(radius_err < 5)
+
+    rois_membrane = membrane.basic_membrane(det_results, width = 15)
+    angular = profiles.angular_profiles(mat_image, rois_membrane, channels = [2], membrane_channels = [2])
+    radial = profiles.radial_profiles(mat_image, det_results, channels = [1])
+    assert len(angular) == len(radial) == len(det_results['rois'])
+
+    mask_labels = encapsulation.encapsulation_mask(mat_image[:,:,1], det_results)
+    encap_results = encapsulation.encapsulation(mat_image, mask_labels, channels = [1])
+    assert encap_results['ch 1'][0].shape[1] == 5
+    io.save_detection(str(tmp_path / 'image.csv'), det_results)
+    assert os.listdir(tmp_path) == ['image.csv']
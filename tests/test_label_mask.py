@@ -0,0 +1,69 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import io
+
+import numpy as np
+
+from core.file_handling import LabelMask
+
+def label_image(n_labels = 300, shape = (200, 300), seed = 0):
+
+    # Label image with rectangles and disks of more than 255 labels, some of them overlapping
+    rng = np.random.default_rng(seed)
+    mask_labels = np.zeros(shape, dtype = np.int32)
+    rows, cols = np.ogrid[:shape[0], :shape[1]]
+    for label in range(1, n_labels + 1):
+        r, c, size = rng.integers(0, shape[0]), rng.integers(0, shape[1]), rng.integers(1, 12)
+        if label % 2:
+            mask_labels[r:r + size, c:c + size] = label
+        else:
+            mask_labels[(rows - r)**2 + (cols - c)**2 <= size**2] = label
+
+    return mask_labels
+
+def test_label_mask_roundtrip():
+
+    # The label image is read back as it was saved, without wrapping past 255 labels
+    mask_labels = label_image()
+    buffer = io.BytesIO()
+    LabelMask.save(buffer, mask_labels)
+    buffer.seek(0)
+    label_mask = LabelMask(buffer)
+
+    assert np.array_equal(label_mask.image(), mask_labels)
+    assert label_mask.image().dtype == np.uint16
+
+    # Each region on its own, inside its bounding box
+    for label in label_mask.labels[::7]:
+        bbox, mask_roi = label_mask.roi(label)
+        rows, cols = np.nonzero(mask_labels == label)
+        assert list(bbox) == [rows.min(), cols.min(), rows.max() + 1, cols.max() + 1]
+        assert np.array_equal(mask_roi, mask_labels[bbox[0]:bbox[2], bbox[1]:bbox[3]] == label)
+
+def test_label_mask_empty():
+
+    # A mask without regions
+    buffer = io.BytesIO()
+    LabelMask.save(buffer, np.zeros((20, 30), dtype = np.uint8))
+    buffer.seek(0)
+    label_mask = LabelMask(buffer)
+    assert len(label_mask.labels) == 0
+    assert np.array_equal(label_mask.image(), np.zeros((20, 30)))
@@ -0,0 +1,62 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+
+import _synthetic as syn
+from core import detection
+from core.vesicle_detection import VesicleDetection
+
+def test_refine_subpixel_accuracy():
+
+    # Detections a few pixels off are refined to the true circles, within a tenth of a pixel
+    mat_image, truth = syn.vesicle_image(512, n_vesicles = 6, rmin = 20, rmax = 80, dtype = 'float32')
+    rng = np.random.default_rng(1)
+    rois = truth + rng.uniform(-2, 2, truth.shape)
+    refined = VesicleDetection.refine_subpixel(mat_image, rois, 'hough')
+
+    assert np.all(np.hypot(*(refined[:,:2] - truth[:,:2]).T) < 0.1)
+    assert np.all(np.abs(refined[:,2] - truth[:,2]) < 0.1)
+    assert np.all(refined[:,3] < 0.01)
+
+def test_refine_rejects_far_fits():
+
+    # Fits moving the centre or changing the radius more than allowed keep their input values
+    mat_image, truth = syn.vesicle_image(512, n_vesicles = 4, rmin = 30, rmax = 80, dtype = 'float32')
+    shifted = truth + [4, -3, 0]
+    resized = truth + [0, 0, 6]
+    for rois, bounds in [(shifted, {'max_shift': 0.02}), (resized, {'max_change': 0.02})]:
+        refined = VesicleDetection.refine_subpixel(mat_image, rois, 'hough', **bounds)
+        assert np.allclose(refined[:,:3], rois) and np.all(refined[:,3] == 0)
+        # With the default bounds they are fitted to the vesicles
+        refined = VesicleDetection.refine_subpixel(mat_image, rois, 'hough')
+        assert np.allclose(refined[:,:3], truth, atol = 0.1)
+
+def test_refine_results():
+
+    # The results are returned in a new dictionary, keeping the size definition of the method
+    mat_image, truth = syn.vesicle_image(512, n_vesicles = 4, rmin = 20, rmax = 80, dtype = 'float32')
+    rois = np.round(np.column_stack([truth[:,:2], 2*truth[:,2]]))
+    det_results = {'method': 'floodfill', 'rois': rois.copy(), 'id_vesicle': np.arange(1, len(rois) + 1)}
+    refined = detection.refine(mat_image, det_results)
+
+    assert np.array_equal(det_results['rois'], rois) and 'ellipticity' not in det_results
+    assert np.all(np.abs(refined['rois'][:,2] - 2*truth[:,2]) < 0.2)
+    assert len(refined['ellipticity']) == len(rois)
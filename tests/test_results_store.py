@@ -0,0 +1,53 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+
+from core.results_store import ResultsStore
+from core.file_handling import ProfileWriter
+
+def test_results_store_roundtrip(tmp_path, analysis_results):
+
+    # The results of the images are queried back from the store, with their masks
+    det_results, profiles_results, encap_results, mask_labels = analysis_results
+    det_results = dict(det_results, mask_rois = mask_labels)
+    filename = str(tmp_path / 'campaign.sqlite')
+    with ResultsStore(filename) as store:
+        store.start_run('hough')
+        id_images = [store.add_image(img_name, str(tmp_path), det_results, profiles_results, encap_results)
+                        for img_name in ['image 1', 'image 2']]
+
+    # A new run is added to the same store
+    with ResultsStore(filename) as store:
+        store.add_image('image 3', str(tmp_path), None, None, None)
+        assert store.query('SELECT COUNT(*) FROM runs') == [(2,)]
+        assert store.query('SELECT name FROM images ORDER BY id_image') == [('image 1',), ('image 2',), ('image 3',)]
+
+        rows = store.query('SELECT xc, yc, radius FROM vesicles WHERE id_image = ? ORDER BY id_vesicle', (id_images[1],))
+        assert np.allclose(rows, det_results['rois'][:,:3])
+        n_rows = sum(len(b) for o, b in ProfileWriter.blocks(profiles_results) if o != 'contours')
+        assert store.query('SELECT COUNT(*) FROM profiles WHERE id_image = ?', (id_images[0],)) == [(n_rows,)]
+        rows = store.query('SELECT roi, mean_intensity FROM encapsulation WHERE id_image = ? ORDER BY roi', (id_images[0],))
+        assert np.allclose(rows, encap_results['ch 1'][0][:, [0, 3]])
+
+        # Masks of the regions (run-length encoded) and of the encapsulation
+        assert np.array_equal(store.mask(id_images[0]), mask_labels)
+        assert np.array_equal(store.mask(id_images[1], 'encapsulation', 1), encap_results['ch 1'][1])
+        assert store.mask(id_images[1], 'encapsulation', 2) is None
@@ -0,0 +1,59 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import numpy as np
+import pytest
+
+from core.data_processing import RoiIndex
+
+@pytest.mark.parametrize('object_type', ['circle', 'box', 'point'])
+def test_roi_index_queries(object_type):
+
+    # The queries of the index give the same objects as testing all of them
+    rng = np.random.default_rng(0)
+    rois = np.column_stack([rng.uniform(0, 1000, 300), rng.uniform(0, 800, 300), rng.uniform(2, 60, 300)])
+    index = RoiIndex(rois, object_type)
+    x, y, s = rois[:,0], rois[:,1], rois[:,2]
+    half_size = {'circle': s, 'box': s/2, 'point': 0*s}[object_type]
+
+    for px, py, d in zip(rng.uniform(-50, 1050, 50), rng.uniform(-50, 850, 50), rng.uniform(0, 100, 50)):
+        # Objects containing the point
+        dist = np.hypot(x - px, y - py)
+        if object_type == 'circle': inside = dist <= s
+        elif object_type == 'box': inside = (np.abs(x - px) <= s/2) & (np.abs(y - py) <= s/2)
+        else: inside = np.zeros(len(rois), dtype = bool)
+        assert set(index.at(px, py)) == set(np.flatnonzero(inside))
+
+        # Objects closer than d, closest first
+        within = index.within(px, py, d)
+        assert set(within) == set(np.flatnonzero(dist <= d))
+        assert np.all(np.diff(dist[within]) >= 0)
+
+        # Objects overlapping a box
+        x0, x1, y0, y1 = px - d, px + 2*d, py - d/2, py + d
+        overlap = (x + half_size >= x0) & (x - half_size <= x1) & (y + half_size >= y0) & (y - half_size <= y1)
+        assert set(index.in_box(x0, x1, y0, y1)) == set(np.flatnonzero(overlap))
+
+def test_roi_index_empty():
+
+    # Queries on an index without objects find nothing
+    index = RoiIndex(np.zeros((0, 3)))
+    assert len(index) == 0
+    assert len(index.at(10, 10)) == 0 and len(index.within(10, 10, 5)) == 0 and len(index.in_box(0, 10, 0, 10)) == 0
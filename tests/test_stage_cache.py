@@ -0,0 +1,84 @@
+###############################################################################
+#   DisGUVery: detect and analyse Giant Unilamellar Vesicles in microscopy images
+#
+#       Copyright (C) 2022, the DisGUVery developers
+#
+# This file is part of DisGUVery.
+#
+# DisGUVery is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# DisGUVery is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <https://www.gnu.org/licenses/>.
+###############################################################################
+
+import threading
+
+import numpy as np
+
+from core.stage_cache import StageCache
+from core.pipeline import array_hash
+
+def test_stage_cache_keys(tmp_path):
+
+    # Entries are found for the same image, stage and parameters only
+    cache = StageCache(str(tmp_path), enabled = True)
+    image = np.arange(100, dtype = np.float32).reshape(10, 10)
+    calls = []
+    compute = lambda: calls.append(1) or image*2
+
+    output = cache.cached(array_hash(image), 'enhance', [15, 45, 'gaussian'], compute)
+    cached = cache.cached(array_hash(image.copy()), 'enhance', [15, 45, 'gaussian'], compute)
+    assert np.array_equal(output, cached) and len(calls) == 1
+    cache.cached(array_hash(image), 'enhance', [15, 45, 'box'], compute)
+    cache.cached(array_hash(image), 'detection', [15, 45, 'gaussian'], compute)
+    cache.cached(array_hash(image + 1), 'enhance', [15, 45, 'gaussian'], compute)
+    assert len(calls) == 4
+
+    # Inputs without hash are not cached
+    cache.cached(None, 'enhance', [15, 45, 'gaussian'], compute)
+    cache.cached(None, 'enhance', [15, 45, 'gaussian'], compute)
+    assert len(calls) == 6
+
+    # The entries are found again by a new cache on the same folder
+    assert StageCache(str(tmp_path), enabled = True).get(array_hash(image), 'enhance', [15, 45, 'gaussian'])[0]
+
+def test_stage_cache_disabled(tmp_path):
+
+    # The cache is opt-in: a disabled cache computes every time and writes nothing
+    cache = StageCache(str(tmp_path / 'cache'))
+    calls = []
+    for _ in range(2):
+        cache.cached('hash', 'stage', [], lambda: calls.append(1))
+    assert len(calls) == 2
+    assert not (tmp_path / 'cache').exists()
+
+def test_stage_cache_limits(tmp_path):
+
+    # Large outputs are not cached, and the least recently used entries are evicted
+    cache = StageCache(str(tmp_path), max_size = 3000, max_entry_size = 1500, enabled = True)
+    cache.put('large', 'stage', [], np.zeros(1000))
+    assert cache.get('large', 'stage', [])[0] is False
+    for n in range(4):
+        cache.put(str(n), 'stage', [], np.zeros(100))
+    assert cache.total_size <= 3000
+    assert cache.get('0', 'stage', [])[0] is False and cache.get('3', 'stage', [])[0] is True
+
+def test_stage_cache_threads(tmp_path):
+
+    # Entries can be added and read from several threads at the same time
+    cache = StageCache(str(tmp_path), max_size = 20000, enabled = True)
+    def worker(n):
+        for i in range(20):
+            cache.cached(str(i % 5), 'stage', [n % 2], lambda: np.full(50, i))
+
+    threads = [threading.Thread(target = worker, args = (n,)) for n in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert cache.total_size == sum(cache.entries.values()) <= 20000